@@ -0,0 +1,531 @@
+from maze import distance_table, heading_deltas
+from simulator import sensor_headings, time_budget
+import numpy as np
+import argparse
+import time
+import csv
+
+# The batched simulator runs many independent two-run trials in lockstep:
+# every array below has one entry per episode along its first axis, and
+# one time step of all the episodes is a handful of NumPy operations.
+#
+# The batch policy stores what the robots know as bitboards: one unsigned
+# word per maze column x and episode, with bit y standing for cell (x, y).
+# A board of shape (count, dim) is a set of cells of every episode, and
+# the walls are stored as one board per integer heading, with the bit of a
+# cell set when the cell is open in that heading. A breadth-first search
+# then moves a whole wavefront of cells, in all episodes at once, with a
+# few shifts of the boards.
+sensor_table = np.array(sensor_headings)
+delta_x = np.array([dx for dx, dy in heading_deltas])
+delta_y = np.array([dy for dx, dy in heading_deltas])
+# rotation towards the left, front, right and back candidate headings of
+# the batch policy; the robot moves backwards instead of turning around
+choice_rotations = np.array([-90, 0, 90, 0])
+
+
+def board_dtype(dim):
+    '''
+    Returns the smallest unsigned integer type with a bit per cell of a
+    maze column.
+    '''
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if dim <= np.iinfo(dtype).bits:
+            return dtype
+    raise Exception('Batched simulation supports mazes up to 64 cells wide!')
+
+
+def test_cells(boards, x, y):
+    '''
+    Returns 1 where cell (x[i], y[i]) is in boards[i], else 0. Cells outside
+    of the maze are never in a board.
+    '''
+    dim = boards.shape[1]
+    inside = (x >= 0) & (x < dim) & (y >= 0) & (y < dim)
+    rows = np.arange(len(boards))
+    words = boards[rows, np.clip(x, 0, dim - 1)]
+    bits = (words >> np.clip(y, 0, dim - 1).astype(boards.dtype)) & 1
+    return np.where(inside, bits, 0)
+
+
+def expand(front, open_boards):
+    '''
+    Returns the cells one move away from the cells of front, moving only in
+    the headings the cells are open to in open_boards, the (4, count, dim)
+    boards of open walls.
+    '''
+    out = ((front & open_boards[0]) << 1) | ((front & open_boards[2]) >> 1)
+    out[:, 1:] |= front[:, :-1] & open_boards[1][:, :-1]
+    out[:, :-1] |= front[:, 1:] & open_boards[3][:, 1:]
+    return out
+
+
+def ray_cells(x, y, heading, first, last, dim, dtype):
+    '''
+    Returns the boards of the cells first to last moves away from cell
+    (x[i], y[i]) in heading[i], as far as they are inside the maze. The
+    cells of a ray are a run of bits in one column, or the same bit in a
+    run of columns. A ray with last < first is empty.
+    '''
+    x0, x1 = x + delta_x[heading] * first, x + delta_x[heading] * last
+    y0, y1 = y + delta_y[heading] * first, y + delta_y[heading] * last
+    low_x = np.maximum(np.minimum(x0, x1), 0)
+    high_x = np.minimum(np.maximum(x0, x1), dim - 1)
+    low_y = np.maximum(np.minimum(y0, y1), 0)
+    high_y = np.minimum(np.maximum(y0, y1), dim - 1)
+
+    one = dtype(1)
+    length = np.maximum(high_y - low_y + 1, 0)
+    length = np.where(last >= first, length, 0).astype(dtype)
+    bits = ((one << length) - one) << np.minimum(low_y, dim - 1).astype(dtype)
+    columns = np.arange(dim)
+    in_ray = (columns >= low_x[:, None]) & (columns <= high_x[:, None])
+    return np.where(in_ray, bits[:, None], dtype(0))
+
+
+def descend_layers(targets, open_boards, x, y):
+    '''
+    Breadth-first search from the target cells of every episode, over the
+    open walls, that stops for each episode as soon as it reaches the
+    robot's cell (x, y). Returns:
+    - distance: number of moves from the robot to the nearest target, -1
+        if no target can be reached. (array of count)
+    - near: the cells 1, 2 and 3 moves closer to the targets than the
+        robot, i.e. the BFS layers distance-1 to distance-3. (array of 3 by
+        count by dim)
+
+    Episodes that are done are dropped from the search arrays, so the
+    search gets cheaper as it goes.
+    '''
+    count, dim = targets.shape
+    distance = np.full(count, -1)
+    near = np.zeros((3,) + targets.shape, dtype=targets.dtype)
+
+    rows = np.arange(count)
+    front = targets.copy()
+    reached = front.copy()
+    layers = [front]
+    layer = 0
+    while len(rows):
+        hit = test_cells(front, x, y) == 1
+        stuck = ~front.any(axis=1)
+        if hit.any():
+            distance[rows[hit]] = layer
+            for i in range(min(3, layer)):
+                near[i, rows[hit]] = layers[-2 - i][hit]
+        if hit.any() or stuck.any():
+            keep = ~(hit | stuck)
+            rows = rows[keep]
+            x, y = x[keep], y[keep]
+            front, reached = front[keep], reached[keep]
+            open_boards = open_boards[:, keep]
+            layers = [board[keep] for board in layers]
+            if not len(rows):
+                break
+
+        front = expand(front, open_boards) & ~reached
+        reached |= front
+        layers = layers[-3:] + [front]
+        layer += 1
+    return distance, near
+
+
+def route_cells(open_boards, start, goal):
+    '''
+    Returns the cells of every episode that lie on a shortest route from
+    the start cells to the goal cells over the open walls: those at some
+    distance k from the start and a distance to the goal that adds up to
+    the length of the route. Found by a breadth-first search from the start
+    that keeps its layers, followed by a backward pass from the goal.
+    '''
+    count, dim = open_boards.shape[1:]
+    length = np.full(count, -1)
+
+    front = np.broadcast_to(start, (count, dim)).copy()
+    reached = front.copy()
+    layers = [front]
+    while True:
+        arrived = (length < 0) & (front & goal).any(axis=1)
+        length[arrived] = len(layers) - 1
+        if (length >= 0).all():
+            break
+        front = expand(front, open_boards) & ~reached
+        if not front[length < 0].any():
+            break
+        reached |= front
+        layers.append(front)
+
+    # cells of the route at distance k from the start: cells of layer k
+    # next to a cell of the route at distance k+1, or in the goal
+    route = np.zeros_like(front)
+    layer = np.zeros_like(front)
+    for k in reversed(range(len(layers))):
+        layer = expand(layer, open_boards)
+        layer |= np.where((length == k)[:, None], goal, 0).astype(layer.dtype)
+        layer &= layers[k]
+        route |= layer
+    return route
+
+
+class FloodBatchPolicy(object):
+    def __init__(self, count, maze_dim, finish_step=900):
+        '''
+        The 'flood' exploration of robot.py for count robots at once. Like
+        Robot, it only learns about the maze through the sensors and keeps
+        track of its own location and heading.
+
+        In the 1st run, a robot follows the distances to the goal room
+        assuming unknown walls are open. Once the goal is found, it visits
+        the unvisited cells that could still lie on a shortest route from
+        the start, and resets when none is left, or when all cells are
+        visited, or at step finish_step. Ties go to unvisited cells, then to
+        moving straight ahead, then to the left.
+
+        In the 2nd run, it follows the shortest route to the goal room over
+        the walls it knows are open, moving backwards instead of turning
+        around.
+        '''
+        self.count = count
+        self.maze_dim = maze_dim
+        self.finish_step = finish_step
+        dtype = board_dtype(maze_dim)
+        self.dtype = dtype
+
+        self.x = np.zeros(count, dtype=np.intp)
+        self.y = np.zeros(count, dtype=np.intp)
+        self.heading = np.zeros(count, dtype=np.intp)
+        self.find_goal = np.zeros(count, dtype=bool)
+        self.run_2 = np.zeros(count, dtype=bool)
+        self.step = np.ones(count, dtype=np.intp)
+
+        # cell boards: visited cells of every robot; goal room and start
+        self.visited = np.zeros((count, maze_dim), dtype=dtype)
+        self.visited[:, 0] = 1
+        self.visits = np.ones(count, dtype=np.intp)
+        self.goal = np.zeros(maze_dim, dtype=dtype)
+        self.goal[maze_dim // 2 - 1:maze_dim // 2 + 1] = 3 << (maze_dim // 2 - 1)  # NOQA
+        self.start = np.zeros(maze_dim, dtype=dtype)
+        self.start[0] = 1
+
+        # wall boards: walls that may be open (everything but the maze edges
+        # and the walls seen closed) and walls seen open, per heading
+        column = (1 << maze_dim) - 1
+        edges = np.zeros((4, maze_dim), dtype=dtype)
+        edges[0] = column >> 1
+        edges[1, :-1] = column
+        edges[2] = column >> 1 << 1
+        edges[3, 1:] = column
+        self.maybe_open = np.repeat(edges[:, None], count, axis=1)
+        self.seen_open = np.zeros((4, count, maze_dim), dtype=dtype)
+
+        # cells on a shortest route from the start to the goal, which only
+        # change when a wall is seen closed
+        self.route = np.zeros((count, maze_dim), dtype=dtype)
+        self.route_stale = np.ones(count, dtype=bool)
+
+    def record_sensors(self, index, sensors):
+        '''
+        Each sensor reading tells that the walls along its ray are open and
+        that the wall at its far end is closed, both seen from either side.
+        '''
+        args = (self.maze_dim, self.dtype)
+        x, y = self.x[index], self.y[index]
+        before = self.maybe_open[:, index]
+        for i in range(3):
+            heading = sensor_table[self.heading[index], i]
+            reverse = (heading + 2) % 4
+            distance = sensors[:, i]
+            self.seen_open[heading, index] |= ray_cells(x, y, heading, 0, distance - 1, *args)  # NOQA
+            self.seen_open[reverse, index] |= ray_cells(x, y, heading, 1, distance, *args)  # NOQA
+            self.maybe_open[heading, index] &= ~ray_cells(x, y, heading, distance, distance, *args)  # NOQA
+            self.maybe_open[reverse, index] &= ~ray_cells(x, y, heading, distance + 1, distance + 1, *args)  # NOQA
+        changed = (self.maybe_open[:, index] != before).any(axis=(0, 2))
+        self.route_stale[index[changed]] = True
+
+    def next_moves(self, index, sensors):
+        '''
+        Returns the rotations and movements of the robots index, given their
+        sensor readings as an array of len(index) by 3, and a boolean array
+        telling which of them reset instead (see Robot.next_move()).
+        '''
+        dim = self.maze_dim
+        count = len(index)
+        rows = np.arange(count)
+        x, y, heading = self.x[index], self.y[index], self.heading[index]
+        run_2 = self.run_2[index]
+        exploring = ~run_2
+
+        # 1st run: note the goal, end the run by the same rules as Robot
+        goal_bounds = (dim // 2 - 1, dim // 2)
+        in_goal = np.isin(x, goal_bounds) & np.isin(y, goal_bounds)
+        self.find_goal[index[exploring & in_goal]] = True
+        find_goal = self.find_goal[index]
+        reset = exploring & ((self.visits[index] >= dim * dim) |
+                             ((self.step[index] == self.finish_step) &
+                              find_goal))
+        exploring &= ~reset
+
+        # visit the cell and record the walls in sight
+        learn = index[exploring]
+        cell = np.left_shift(self.dtype(1), y[exploring].astype(self.dtype))
+        new = (self.visited[learn, x[exploring]] & cell) == 0
+        self.visited[learn, x[exploring]] |= cell
+        self.visits[learn] += new
+        self.record_sensors(learn, sensors[exploring])
+
+        # once the goal is found, head for the nearest unvisited cell on a
+        # shortest route, and end the run when none is left
+        targets = np.broadcast_to(self.goal, (count, dim)).copy()
+        searching = np.flatnonzero(exploring & find_goal)
+        if len(searching):
+            stale = index[searching][self.route_stale[index[searching]]]
+            if len(stale):
+                self.route[stale] = route_cells(self.maybe_open[:, stale],
+                                                self.start, self.goal)
+                self.route_stale[stale] = False
+            frontier = self.route[index[searching]] & ~self.visited[index[searching]]  # NOQA
+            done = ~frontier.any(axis=1)
+            reset[searching[done]] = True
+            exploring[searching[done]] = False
+            targets[searching] = frontier
+
+        # distances to the targets over the walls that may be open in the
+        # 1st run, and over the walls known to be open in the 2nd
+        moving = np.flatnonzero(~reset)
+        open_boards = np.where(run_2[None, :, None],
+                               self.seen_open[:, index],
+                               self.maybe_open[:, index])
+        distance, near = descend_layers(targets[moving], open_boards[:, moving],  # NOQA
+                                        x[moving], y[moving])
+
+        # candidate headings: left, front and right where the sensors see
+        # no wall in the 1st run, and backwards too in the 2nd run. A move
+        # must get one cell closer to the targets.
+        mx, my, mh = x[moving], y[moving], heading[moving]
+        m_run_2 = run_2[moving]
+        m_seen = self.seen_open[:, index[moving]]
+        m_visited = self.visited[index[moving]]
+        m_rows = np.arange(len(moving))
+        candidates = np.stack([(mh + 3) % 4, mh, (mh + 1) % 4, (mh + 2) % 4],
+                              axis=1)
+        scores = np.full(candidates.shape, -1)
+        for i in range(4):
+            h = candidates[:, i]
+            nx, ny = mx + delta_x[h], my + delta_y[h]
+            allowed = test_cells(m_seen[h, m_rows], mx, my) == 1
+            allowed &= test_cells(near[0], nx, ny) == 1
+            if i == 3:
+                allowed &= m_run_2
+            unvisited = (test_cells(m_visited, nx, ny) == 0) & ~m_run_2
+            scores[:, i] = np.where(allowed, 2 * unvisited + (i == 1), -1)
+
+        choice = scores.argmax(axis=1)
+        chosen = scores[m_rows, choice] >= 0
+        h = candidates[m_rows, choice]
+
+        # keep going in the same heading, up to 3 cells, while the cells get
+        # closer; in the 1st run only over visited cells, so the sensors see
+        # every cell the robot explores
+        steps = chosen.astype(np.intp)
+        for s in (1, 2):
+            cx, cy = mx + delta_x[h] * s, my + delta_y[h] * s
+            further = chosen & (steps == s)
+            further &= test_cells(m_seen[h, m_rows], cx, cy) == 1
+            further &= m_run_2 | (test_cells(m_visited, cx, cy) == 1)
+            further &= test_cells(near[s], cx + delta_x[h], cy + delta_y[h]) == 1  # NOQA
+            steps += further
+
+        # without a way closer in sight, turn clockwise
+        rotation = np.zeros(count, dtype=np.intp)
+        movement = np.zeros(count, dtype=np.intp)
+        rotation[moving] = np.where(chosen, choice_rotations[choice], 90)
+        movement[moving] = np.where(choice == 3, -steps, steps)
+        new_heading = np.where(chosen, np.where(choice == 3, mh, h),
+                               (mh + 1) % 4)
+
+        robots = index[moving]
+        self.x[robots] = mx + delta_x[h] * steps
+        self.y[robots] = my + delta_y[h] * steps
+        self.heading[robots] = new_heading
+        self.step[robots[~m_run_2]] += 1
+
+        # the robots that reset start the 2nd run at the start cell
+        robots = index[reset]
+        self.run_2[robots] = True
+        self.x[robots] = 0
+        self.y[robots] = 0
+        self.heading[robots] = 0
+        return rotation, movement, reset
+
+
+class BatchResult(object):
+    '''
+    Outcome of a batch of two-run trials, one entry per episode; see
+    simulator.SimulationResult.
+    - runtimes: number of time steps of the 1st and the 2nd run, -1 for a
+        run that was not completed. (array of count by 2)
+    - score: score of every episode, NaN if both runs were not completed.
+    - steps, wall_hits, invalid_actions: (arrays of count)
+    '''
+    def __init__(self, count):
+        self.runtimes = np.full((count, 2), -1)
+        self.score = np.full(count, np.nan)
+        self.steps = np.zeros(count, dtype=np.intp)
+        self.wall_hits = np.zeros(count, dtype=np.intp)
+        self.invalid_actions = np.zeros(count, dtype=np.intp)
+
+    @property
+    def completed(self):
+        return self.runtimes[:, 1] >= 0
+
+    def __len__(self):
+        return len(self.score)
+
+
+class BatchSimulator(object):
+    def __init__(self, max_time=1000, train_score_mult=1/30.):
+        '''
+        Runs the same two-run trial as simulator.Simulator for a whole
+        batch of mazes at once, stepping all the episodes in lockstep. The
+        sensors of all robots are read with one gather from the mazes'
+        distance tables, and rotations, movements, wall collisions, resets
+        and the goal are handled with the same rules as tester.py.
+
+        Since every action takes one time step, all episodes share the same
+        clock; episodes that are done simply drop out of the batch.
+        '''
+        self.max_time = max_time
+        self.train_score_mult = train_score_mult
+
+    def run(self, walls, policy=None):
+        '''
+        Runs a robot through both runs of every maze of walls, an array of
+        shape (count, dim, dim), and returns a BatchResult. policy drives
+        the robots through its next_moves() method and defaults to a
+        FloodBatchPolicy that ends its 1st run after 90% of max_time.
+        '''
+        walls = np.asarray(walls, dtype=np.uint8)
+        count, dim = walls.shape[:2]
+        if policy is None:
+            policy = FloodBatchPolicy(count, dim, self.max_time * 9 // 10)
+        distances = distance_table(walls)
+        goal_bounds = (dim // 2 - 1, dim // 2)
+
+        result = BatchResult(count)
+        runtimes = result.runtimes
+        x = np.zeros(count, dtype=np.intp)
+        y = np.zeros(count, dtype=np.intp)
+        heading = np.zeros(count, dtype=np.intp)
+        run = np.zeros(count, dtype=np.intp)
+        hit_goal = np.zeros(count, dtype=bool)
+        done = np.zeros(count, dtype=bool)
+
+        for total_time in range(1, self.max_time + 1):
+            index = np.flatnonzero(~done)
+            if not len(index):
+                break
+            ix, iy, ih = x[index], y[index], heading[index]
+
+            # provide the robots with sensor information, get actions
+            cell = distances[index, ix, iy].astype(np.intp)
+            rows = np.arange(len(index))
+            sensors = cell[rows[:, None], sensor_table[ih]]
+            rotation, movement, reset = policy.next_moves(index, sensors)
+
+            # check for resets
+            valid = reset & (run[index] == 0) & hit_goal[index]
+            result.invalid_actions[index[reset & ~valid]] += 1
+            resets = index[valid]
+            runtimes[resets, 0] = total_time
+            run[resets] = 1
+            hit_goal[resets] = False
+            x[resets] = 0
+            y[resets] = 0
+            heading[resets] = 0
+
+            # perform rotations
+            act = ~reset
+            index, rows = index[act], rows[act]
+            rotation, movement = rotation[act], movement[act]
+            ih = np.where(rotation == -90, (ih[act] + 3) % 4,
+                          np.where(rotation == 90, (ih[act] + 1) % 4, ih[act]))  # NOQA
+            result.invalid_actions[index] += ~np.isin(rotation, (-90, 0, 90))
+            heading[index] = ih
+
+            # perform movements, stopped by walls
+            result.invalid_actions[index] += np.abs(movement) > 3
+            movement = np.clip(movement, -3, 3)
+            move_heading = np.where(movement > 0, ih, (ih + 2) % 4)
+            room = cell[rows, move_heading]
+            moves = np.minimum(np.abs(movement), room)
+            result.wall_hits[index] += np.abs(movement) > room
+            x[index] += delta_x[move_heading] * moves
+            y[index] += delta_y[move_heading] * moves
+
+            # check for goal entered
+            entered = np.isin(x[index], goal_bounds) & np.isin(y[index], goal_bounds)  # NOQA
+            hit_goal[index[entered]] = True
+            finished = index[entered & (run[index] == 1)]
+            runtimes[finished, 1] = total_time - runtimes[finished, 0]
+            done[finished] = True
+
+        completed = result.completed
+        result.steps[:] = np.where(completed, runtimes.sum(axis=1),
+                                   self.max_time)
+        result.score[completed] = (runtimes[completed, 1] +
+                                   self.train_score_mult *
+                                   runtimes[completed, 0])
+        return result
+
+
+if __name__ == '__main__':
+    '''
+    This script runs the batched flood-fill robot on every maze of a maze
+    archive, e.g.
+
+        python batchsim.py mazes_16.mazes --batch-size 10000
+    '''
+    from mazefile import load_mazes
+
+    parser = argparse.ArgumentParser(
+        description='Batched simulation of the flood-fill robot.')
+    parser.add_argument('mazes', help='maze archive')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='number of episodes simulated in lockstep')
+    parser.add_argument('--max-time', type=int, default=None,
+                        help='time steps allowed for both runs (default: '
+                        'scaled with the maze size, see time_budget)')
+    parser.add_argument('--output', default=None,
+                        help='csv file to write per-maze results to')
+    args = parser.parse_args()
+
+    archive = load_mazes(args.mazes)
+    if args.max_time is None:
+        args.max_time = time_budget(archive.dim)
+    simulator = BatchSimulator(args.max_time)
+    writer = None
+    if args.output is not None:
+        f_out = open(args.output, 'w', newline='')
+        writer = csv.writer(f_out)
+        writer.writerow(['maze', 'run_1', 'run_2', 'score', 'steps',
+                         'wall_hits'])
+
+    start = time.time()
+    scores = []
+    for first in range(0, len(archive), args.batch_size):
+        result = simulator.run(archive[first:first + args.batch_size])
+        scores.append(result.score)
+        if writer is not None:
+            for i in range(len(result)):
+                writer.writerow([first + i, result.runtimes[i, 0],
+                                 result.runtimes[i, 1], result.score[i],
+                                 result.steps[i], result.wall_hits[i]])
+    if writer is not None:
+        f_out.close()
+
+    scores = np.concatenate(scores)
+    elapsed = time.time() - start
+    print("{} episodes in {:.1f}s ({:.0f} per second), {} failed.".format(
+        len(scores), elapsed, len(scores) / elapsed,
+        np.isnan(scores).sum()))
+    print("Mean score: {:.3f}".format(np.nanmean(scores)))
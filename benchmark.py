@@ -0,0 +1,386 @@
+from maze import Maze, heading_names, heading_deltas, valid_mazes
+from robot import Robot
+from simulator import Simulator, time_budget
+from batchsim import BatchSimulator
+from generator import generate_mazes
+from knowledge import save_knowledge, load_knowledge
+from tester import max_time
+import numpy as np
+import argparse
+import platform
+import tempfile
+import math
+import json
+import time
+import sys
+import os
+
+# Maze sizes benchmarked by default: the competition sizes and larger ones.
+default_sizes = [12, 14, 16, 32, 64]
+
+# A slowdown is reported when the median gets worse by more than
+# slowdown_threshold and a one-sided Mann-Whitney U test on the samples of
+# the two runs gives a p-value below significance.
+slowdown_threshold = 0.05
+significance = 0.01
+
+
+def benchmark_corpus(dim, count):
+    '''
+    Returns the mazes every benchmark of size dim runs on: count generated
+    mazes with some loops, the same on every machine and every commit.
+    '''
+    return generate_mazes(count, dim, 'backtracker', loops=0.1, seed=dim)
+
+
+def write_text_maze(filename, walls):
+    '''
+    Writes walls in the maze text format read by Maze.
+    '''
+    with open(filename, 'w') as f_out:
+        f_out.write('{}\n'.format(len(walls)))
+        for column in walls.tolist():
+            f_out.write(','.join(str(value) for value in column) + '\n')
+
+
+def full_knowledge_robot(walls):
+    '''
+    Returns a robot that knows every wall of the maze, as if it had visited
+    every cell in the 1st run.
+    '''
+    robot = Robot(len(walls), seed=0)
+    robot.valueGrid[:] = walls
+    robot.visitedGrid[:] = 1
+    return robot
+
+
+# Each benchmark takes the corpus of a size and returns the amount of work
+# it did, the seconds it took and the list of the corpus mazes whose robot
+# run raised an error; its rate is work per second. Failed runs are timed
+# but not counted as work, and the list lets --compare catch new failures.
+
+def bench_maze_load(corpus):
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = []
+        for i, walls in enumerate(corpus):
+            filenames.append(os.path.join(directory, '{}.txt'.format(i)))
+            write_text_maze(filenames[-1], walls)
+        start = time.perf_counter()
+        for filename in filenames:
+            Maze(filename)
+        return len(filenames), time.perf_counter() - start, []
+
+
+def bench_dist_to_wall(corpus):
+    testmaze = Maze(walls=corpus[0])
+    rng = np.random.default_rng(0)
+    cells = rng.integers(testmaze.dim, size=(20000, 2)).tolist()
+    directions = [heading_names[h] for h in rng.integers(4, size=20000)]
+    queries = list(zip(cells, directions))
+    start = time.perf_counter()
+    for cell, direction in queries:
+        testmaze.dist_to_wall(cell, direction)
+    return len(queries), time.perf_counter() - start, []
+
+
+def bench_heu_grid(corpus):
+    robots = [full_knowledge_robot(walls) for walls in corpus]
+    start = time.perf_counter()
+    for robot in robots:
+        robot.calculateHeuGrid()
+    return len(robots), time.perf_counter() - start, []
+
+
+def bench_policy_grid(corpus):
+    robots = [full_knowledge_robot(walls) for walls in corpus]
+    for robot in robots:
+        robot.calculateHeuGrid()
+    start = time.perf_counter()
+    for robot in robots:
+        robot.calculatePolicyGrid()
+    return len(robots), time.perf_counter() - start, []
+
+
+def bench_tester_steps(corpus):
+    mazes = [Maze(walls=walls) for walls in corpus]
+    # time steps scale with the maze size, as in tester.py
+    simulator = Simulator(time_budget(len(corpus[0]), max_time))
+    steps = 0
+    failures = []
+    start = time.perf_counter()
+    for seed, testmaze in enumerate(mazes):
+        # with fixed seeds the same runs fail on every commit that does not
+        # change the robot, such as the random exploration ending in a cell
+        # without policy
+        try:
+            steps += simulator.run(testmaze, Robot(
+                testmaze.dim, seed=seed, max_time=simulator.max_time)).steps
+        except Exception:
+            failures.append(seed)
+    return steps, time.perf_counter() - start, failures
+
+
+def bench_flood_episodes(corpus):
+    mazes = [Maze(walls=walls) for walls in corpus]
+    simulator = Simulator(time_budget(len(corpus[0]), max_time))
+    start = time.perf_counter()
+    episodes = 0
+    failures = []
+    for seed, testmaze in enumerate(mazes):
+        try:
+            simulator.run(testmaze, Robot(testmaze.dim, explore='flood',
+                                          seed=seed,
+                                          max_time=simulator.max_time))
+            episodes += 1
+        except Exception:
+            failures.append(seed)
+    return episodes, time.perf_counter() - start, failures
+
+
+def route_mutations(walls, plan, limit):
+    '''
+    Returns up to limit copies of walls that each have one side of a cell
+    on the route of plan, a list of (rotation, movement) steps from the
+    start, opened or closed, and are still valid mazes.
+    '''
+    dim = len(walls)
+    cells = []
+    x, y, heading = 0, 0, 0
+    for rotation, movement in plan:
+        heading = (heading + rotation // 90) % 4
+        dx, dy = heading_deltas[heading if movement > 0 else (heading + 2) % 4]  # NOQA
+        for _ in range(abs(movement)):
+            cells.append((x, y))
+            x, y = x + dx, y + dy
+
+    mutations = []
+    for x, y in sorted(set(cells)):
+        for heading, (dx, dy) in enumerate(heading_deltas):
+            if 0 <= x + dx < dim and 0 <= y + dy < dim:
+                mutated = walls.copy()
+                mutated[x, y] ^= 1 << heading
+                mutated[x + dx, y + dy] ^= 1 << ((heading + 2) % 4)
+                mutations.append(mutated)
+    mutations = [mutated for mutated, valid in
+                 zip(mutations, valid_mazes(np.array(mutations))) if valid]
+    step = -(-len(mutations) // limit)
+    return mutations[::step]
+
+
+def bench_warm_episodes(corpus):
+    # Robots warm-started from a snapshot of each maze, in copies of the
+    # maze with one side of a cell on the planned route changed, so that
+    # the knowledge turns out wrong somewhere along the route. A maze fails
+    # if any of its warm starts raised an error.
+    # the runs of larger mazes take longer, so they get fewer mutations
+    dim = len(corpus[0])
+    limit = max(4, int(64 * min(1., (16. / dim) ** 2)))
+    simulator = Simulator(time_budget(dim, max_time))
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        for index, walls in enumerate(corpus):
+            robot = Robot(len(walls), explore='flood', planner='steps',
+                          seed=0, max_time=simulator.max_time)
+            simulator.run(Maze(walls=walls), robot)
+            filename = os.path.join(directory, '{}.kb'.format(index))
+            save_knowledge(filename, robot)
+            knowledge = load_knowledge(filename, mmap=False)
+            for mutated in route_mutations(walls, robot.knowledgePlan, limit):
+                runs.append((index, Maze(walls=mutated), knowledge))
+
+    episodes = 0
+    failures = set()
+    start = time.perf_counter()
+    for index, testmaze, knowledge in runs:
+        try:
+            simulator.run(testmaze, Robot(testmaze.dim, explore='flood',
+                                          planner='steps', seed=0,
+                                          max_time=simulator.max_time,
+                                          knowledge=knowledge))
+            episodes += 1
+        except Exception:
+            failures.add(index)
+    return episodes, time.perf_counter() - start, sorted(failures)
+
+
+def bench_batch_episodes(corpus):
+    start = time.perf_counter()
+    BatchSimulator().run(corpus)
+    return len(corpus), time.perf_counter() - start, []
+
+
+# name, benchmark, unit of its rate and number of corpus mazes it runs on
+# at size 16. Larger mazes take longer, so they get proportionally fewer,
+# except for the tester loop, whose rate is per time step.
+benchmarks = [
+    ('maze_load', bench_maze_load, 'mazes/s', 20),
+    ('dist_to_wall', bench_dist_to_wall, 'calls/s', 1),
+    ('calculateHeuGrid', bench_heu_grid, 'grids/s', 20),
+    ('calculatePolicyGrid', bench_policy_grid, 'grids/s', 5),
+    ('tester_steps', bench_tester_steps, 'steps/s', 4),
+    ('flood_episodes', bench_flood_episodes, 'episodes/s', 4),
+    ('warm_episodes', bench_warm_episodes, 'episodes/s', 4),
+    ('batch_episodes', bench_batch_episodes, 'episodes/s', 256),
+]
+
+
+def run_benchmarks(sizes=default_sizes, repeat=7, name_filter=None):
+    '''
+    Runs every benchmark on every maze size repeat times and returns the
+    results as a dictionary:
+    - machine: description of the Python, NumPy and platform used.
+    - results: for every 'benchmark[size]', its unit, the rates (work
+        per second, higher is better) of all repeats and the corpus mazes
+        whose robot run failed in any repeat.
+    '''
+    results = {}
+    for dim in sizes:
+        scale = min(1., (16. / dim) ** 2)
+        corpus = benchmark_corpus(dim, max(count for _, _, _, count in benchmarks))  # NOQA
+        for name, function, unit, count in benchmarks:
+            key = '{}[{}]'.format(name, dim)
+            if name_filter is not None and name_filter not in key:
+                continue
+            if name != 'tester_steps':
+                count = max(1, int(round(count * scale)))
+            function(corpus[:count])  # warm up
+            samples = []
+            failures = set()
+            for _ in range(repeat):
+                work, seconds, failed = function(corpus[:count])
+                samples.append(work / seconds)
+                failures.update(failed)
+            results[key] = {'unit': unit, 'samples': samples,
+                            'failures': sorted(failures)}
+            print('{:<28} {:>14,.1f} {}{}'.format(
+                key, np.median(samples), unit,
+                '  ({} failed)'.format(len(failures)) if failures else ''))
+            sys.stdout.flush()
+
+    machine = {'python': platform.python_version(),
+               'numpy': np.__version__,
+               'platform': platform.platform(),
+               'processor': platform.processor()}
+    return {'machine': machine, 'results': results}
+
+
+def mann_whitney_p(slower, faster):
+    '''
+    One-sided Mann-Whitney U test, with the normal approximation and a
+    correction for ties. Returns the p-value of the hypothesis that the
+    samples slower are not lower than the samples faster; a small p-value
+    means that they are.
+    '''
+    slower = np.asarray(slower, dtype=float)
+    faster = np.asarray(faster, dtype=float)
+    n1, n2 = len(slower), len(faster)
+    values = np.concatenate([slower, faster])
+    n = n1 + n2
+
+    # ranks from 1, ties get the mean of their ranks
+    order = values.argsort()
+    ranks = np.empty(n)
+    ranks[order] = np.arange(1, n + 1)
+    _, inverse, counts = np.unique(values, return_inverse=True,
+                                   return_counts=True)
+    ranks = (np.bincount(inverse, ranks) / counts)[inverse]
+
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.
+    mean = n1 * n2 / 2.
+    ties = (counts ** 3 - counts).sum() / float(n * (n - 1))
+    deviation = math.sqrt(n1 * n2 / 12. * (n + 1 - ties))
+    if deviation == 0:
+        return 1.0
+    z = (u - mean) / deviation
+    return 0.5 * math.erfc(-z / math.sqrt(2))
+
+
+def compare(baseline, current, threshold=slowdown_threshold,
+            alpha=significance):
+    '''
+    Compares two results of run_benchmarks() and returns a list of
+    (benchmark, change, p-value, slowdown) for the benchmarks in both,
+    where change is the relative change of the median rate and slowdown
+    tells whether it is a statistically significant slowdown.
+    '''
+    rows = []
+    for key, result in sorted(current['results'].items()):
+        if key not in baseline['results']:
+            continue
+        before = baseline['results'][key]['samples']
+        after = result['samples']
+        if np.median(before) <= 0:
+            continue
+        change = float(np.median(after) / np.median(before) - 1)
+        p = mann_whitney_p(after, before)
+        rows.append((key, change, p, bool(change < -threshold and p < alpha)))  # NOQA
+    return rows
+
+
+def new_failures(baseline, current):
+    '''
+    Returns a list of (benchmark, mazes) for the benchmarks in both results
+    of run_benchmarks() whose robot runs failed in corpus mazes that did not
+    fail in the baseline. A baseline saved before failures were recorded
+    counts as having none.
+    '''
+    rows = []
+    for key, result in sorted(current['results'].items()):
+        if key not in baseline['results']:
+            continue
+        before = set(baseline['results'][key].get('failures', []))
+        failed = [maze for maze in result['failures'] if maze not in before]
+        if failed:
+            rows.append((key, failed))
+    return rows
+
+
+if __name__ == '__main__':
+    '''
+    This script benchmarks the maze, robot and simulator hot paths, e.g.
+
+        python benchmark.py --save baseline.json
+        python benchmark.py --compare baseline.json
+
+    With --compare, it exits with status 1 if any benchmark got
+    significantly slower than in the baseline, or if a robot run failed
+    that did not fail in the baseline.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmarks of the maze, robot and simulator.')
+    parser.add_argument('--sizes', default=','.join(map(str, default_sizes)),
+                        help='comma separated maze sizes')
+    parser.add_argument('--repeat', type=int, default=7,
+                        help='samples taken of every benchmark')
+    parser.add_argument('--filter', default=None,
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--save', default=None,
+                        help='JSON file to store the results in')
+    parser.add_argument('--compare', default=None,
+                        help='JSON baseline to check the results against')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    current = run_benchmarks(sizes, args.repeat, args.filter)
+    if args.save is not None:
+        with open(args.save, 'w') as f_out:
+            json.dump(current, f_out, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f_in:
+            baseline = json.load(f_in)
+        print("")
+        slowdowns = 0
+        for key, change, p, slowdown in compare(baseline, current):
+            print('{:<28} {:>+8.1%}  p={:.3f}{}'.format(
+                key, change, p, '  SLOWER' if slowdown else ''))
+            slowdowns += slowdown
+        failed = new_failures(baseline, current)
+        for key, mazes in failed:
+            print('{:<28} new failures in corpus mazes {}'.format(key, mazes))
+        if slowdowns:
+            print("{} benchmarks got significantly slower.".format(slowdowns))
+        if failed:
+            print("{} benchmarks have new failing runs.".format(len(failed)))
+        if slowdowns or failed:
+            sys.exit(1)
@@ -0,0 +1,317 @@
+from planning import open_grid
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import heapq
+
+# integer heading of every single-bit opening, the reverse of every heading
+# and the number of bits set in every 4-bit number
+bit_heading = {1: 0, 2: 1, 4: 2, 8: 3}
+reverse = [2, 3, 0, 1]
+bit_count = np.array([bin(value).count('1') for value in range(16)])
+
+# heading out of a corridor cell with the 4-bit links value, entered moving
+# in heading: exit_heading[value][heading], -1 unless it is the only other
+# link
+exit_heading = [[bit_heading.get(value & ~(1 << reverse[heading]), -1)
+                 for heading in range(4)] for value in range(16)]
+
+
+def link_grid(value_grid):
+    '''
+    Returns the links of every cell as a uint8 array indexed [x, y]: a bit
+    of a cell's 4-bit number is set where the cell and its neighbour in
+    that direction are both known and open towards each other.
+    '''
+    grid = open_grid(value_grid)
+    known = grid > 0
+    links = grid.copy()
+    # the neighbour up, right, down and left of every cell is known and
+    # open back towards it
+    back = np.zeros((4,) + grid.shape, dtype=bool)
+    back[0, :, :-1] = known[:, 1:] & (grid[:, 1:] & 4 > 0)
+    back[1, :-1, :] = known[1:, :] & (grid[1:, :] & 8 > 0)
+    back[2, :, 1:] = known[:, :-1] & (grid[:, :-1] & 1 > 0)
+    back[3, 1:, :] = known[:-1, :] & (grid[:-1, :] & 2 > 0)
+    for heading in range(4):
+        links[~back[heading]] &= ~np.uint8(1 << heading)
+    return links
+
+
+class CorridorGraph(object):
+    def __init__(self, value_grid):
+        '''
+        Graph of the cells known in value_grid with every corridor collapsed
+        into one edge. A cell with exactly two links is a corridor cell, and
+        all other linked cells (junctions, dead ends and the cells of open
+        areas) are nodes. A loop made only of corridor cells has no node to
+        start from, so its first cell becomes a node as well. Walking a
+        chain of corridor cells from one node to the next gives an edge with
+        its length in single-cell moves, its number of turns and its first
+        heading out of either end.
+
+        The graph does not depend on the goal, so it is built once for a
+        grid and plan() can then be called for any number of goals. Each
+        plan runs a Dijkstra search over the nodes only and spreads the
+        result over the corridor cells with array operations. Building the
+        graph still walks every corridor cell in Python, so one build and
+        one plan take longer than planning.flood_fill() and a policy over
+        all cells; what the graph buys is the choice of the route with the
+        fewest turns and cheap plans for further goals.
+
+        - nodes: flat index x * dim + y of every node.
+        - incoming: incoming edges of every node, as (from node, cost,
+            first heading out of the from node). The cost of a route of a
+            length with some turns is length * cost_scale + turns, so that
+            costs compare by length first and turns second.
+        - chains: (a, b, length, turns, heading out of a, heading out of b)
+            of every chain between the nodes a and b.
+        - chain_cells: one row per corridor cell: its flat index, chain,
+            position from a, heading towards b, heading towards a, and turns
+            on the way to a and to b. The rows of a chain are contiguous.
+        '''
+        self.dim = len(value_grid)
+        dim = self.dim
+        links = link_grid(value_grid).ravel()
+        degree = bit_count[links]
+        node_cells = np.flatnonzero((links > 0) & (degree != 2))
+        self.nodes = node_cells.tolist()
+
+        node_index = np.full(dim * dim, -1, dtype=np.intp)
+        node_index[node_cells] = np.arange(len(node_cells))
+        node_index = node_index.tolist()
+        links = links.tolist()
+        offsets = (1, dim, -1, -dim)
+        walked = bytearray(dim * dim)
+
+        # a route never turns more often than it has cells
+        self.cost_scale = dim * dim
+        scale = self.cost_scale
+        self.incoming = [[] for _ in self.nodes]
+        self.chains = []
+        # corridor cells in the order they are walked, chain by chain, and
+        # the heading out of each of them towards the end of its chain
+        walk_cells = []
+        walk_headings = []
+        corridor_cells = np.flatnonzero(degree == 2).tolist()
+        next_corridor = 0
+
+        a = 0
+        while True:
+            if a == len(self.nodes):
+                # all chains from the nodes are walked; corridor cells left
+                # over lie on loops without nodes, so make one of them a node
+                while (next_corridor < len(corridor_cells) and
+                       walked[corridor_cells[next_corridor]]):
+                    next_corridor += 1
+                if next_corridor == len(corridor_cells):
+                    break
+                cell = corridor_cells[next_corridor]
+                walked[cell] = 1
+                node_index[cell] = a
+                self.nodes.append(cell)
+                self.incoming.append([])
+            cell_a = self.nodes[a]
+            value_a = links[cell_a]
+            for heading in range(4):
+                if not value_a & (1 << heading):
+                    continue
+                cell = cell_a + offsets[heading]
+                # every chain can be walked from both ends; walk it once
+                if walked[cell]:
+                    continue
+                b = node_index[cell]
+                if b >= 0 and (a, heading) > (b, reverse[heading]):
+                    continue
+
+                length = 1
+                turns = 0
+                last = heading
+                while b < 0:
+                    walked[cell] = 1
+                    outgoing = exit_heading[links[cell]][last]
+                    walk_cells.append(cell)
+                    walk_headings.append(outgoing)
+                    if outgoing != last:
+                        turns += 1
+                    last = outgoing
+                    cell += offsets[outgoing]
+                    b = node_index[cell]
+                    length += 1
+
+                self.chains.append((a, b, length, turns, heading,
+                                    reverse[last]))
+                self.incoming[b].append((a, length * scale + turns, heading))
+                self.incoming[a].append((b, length * scale + turns,
+                                         reverse[last]))
+            a += 1
+
+        # the rows of the corridor cells, filled in for all chains at once
+        chains = np.array(self.chains, dtype=np.int64).reshape(-1, 6)
+        self.chain_array = chains
+        counts = chains[:, 2] - 1
+        self.chain_start = np.zeros(len(chains) + 1, dtype=np.intp)
+        np.cumsum(counts, out=self.chain_start[1:])
+        first = self.chain_start[:-1][counts > 0]
+        chain = np.repeat(np.arange(len(chains)), counts)
+        to_b = np.array(walk_headings, dtype=np.int64)
+        # heading the robot moves in when entering each cell from a
+        entering = np.empty_like(to_b)
+        entering[1:] = to_b[:-1]
+        entering[first] = chains[counts > 0, 4]
+        turn = (to_b != entering).astype(np.int64)
+        before = np.cumsum(turn) - turn
+        turns_a = before - before[self.chain_start[chain]]
+        turns_b = chains[chain, 3] - turns_a - turn
+        position = np.arange(len(chain)) - self.chain_start[chain] + 1
+        self.chain_cells = np.stack([
+            np.array(walk_cells, dtype=np.int64), chain, position, to_b,
+            np.array(reverse, dtype=np.int64)[entering], turns_a, turns_b],
+            axis=1).reshape(-1, 7)
+        self.node_index = node_index
+        self.cell_row = np.full(dim * dim, -1, dtype=np.intp)
+        self.cell_row[self.chain_cells[:, 0]] = np.arange(len(chain))
+
+    def node_costs(self, goal_cells):
+        '''
+        Dijkstra search from the goal cells over the incoming edges, with
+        (length, turns) costs compared in that order. A goal cell inside a
+        corridor starts the search at both ends of its chain. Returns the
+        length, turns and first heading of the best route from every node,
+        with -1 for nodes the goal can not be reached from.
+        '''
+        count = len(self.nodes)
+        scale = self.cost_scale
+        cost = [-1] * count
+        policy = [-1] * count
+        heap = []
+        for cell in goal_cells:
+            node = self.node_index[cell]
+            row = self.cell_row[cell]
+            if node >= 0:
+                heap.append((0, node, -1))
+            elif row >= 0:
+                _, chain, position, _, _, turns_a, turns_b = self.chain_cells[row].tolist()  # NOQA
+                a, b, length, _, heading_a, heading_b = self.chains[chain]
+                heap.append((position * scale + turns_a, a, heading_a))
+                heap.append(((length - position) * scale + turns_b, b,
+                             heading_b))
+        heapq.heapify(heap)
+
+        incoming = self.incoming
+        heappush, heappop = heapq.heappush, heapq.heappop
+        while heap:
+            node_cost, node, heading = heappop(heap)
+            if cost[node] >= 0:
+                continue
+            cost[node] = node_cost
+            policy[node] = heading
+            for other, edge_cost, out in incoming[node]:
+                if cost[other] < 0:
+                    heappush(heap, (node_cost + edge_cost, other, out))
+
+        cost = np.array(cost, dtype=np.int64)
+        reached = cost >= 0
+        lengths = np.where(reached, cost // scale, -1)
+        turns = np.where(reached, cost % scale, -1)
+        return lengths, turns, np.array(policy, dtype=np.int64)
+
+    def plan(self, goal_cells):
+        '''
+        Returns (distances, policy), both indexed [x, y]: the number of
+        moves from every cell to the nearest of the (x, y) goal_cells and
+        the integer heading that starts a shortest route, like the robot's
+        heuGrid and policyGrid. Among routes of the same length, the one
+        with fewer turns is taken. Cells the goal can not be reached from
+        get -1, and goal cells get the policy -1.
+        '''
+        dim = self.dim
+        goal_cells = [int(x) * dim + int(y) for x, y in goal_cells]
+        distances = np.full(dim * dim, -1, dtype=np.int64)
+        policy = np.full(dim * dim, -1, dtype=np.int64)
+
+        lengths, turns, headings = self.node_costs(goal_cells)
+        nodes = np.array(self.nodes, dtype=np.int64)
+        distances[nodes] = lengths
+        policy[nodes] = headings
+
+        cells = self.chain_cells
+        if len(cells):
+            ends = self.chain_array[cells[:, 1]]
+            a, b = ends[:, 0], ends[:, 1]
+            position = cells[:, 2]
+            # cost of leaving the corridor through either of its ends,
+            # without a way as (dim * dim, 0)
+            length_a = np.where(lengths[a] >= 0, lengths[a] + position,
+                                dim * dim)
+            turns_a = turns[a] + cells[:, 5]
+            length_b = np.where(lengths[b] >= 0,
+                                lengths[b] + ends[:, 2] - position, dim * dim)
+            turns_b = turns[b] + cells[:, 6]
+            to_a = (length_a < length_b) | ((length_a == length_b) &
+                                            (turns_a <= turns_b))
+            best = np.where(to_a, length_a, length_b)
+            best_turns = np.where(to_a, turns_a, turns_b)
+            best_policy = np.where(to_a, cells[:, 4], cells[:, 3])
+
+            # goal cells inside a corridor are also reached along it
+            for cell in goal_cells:
+                row = self.cell_row[cell]
+                if row < 0:
+                    continue
+                start, stop = self.chain_start[cells[row, 1]:cells[row, 1] + 2]  # NOQA
+                rows = slice(start, stop)
+                direct = np.abs(position[rows] - position[row])
+                direct_turns = np.abs(cells[rows, 5] - cells[row, 5])
+                better = (direct < best[rows]) | ((direct == best[rows]) &
+                                                  (direct_turns < best_turns[rows]))  # NOQA
+                best[rows] = np.where(better, direct, best[rows])
+                best_turns[rows] = np.where(better, direct_turns,
+                                            best_turns[rows])
+                towards = np.where(position[rows] > position[row],
+                                   cells[rows, 4], cells[rows, 3])
+                best_policy[rows] = np.where(better, towards,
+                                             best_policy[rows])
+
+            reached = best < dim * dim
+            distances[cells[:, 0]] = np.where(reached, best, -1)
+            policy[cells[:, 0]] = np.where(reached, best_policy, -1)
+
+        distances[goal_cells] = 0
+        policy[goal_cells] = -1
+        return distances.reshape(dim, dim), policy.reshape(dim, dim)
+
+
+# graphs built by corridor_graph(), by a hash of their grid, the most
+# recently used last
+graph_cache = OrderedDict()
+graph_cache_size = 8
+
+
+def corridor_graph(value_grid):
+    '''
+    Returns the CorridorGraph of value_grid. The graphs of the last few
+    grids are kept, so planning again for the same known walls, e.g. for
+    other goal cells or by another robot in the same process, only runs
+    CorridorGraph.plan().
+    '''
+    grid = np.ascontiguousarray(value_grid, dtype=np.uint8)
+    digest = hashlib.blake2b(grid.tobytes(), digest_size=16)
+    digest.update(repr(grid.shape).encode())
+    key = digest.hexdigest()
+    graph = graph_cache.get(key)
+    if graph is None:
+        graph = CorridorGraph(grid)
+        graph_cache[key] = graph
+        while len(graph_cache) > graph_cache_size:
+            graph_cache.popitem(last=False)
+    graph_cache.move_to_end(key)
+    return graph
+
+
+def corridor_plan(value_grid, goal_cells):
+    '''
+    Returns the (distances, policy) grids of CorridorGraph.plan() for the
+    known cells of value_grid and the (x, y) cells goal_cells.
+    '''
+    return corridor_graph(value_grid).plan(goal_cells)
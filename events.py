@@ -0,0 +1,113 @@
+import json
+
+
+class PrintSink(object):
+    '''
+    Event sink that prints every event in the human readable format the
+    robot and the tester have always printed. Attach it to a Robot and a
+    Simulator to get the full step-by-step log on the terminal.
+
+    A sink is any object with an emit(event, **fields) method; the robot
+    and the simulator only build the event fields when a sink is attached.
+    '''
+    def emit(self, event, **fields):
+        getattr(self, 'print_' + event)(**fields)
+
+    def print_grid(self, grid):
+        '''
+        Prints a grid indexed [x][y] so that the top row of the maze is
+        printed first.
+        '''
+        grid = to_list(grid) if hasattr(grid, 'tolist') else grid
+        dim = len(grid)
+        for y in reversed(range(dim)):
+            print([grid[x][y] for x in range(dim)])
+        print("")
+
+    # Robot events
+
+    def print_explore(self, step, location, find_goal, allowed_actions,
+                      prefered_actions, rotation, movement, visits):
+        print("Step:", step)
+        print(location[0], location[1])
+        print("find goal yet?", find_goal)
+        print("allow actions:", allowed_actions)
+        print("prefered actions:", prefered_actions)
+        print("rotation", rotation, "movement", movement)
+        print("")
+        print("total number of cells visited", visits)
+        print("")
+
+    def print_plan(self, visitedGrid, valueGrid, heuGrid, arrowGrid):
+        for name, grid in (("visitedGrid:", visitedGrid),
+                           ("valueGrid:", valueGrid),
+                           ("heuGrid:", heuGrid),
+                           ("policyGrid:", arrowGrid)):
+            print(name)
+            self.print_grid(grid)
+            print("")
+
+    def print_follow(self, location, policy, movement):
+        print(location[0], location[1], policy, movement)
+
+    # Simulator events
+
+    def print_step(self, time, run, sensors, rotation, movement, location,
+                   heading, reset, invalid, wall_hit, goal):
+        pass
+
+    def print_run_start(self, run):
+        print("Starting run {}.".format(run))
+
+    def print_timeout(self, time):
+        print("Allotted time exceeded.")
+
+    def print_reset(self, time):
+        print("Ending first run. Starting next run.")
+
+    def print_invalid_reset(self, time, run):
+        if run == 0:
+            print("Cannot reset - robot has not hit goal yet.")
+        else:
+            print("Cannot reset on runs after the first.")
+
+    def print_invalid_rotation(self, time, rotation):
+        print("Invalid rotation value, no rotation performed.")
+
+    def print_movement_limited(self, time, movement):
+        print("Movement limited to three squares in a turn.")
+
+    def print_wall_hit(self, time, location, heading):
+        print("Movement stopped by wall.")
+
+    def print_goal(self, time, run):
+        print("Goal found; run {} completed!".format(run))
+
+
+class JSONLSink(object):
+    '''
+    Event sink that writes one JSON object per event to a file, with the
+    event name under the key 'event'. Grids and other numpy values are
+    stored as plain lists.
+    '''
+    def __init__(self, filename):
+        self.f_out = open(filename, 'w')
+
+    def emit(self, event, **fields):
+        record = {'event': event}
+        record.update(fields)
+        self.f_out.write(json.dumps(record, separators=(',', ':'),
+                                    default=to_list))
+        self.f_out.write('\n')
+
+    def close(self):
+        self.f_out.close()
+
+
+def to_list(value):
+    '''
+    Converts numpy arrays and scalars for json.dumps.
+    '''
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
@@ -0,0 +1,284 @@
+from mazefile import save_maze_batches
+import numpy as np
+import argparse
+
+# Generated mazes follow the Micromouse rules the test mazes follow:
+# - the goal room, the 2x2 cells at the center of the maze, is open inside
+#   and has a single entrance.
+# - the start cell, (0, 0) in the bottom left corner, is closed on its
+#   right, so the robot always leaves it upwards.
+# Mazes are generated many at a time: every array below has the batch of
+# mazes as its first axis, and cells are numbered x * dim + y, so that a
+# (count, dim * dim) array reshapes to walls indexed [x, y].
+methods = ['backtracker', 'kruskal']
+
+
+class MazeGraph(object):
+    def __init__(self, dim):
+        '''
+        Edges between the neighbouring cells of a maze of dimension dim.
+        Edge e joins cell edge_a[e] to the cell above or to the right of it,
+        edge_b[e]. The up edges come first, numbered x * (dim-1) + y, then
+        the right edges, numbered up_count + x * dim + y.
+        - neighbours: cell in every integer heading from every cell, -1 for
+            the maze edges and the start cell's right. (array of N by 4)
+        - neighbour_edges: edge towards each of the neighbours.
+        - room: the goal room cells, room_edges: the edges inside it.
+        - entrances: the 8 edges leaving the room, and entrance_cells: the
+            cells outside the room they lead to.
+        - start_edge: the edge on the right of the start cell.
+        - free_edges: mask of the edges loop injection may open.
+        '''
+        if dim % 2 or dim < 4:
+            raise Exception('Maze dimensions must be even and at least 4!')
+        self.dim = dim
+        self.cell_count = dim * dim
+        cells = np.arange(self.cell_count).reshape(dim, dim)
+
+        up_a = cells[:, :-1].ravel()
+        right_a = cells[:-1, :].ravel()
+        self.up_count = len(up_a)
+        self.edge_a = np.concatenate([up_a, right_a])
+        self.edge_b = np.concatenate([up_a + 1, right_a + dim])
+        self.edge_count = len(self.edge_a)
+        up_edges = np.arange(self.up_count).reshape(dim, dim - 1)
+        right_edges = self.up_count + np.arange(len(right_a)).reshape(dim - 1, dim)  # NOQA
+
+        self.neighbours = np.full((self.cell_count, 4), -1, dtype=np.intp)
+        self.neighbour_edges = np.full((self.cell_count, 4), -1, dtype=np.intp)  # NOQA
+        for heading, cell_a, cell_b, edges in ((0, cells[:, :-1], cells[:, 1:], up_edges),  # NOQA
+                                               (1, cells[:-1, :], cells[1:, :], right_edges)):  # NOQA
+            self.neighbours[cell_a, heading] = cell_b
+            self.neighbour_edges[cell_a, heading] = edges
+            self.neighbours[cell_b, heading + 2] = cell_a
+            self.neighbour_edges[cell_b, heading + 2] = edges
+
+        self.start_edge = right_edges[0, 0]
+        self.neighbours[0, 1] = -1
+        self.neighbours[dim, 3] = -1
+
+        low, high = dim // 2 - 1, dim // 2
+        self.room = cells[low:high + 1, low:high + 1].ravel()
+        self.room_edges = np.array([up_edges[low, low], up_edges[high, low],
+                                    right_edges[low, low], right_edges[low, high]])  # NOQA
+        self.entrances = []
+        self.entrance_cells = []
+        for cell in self.room:
+            for heading in range(4):
+                neighbour = self.neighbours[cell, heading]
+                if neighbour not in self.room:
+                    self.entrances.append(self.neighbour_edges[cell, heading])
+                    self.entrance_cells.append(neighbour)
+        self.entrances = np.array(self.entrances)
+        self.entrance_cells = np.array(self.entrance_cells)
+
+        self.free_edges = np.ones(self.edge_count, dtype=bool)
+        self.free_edges[self.room_edges] = False
+        self.free_edges[self.entrances] = False
+        self.free_edges[self.start_edge] = False
+
+    def walls(self, open_edges):
+        '''
+        Turns a (count, edge_count) boolean array of open edges into the wall
+        numbers of the mazes, a uint8 array of shape (count, dim, dim).
+        '''
+        count, dim = len(open_edges), self.dim
+        up = open_edges[:, :self.up_count].reshape(count, dim, dim - 1)
+        right = open_edges[:, self.up_count:].reshape(count, dim - 1, dim)
+        up = up.view(np.uint8)
+        right = right.view(np.uint8)
+
+        walls = np.zeros((count, dim, dim), dtype=np.uint8)
+        walls[:, :, :-1] |= up
+        walls[:, :, 1:] |= up << 2
+        walls[:, :-1, :] |= right << 1
+        walls[:, 1:, :] |= right << 3
+        return walls
+
+    def open_room(self, open_edges, rng):
+        '''
+        Opens the inside of the goal room and one random entrance of it in
+        every maze. Returns the index of the entrance chosen for each maze.
+        '''
+        count = len(open_edges)
+        entrance = rng.integers(len(self.entrances), size=count)
+        open_edges[:, self.room_edges] = True
+        open_edges[np.arange(count), self.entrances[entrance]] = True
+        return entrance
+
+
+def backtracker_edges(graph, count, rng):
+    '''
+    Generates count perfect mazes with the recursive backtracker, run on all
+    mazes in lockstep: at every step each maze either moves from the top of
+    its stack to a random unvisited neighbour or steps back. The walk starts
+    at the goal room entrance and never enters the room, so every maze takes
+    exactly the same number of steps.
+    '''
+    rows = np.arange(count)
+    open_edges = np.zeros((count, graph.edge_count), dtype=bool)
+    entrance = graph.open_room(open_edges, rng)
+    root = graph.entrance_cells[entrance]
+
+    visited = np.zeros((count, graph.cell_count), dtype=bool)
+    visited[:, graph.room] = True
+    visited[rows, root] = True
+    stack = np.empty((count, graph.cell_count), dtype=np.intp)
+    stack[:, 0] = root
+    top = np.zeros(count, dtype=np.intp)
+
+    # all cells but the room are pushed once; after the last push every
+    # stack has been popped at most as many times as it was pushed
+    cells_left = graph.cell_count - len(graph.room) - 1
+    for step in range(2 * cells_left):
+        current = stack[rows, top]
+        neighbours = graph.neighbours[current]
+        allowed = (neighbours >= 0) & ~visited[rows[:, None], neighbours]
+
+        keys = rng.random((count, 4), dtype=np.float32)
+        keys[~allowed] = -1
+        heading = keys.argmax(axis=1)
+        moves = allowed[rows, heading]
+
+        movers = rows[moves]
+        current = current[moves]
+        heading = heading[moves]
+        cell = neighbours[moves, heading]
+        open_edges[movers, graph.neighbour_edges[current, heading]] = True
+        visited[movers, cell] = True
+        top += np.where(moves, 1, -1)
+        stack[movers, top[movers]] = cell
+    return open_edges
+
+
+def find_roots(parent, rows, cells):
+    '''
+    Union-find lookup for a batch of forests: returns the root of cells[i]
+    in parent[rows[i]], and points the cells straight at their roots.
+    '''
+    roots = parent[rows, cells]
+    while True:
+        above = parent[rows, roots]
+        if np.array_equal(above, roots):
+            break
+        roots = above
+    parent[rows, cells] = roots
+    return roots
+
+
+def kruskal_edges(graph, count, rng):
+    '''
+    Generates count perfect mazes with randomized Kruskal: each maze visits
+    its edges in its own random order and opens those joining two separate
+    regions. All mazes take their k-th edge at the same time, with a union-
+    find forest per maze stored in one array. The goal room starts as a
+    single region joined only through its chosen entrance.
+    '''
+    rows = np.arange(count)
+    open_edges = np.zeros((count, graph.edge_count), dtype=bool)
+    entrance = graph.open_room(open_edges, rng)
+
+    # closed edges sort last and are never visited
+    keys = rng.random((count, graph.edge_count), dtype=np.float32)
+    keys[:, ~graph.free_edges] = 2
+    keys[rows, graph.entrances[entrance]] = 0
+    order = np.argsort(keys, axis=1)
+    order = order[:, :graph.free_edges.sum() + 1]
+
+    parent = np.tile(np.arange(graph.cell_count), (count, 1))
+    parent[:, graph.room] = graph.room[0]
+    size = np.ones((count, graph.cell_count), dtype=np.intp)
+    size[:, graph.room[0]] = len(graph.room)
+
+    for edges in order.T:
+        root_a = find_roots(parent, rows, graph.edge_a[edges])
+        root_b = find_roots(parent, rows, graph.edge_b[edges])
+        joins = root_a != root_b
+
+        joined = rows[joins]
+        root_a = root_a[joins]
+        root_b = root_b[joins]
+        # the smaller region joins the larger one
+        swap = size[joined, root_a] > size[joined, root_b]
+        child = np.where(swap, root_b, root_a)
+        root = np.where(swap, root_a, root_b)
+        parent[joined, child] = root
+        size[joined, root] += size[joined, child]
+        open_edges[joined, edges[joins]] = True
+    return open_edges
+
+
+def inject_loops(graph, open_edges, loops, rng):
+    '''
+    Opens every closed free edge with probability loops, so a perfect maze
+    gets loops and more than one way to the goal room.
+    '''
+    closed = ~open_edges & graph.free_edges
+    open_edges |= closed & (rng.random(open_edges.shape, dtype=np.float32) < loops)  # NOQA
+    return open_edges
+
+
+def generate_batches(count, dim, method='backtracker', loops=0.0, seed=None,
+                     batch_size=8192):
+    '''
+    Generates count mazes of dimension dim and yields their wall numbers in
+    uint8 arrays of shape (batch_size, dim, dim), the last one possibly
+    smaller.
+    - method: 'backtracker' for long winding corridors, or 'kruskal' for
+        many short dead ends.
+    - loops: probability of opening each remaining wall after the perfect
+        maze is generated, 0 for perfect mazes.
+    - seed: the same seed, count, batch size and options always generate
+        the same mazes.
+    '''
+    if method not in methods:
+        raise Exception('Unknown maze generation method: {}'.format(method))
+    graph = MazeGraph(dim)
+    rng = np.random.default_rng(seed)
+    generate_edges = backtracker_edges if method == 'backtracker' else kruskal_edges  # NOQA
+
+    for start in range(0, count, batch_size):
+        open_edges = generate_edges(graph, min(batch_size, count - start), rng)  # NOQA
+        if loops > 0:
+            inject_loops(graph, open_edges, loops, rng)
+        yield graph.walls(open_edges)
+
+
+def generate_mazes(count, dim, method='backtracker', loops=0.0, seed=None,
+                   batch_size=8192):
+    '''
+    Generates count mazes into one array of shape (count, dim, dim), see
+    generate_batches().
+    '''
+    batches = list(generate_batches(count, dim, method, loops, seed,
+                                    batch_size))
+    if not batches:
+        return np.zeros((0, dim, dim), dtype=np.uint8)
+    return np.concatenate(batches)
+
+
+if __name__ == '__main__':
+    '''
+    This script generates a maze archive of random mazes, e.g.
+
+        python generator.py mazes_16.mazes --count 100000 --dim 16 --seed 0
+    '''
+    parser = argparse.ArgumentParser(
+        description='Generate random Micromouse mazes into a maze archive.')
+    parser.add_argument('output', help='maze archive to write')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='number of mazes to generate')
+    parser.add_argument('--dim', type=int, default=16,
+                        help='maze dimension (even)')
+    parser.add_argument('--method', default='backtracker', choices=methods,
+                        help='maze generation algorithm')
+    parser.add_argument('--loops', type=float, default=0.0,
+                        help='probability of removing each remaining wall')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed, for reproducible mazes')
+    args = parser.parse_args()
+
+    save_maze_batches(args.output, args.dim,
+                      generate_batches(args.count, args.dim, args.method,
+                                       args.loops, args.seed))
+    print("Wrote {} mazes to {}.".format(args.count, args.output))
@@ -0,0 +1,119 @@
+import numpy as np
+import struct
+import json
+import os
+
+# A knowledge snapshot holds what a robot learned about one maze:
+# - a 12 byte header: the magic bytes below, the format version (uint16),
+#   the maze dimension (uint16) and the length of the metadata (uint32),
+#   all little endian.
+# - the metadata as UTF-8 JSON, padded with spaces to a multiple of 8 bytes.
+#   Besides the robot's settings it lists every array of the snapshot as
+#   [name, dtype, shape, offset], with the offset counted from the end of
+#   the metadata.
+# - the arrays, in C order, each starting on a multiple of 8 bytes, so they
+#   can be memory-mapped in place.
+snapshot_magic = b'MZKB'
+snapshot_version = 1
+header_format = '<4sHHI'
+header_size = struct.calcsize(header_format)
+
+# knowledge grids of a Robot stored in a snapshot
+snapshot_grids = ['valueGrid', 'visitedGrid', 'heuGrid', 'policyGrid']
+
+
+def save_knowledge(filename, robot, **metadata):
+    '''
+    Writes the knowledge of robot to a snapshot file: its grids, its plan
+    for the 2nd run if it has one, and its maze dimension, goal cells,
+    planner and whether it finished exploring. Further metadata, such as
+    the name of the maze, can be given as keyword arguments and must be
+    JSON serializable.
+
+    The file is written under a temporary name first and then moved in
+    place, so readers never see a half written snapshot.
+    '''
+    arrays = [(name, np.ascontiguousarray(getattr(robot, name)))
+              for name in snapshot_grids]
+    # the robot uses up its plan in the 2nd run, but keeps a copy of it
+    if robot.knowledgePlan:
+        arrays.append(('actionPlan',
+                       np.array(robot.knowledgePlan, dtype=np.int16).reshape(-1, 2)))  # NOQA
+
+    metadata.update({'maze_dim': robot.maze_dim,
+                     'goal_cells': [list(cell) for cell in robot.goalCells],
+                     'planner': robot.planner,
+                     'explored': bool(robot.run_2),
+                     'arrays': []})
+    offset = 0
+    for name, array in arrays:
+        metadata['arrays'].append([name, array.dtype.str, list(array.shape),
+                                   offset])
+        offset += -(-array.nbytes // 8) * 8
+
+    text = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    text += b' ' * (-len(text) % 8 + (-header_size % 8))
+
+    temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temp_filename, 'wb') as f_out:
+        f_out.write(struct.pack(header_format, snapshot_magic,
+                                snapshot_version, robot.maze_dim, len(text)))
+        f_out.write(text)
+        for name, array in arrays:
+            f_out.write(array.tobytes())
+            f_out.write(b'\0' * (-array.nbytes % 8))
+    os.replace(temp_filename, filename)
+
+
+class KnowledgeSnapshot(object):
+    def __init__(self, filename, mmap=True):
+        '''
+        Read access to a snapshot written by save_knowledge().
+        - dim: dimension of the maze.
+        - metadata: dictionary of the metadata stored with the snapshot.
+        - arrays: dictionary of the stored grids and plan by name. With mmap
+            the arrays are memory-mapped, so opening a snapshot only reads
+            its header and metadata.
+
+        Pass a snapshot to Robot as its knowledge argument to warm-start it.
+        '''
+        with open(filename, 'rb') as f_in:
+            header = f_in.read(header_size)
+            if len(header) < header_size:
+                raise Exception('Not a knowledge snapshot: {}'.format(filename))  # NOQA
+            magic, version, self.dim, length = struct.unpack(header_format,
+                                                             header)
+            if magic != snapshot_magic:
+                raise Exception('Not a knowledge snapshot: {}'.format(filename))  # NOQA
+            if version != snapshot_version:
+                raise Exception('Unsupported knowledge snapshot version {}'.format(version))  # NOQA
+            self.metadata = json.loads(f_in.read(length).decode('utf-8'))
+
+        start = header_size + length
+        self.arrays = {}
+        for name, dtype, shape, offset in self.metadata.pop('arrays'):
+            if mmap and np.prod(shape) > 0:
+                array = np.memmap(filename, dtype=dtype, mode='r',
+                                  offset=start + offset, shape=tuple(shape))
+            else:
+                with open(filename, 'rb') as f_in:
+                    f_in.seek(start + offset)
+                    array = np.fromfile(f_in, dtype=dtype,
+                                        count=int(np.prod(shape)))
+                array = array.reshape(shape)
+            self.arrays[name] = array
+
+    @property
+    def goal_cells(self):
+        return [tuple(cell) for cell in self.metadata['goal_cells']]
+
+    @property
+    def explored(self):
+        return self.metadata['explored']
+
+
+def load_knowledge(filename, mmap=True):
+    '''
+    Opens a knowledge snapshot, see KnowledgeSnapshot.
+    '''
+    return KnowledgeSnapshot(filename, mmap)
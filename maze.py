@@ -1,7 +1,22 @@
 import numpy as np
 
+# Integer headings shared by the simulator and the planners. Heading h is
+# open in a cell when the cell's wall number has the bit 1 << h set.
+UP, RIGHT, DOWN, LEFT = 0, 1, 2, 3
+heading_index = {'u': UP, 'r': RIGHT, 'd': DOWN, 'l': LEFT,
+                 'up': UP, 'right': RIGHT, 'down': DOWN, 'left': LEFT}
+heading_names = ['u', 'r', 'd', 'l']
+heading_bits = [1, 2, 4, 8]
+heading_deltas = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+
+# Mazes with at most this many cells also keep their distance table as
+# nested lists, which are faster to index from Python but take about 100
+# bytes per cell instead of 4 to 8.
+list_lookup_cells = 128 * 128
+
+
 class Maze(object):
-    def __init__(self, filename):
+    def __init__(self, filename=None, walls=None):
         '''
         Maze objects have two main attributes:
         - dim: mazes should be square, with sides of even length. (integer)
@@ -9,21 +24,24 @@ class Maze(object):
             0 if there is a wall and 1 if there is no wall. The 1s register
             corresponds with a square's top edge, 2s register the right edge,
             4s register the bottom edge, and 8s register the left edge. (numpy
-            array)
+            uint8 array)
+
+        The maze is read from the text file filename, or taken from an array
+        of wall numbers indexed [x, y] given as walls, for example one loaded
+        from a maze archive (see mazefile.py).
 
         The initialization function also performs some consistency checks for
-        wall positioning.
+        wall positioning, and builds the table of sensor distances:
+        - distances: number of open cells to the nearest wall from every cell
+            in every integer heading, indexed [x, y, heading]. (numpy array)
+        - distance_lists: the same table as nested lists, or None for mazes
+            with more than list_lookup_cells cells.
         '''
-        with open(filename, 'rb') as f_in:
-
-            # First line should be an integer with the maze dimensions
-            self.dim = int(f_in.next())
-
-            # Subsequent lines describe the permissability of walls
-            walls = []
-            for line in f_in:
-                walls.append(map(int,line.split(',')))
-            self.walls = np.array(walls)
+        if walls is None:
+            self.dim, self.walls = read_text_walls(filename)
+        else:
+            self.walls = np.array(walls, dtype=np.uint8)
+            self.dim = len(self.walls)
 
         # Perform validation on maze
         # Maze dimensions
@@ -33,18 +51,7 @@ class Maze(object):
             raise Exception('Maze shape does not match dimension attribute!')
 
         # Wall permeability
-        wall_errors = []
-        # vertical walls
-        for x in range(self.dim-1):
-            for y in range(self.dim):
-                if (self.walls[x,y] & 2 != 0) != (self.walls[x+1,y] & 8 != 0):
-                    wall_errors.append([(x,y), 'v'])
-        # horizontal walls
-        for y in range(self.dim-1):
-            for x in range(self.dim):
-                if (self.walls[x,y] & 1 != 0) != (self.walls[x,y+1] & 4 != 0):
-                    wall_errors.append([(x,y), 'h'])
-
+        wall_errors = find_wall_errors(self.walls)
         if wall_errors:
             for cell, wall_type in wall_errors:
                 if wall_type == 'v':
@@ -55,6 +62,13 @@ class Maze(object):
                     print('Inconsistent horizontal wall betweeen {} and {}'.format(cell, cell2))
             raise Exception('Consistency errors found in wall specifications!')
 
+        self.distances = distance_table(self.walls)
+        # nested list copy of the table, for fast scalar lookups
+        if self.dim * self.dim <= list_lookup_cells:
+            self.distance_lists = self.distances.tolist()
+        else:
+            self.distance_lists = None
+
 
     def is_permissible(self, cell, direction):
         """
@@ -63,12 +77,10 @@ class Maze(object):
         input as single letter 'u', 'r', 'd', 'l', or complete words 'up', 
         'right', 'down', 'left'.
         """
-        dir_int = {'u': 1, 'r': 2, 'd': 4, 'l': 8,
-                   'up': 1, 'right': 2, 'down': 4, 'left': 8}
-        try:
-            return (self.walls[tuple(cell)] & dir_int[direction] != 0)
-        except:
+        if direction not in heading_index:
             print('Invalid direction provided!')
+            return None
+        return self.dist_to_wall(cell, direction) > 0
 
 
     def dist_to_wall(self, cell, direction):
@@ -78,17 +90,111 @@ class Maze(object):
         may be input as a single letter 'u', 'r', 'd', 'l', or complete words
         'up', 'right', 'down', 'left'.
         """
-        dir_move = {'u': [0, 1], 'r': [1, 0], 'd': [0, -1], 'l': [-1, 0],
-                    'up': [0, 1], 'right': [1, 0], 'down': [0, -1], 'left': [-1, 0]}
-
-        sensing = True
-        distance = 0
-        curr_cell = list(cell) # make copy to preserve original
-        while sensing:
-            if self.is_permissible(curr_cell, direction):
-                distance += 1
-                curr_cell[0] += dir_move[direction][0]
-                curr_cell[1] += dir_move[direction][1]
+        x, y = cell
+        if self.distance_lists is None:
+            return int(self.distances[x, y, heading_index[direction]])
+        return self.distance_lists[x][y][heading_index[direction]]
+
+
+def wall_error_grids(walls):
+    """
+    Compares the wall numbers of neighbouring cells for a maze, or a stack
+    of mazes, given as an array whose last two axes are [x, y]. Returns two
+    boolean arrays:
+    - vertical: [..., x, y] is True if cell (x, y) and cell (x+1, y)
+        disagree about the wall between them. (last two axes dim-1 by dim)
+    - horizontal: [..., x, y] is True if cell (x, y) and cell (x, y+1)
+        disagree about the wall between them. (last two axes dim by dim-1)
+    """
+    walls = np.asarray(walls)
+    vertical = ((walls[..., :-1, :] & 2) != 0) != ((walls[..., 1:, :] & 8) != 0)
+    horizontal = ((walls[..., :, :-1] & 1) != 0) != ((walls[..., :, 1:] & 4) != 0)
+    return vertical, horizontal
+
+
+def find_wall_errors(walls):
+    """
+    Returns every inconsistent wall of a maze as a list of ((x, y), 'v') for
+    the wall between (x, y) and (x+1, y) and ((x, y), 'h') for the wall
+    between (x, y) and (x, y+1). For a stack of mazes of shape (count, dim,
+    dim), the list holds (index, (x, y), wall_type) entries instead.
+    """
+    vertical, horizontal = wall_error_grids(walls)
+    errors = []
+    for wall_type, grid in (('v', vertical), ('h', horizontal)):
+        for position in zip(*np.nonzero(grid)):
+            position = tuple(int(i) for i in position)
+            if grid.ndim == 2:
+                errors.append((position, wall_type))
             else:
-                sensing = False
-        return distance
\ No newline at end of file
+                errors.append((position[0], position[1:], wall_type))
+    return errors
+
+
+def valid_mazes(walls):
+    """
+    Returns a boolean array telling for each maze of a stack of shape
+    (count, dim, dim) whether all its walls are consistent.
+    """
+    vertical, horizontal = wall_error_grids(walls)
+    return ~(vertical.any(axis=(-2, -1)) | horizontal.any(axis=(-2, -1)))
+
+
+def read_text_walls(filename):
+    """
+    Reads a maze text file: the first line holds the maze dimension and
+    each following line the comma separated wall numbers of one column of
+    cells, from the bottom up. Returns the dimension and the walls as a
+    uint8 array indexed [x, y].
+    """
+    with open(filename, 'r') as f_in:
+        lines = [line.replace(' ', '') for line in f_in.read().splitlines()]
+        lines = [line for line in lines if line]
+
+    dim = int(lines[0])
+    # Subsequent lines describe the permissability of walls
+    rows = lines[1:]
+    try:
+        walls = np.array(','.join(rows).split(','), dtype=np.uint8)
+        walls = walls.reshape(len(rows), -1)
+    except ValueError:
+        raise Exception('Maze shape does not match dimension attribute!')
+    return dim, walls
+
+
+def distance_table(walls):
+    """
+    Returns a (dim, dim, 4) array holding, for every cell and integer
+    heading, the number of open cells to the nearest wall. Each direction
+    is computed with one scan over the whole maze: the distance is the
+    index of the nearest blocked cell in that direction minus the index
+    of the cell itself. The outer edges of the maze count as walls.
+
+    walls may also be a stack of mazes of shape (count, dim, dim), in which
+    case the table has shape (count, dim, dim, 4).
+    """
+    walls = np.asarray(walls)
+    dim = walls.shape[-1]
+    table = np.empty(walls.shape + (4,), dtype=np.min_scalar_type(dim))
+    index = np.arange(dim)
+
+    # up and right: nearest blocked cell at or after each cell
+    for heading, axis in ((UP, -1), (RIGHT, -2)):
+        blocked = (walls & heading_bits[heading]) == 0
+        np.moveaxis(blocked, axis, -1)[..., -1] = True
+        shape = [dim, 1] if axis == -2 else [dim]
+        steps = np.where(blocked, index.reshape(shape), dim)
+        steps = np.flip(steps, axis)
+        nearest = np.flip(np.minimum.accumulate(steps, axis), axis)
+        table[..., heading] = nearest - index.reshape(shape)
+
+    # down and left: nearest blocked cell at or before each cell
+    for heading, axis in ((DOWN, -1), (LEFT, -2)):
+        blocked = (walls & heading_bits[heading]) == 0
+        np.moveaxis(blocked, axis, -1)[..., 0] = True
+        shape = [dim, 1] if axis == -2 else [dim]
+        steps = np.where(blocked, index.reshape(shape), -1)
+        nearest = np.maximum.accumulate(steps, axis)
+        table[..., heading] = index.reshape(shape) - nearest
+
+    return table
@@ -0,0 +1,159 @@
+from maze import Maze, read_text_walls, valid_mazes
+import numpy as np
+import argparse
+import struct
+
+# A maze archive holds any number of mazes of the same dimension:
+# - a 16 byte header: the magic bytes below, the format version (uint16),
+#   the maze dimension (uint16), the number of mazes (uint32) and 4 unused
+#   bytes, all little endian.
+# - for every maze, its dim * dim wall numbers in [x, y] order, packed two
+#   per byte: the first cell of each pair in the low 4 bits.
+archive_magic = b'MAZE'
+archive_version = 1
+header_format = '<4sHHI4x'
+header_size = struct.calcsize(header_format)
+
+
+def pack_walls(walls):
+    '''
+    Packs an array of wall numbers whose last two axes are [x, y] into two
+    cells per byte. Returns a uint8 array with the last two axes replaced
+    by one axis of dim * dim / 2 bytes.
+    '''
+    walls = np.asarray(walls, dtype=np.uint8)
+    cells = walls.reshape(walls.shape[:-2] + (-1, 2))
+    return cells[..., 0] | (cells[..., 1] << 4)
+
+
+def unpack_walls(packed, dim):
+    '''
+    Reverses pack_walls() for mazes of dimension dim.
+    '''
+    packed = np.asarray(packed, dtype=np.uint8)
+    walls = np.empty(packed.shape + (2,), dtype=np.uint8)
+    walls[..., 0] = packed & 15
+    walls[..., 1] = packed >> 4
+    return walls.reshape(packed.shape[:-1] + (dim, dim))
+
+
+def save_mazes(filename, walls):
+    '''
+    Writes a maze archive. walls is an array of shape (count, dim, dim), or
+    a list of (dim, dim) arrays of the same dimension. Mazes with
+    inconsistent walls are refused, see maze.find_wall_errors().
+    '''
+    walls = np.asarray(walls, dtype=np.uint8)
+    if walls.ndim != 3 or walls.shape[1] != walls.shape[2]:
+        raise Exception('Mazes must be square and of the same dimension!')
+    save_maze_batches(filename, walls.shape[1], [walls])
+
+
+def save_maze_batches(filename, dim, batches):
+    '''
+    Writes a maze archive from an iterable of (count, dim, dim) arrays, so
+    that corpora larger than memory can be written batch by batch. The
+    count in the header is filled in once all batches are written.
+    '''
+    count = 0
+    with open(filename, 'wb') as f_out:
+        f_out.write(struct.pack(header_format, archive_magic,
+                                archive_version, dim, 0))
+        for walls in batches:
+            walls = np.asarray(walls, dtype=np.uint8)
+            if walls.shape[1:] != (dim, dim):
+                raise Exception('Mazes must be square and of the same dimension!')  # NOQA
+            invalid = np.flatnonzero(~valid_mazes(walls))
+            if len(invalid):
+                raise Exception('Inconsistent walls in mazes {}!'.format(
+                    (invalid + count).tolist()))
+            f_out.write(pack_walls(walls).tobytes())
+            count += len(walls)
+
+        f_out.seek(0)
+        f_out.write(struct.pack(header_format, archive_magic,
+                                archive_version, dim, count))
+
+
+class MazeArchive(object):
+    def __init__(self, filename, mmap=True):
+        '''
+        Read access to a maze archive written by save_mazes().
+        - dim: dimension of the mazes.
+        - packed: the packed wall numbers, one row per maze. With mmap the
+            file is memory-mapped, so opening even a huge archive is instant
+            and only the mazes used are ever read from disk.
+
+        Indexing the archive returns the unpacked walls of a maze, as a
+        (dim, dim) array for one index or a (count, dim, dim) array for a
+        slice; maze(i) returns a Maze object.
+        '''
+        with open(filename, 'rb') as f_in:
+            header = f_in.read(header_size)
+        if len(header) < header_size:
+            raise Exception('Not a maze archive: {}'.format(filename))
+        magic, version, self.dim, count = struct.unpack(header_format, header)
+        if magic != archive_magic:
+            raise Exception('Not a maze archive: {}'.format(filename))
+        if version != archive_version:
+            raise Exception('Unsupported maze archive version {}'.format(version))  # NOQA
+
+        shape = (count, self.dim * self.dim // 2)
+        if mmap and count > 0:
+            self.packed = np.memmap(filename, dtype=np.uint8, mode='r',
+                                    offset=header_size, shape=shape)
+        else:
+            with open(filename, 'rb') as f_in:
+                f_in.seek(header_size)
+                self.packed = np.fromfile(f_in, dtype=np.uint8,
+                                          count=shape[0] * shape[1])
+            self.packed = self.packed.reshape(shape)
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, index):
+        return unpack_walls(self.packed[index], self.dim)
+
+    def maze(self, index):
+        return Maze(walls=self[index])
+
+
+def load_mazes(filename, mmap=True):
+    '''
+    Opens a maze archive, see MazeArchive.
+    '''
+    return MazeArchive(filename, mmap)
+
+
+def is_archive(filename):
+    '''
+    Returns whether filename starts like a maze archive.
+    '''
+    with open(filename, 'rb') as f_in:
+        return f_in.read(len(archive_magic)) == archive_magic
+
+
+def convert_text_mazes(filenames, output):
+    '''
+    Reads the maze text files filenames, which must have the same
+    dimension, and writes them to the maze archive output in that order.
+    '''
+    save_mazes(output, [read_text_walls(filename)[1]
+                        for filename in filenames])
+
+
+if __name__ == '__main__':
+    '''
+    This script converts maze text files into a maze archive, e.g.
+
+        python mazefile.py mazes_12.mazes test_maze_01.txt test_maze_04.txt
+    '''
+    parser = argparse.ArgumentParser(
+        description='Convert maze text files into a maze archive.')
+    parser.add_argument('output', help='maze archive to write')
+    parser.add_argument('mazes', nargs='+', help='maze text files')
+    args = parser.parse_args()
+
+    convert_text_mazes(args.mazes, args.output)
+    print("Wrote {} mazes to {}.".format(len(args.mazes), args.output))
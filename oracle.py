@@ -0,0 +1,335 @@
+from planning import open_grid
+import numpy as np
+import argparse
+import time
+
+# Mazes with up to this many known cells get a table of the distances
+# between all pairs of cells, at 2 bytes per pair (2 MB for 32x32); larger
+# ones get hub labels instead.
+all_pairs_cells = 32 * 32
+
+# number of entries of the buffer distances() looks up hub labels in: a
+# row of a distance per hub for each of the pairs of a batch
+label_buffer = 1 << 22
+
+# entry of the all-pairs table for cells that can not reach each other
+unreachable = np.iinfo(np.uint16).max
+
+# distance of the padding of hub labels, which two of add up to less than
+# the largest int32
+no_hub = np.iinfo(np.int32).max // 2
+
+
+def cell_graph(value_grid):
+    '''
+    Returns the graph of the cells known in value_grid, where a move
+    between two neighbouring cells is taken as in planning.flood_fill():
+    - cells: flat index x * dim + y of every node, in order. (numpy array)
+    - node: node of every flat cell index, -1 for unknown cells. (numpy
+        array)
+    - neighbours: list of the neighbouring nodes of every node.
+    '''
+    grid = open_grid(value_grid)
+    dim = grid.shape[0]
+    values = grid.ravel()
+    cells = np.flatnonzero(values)
+    node = np.full(dim * dim, -1, dtype=np.intp)
+    node[cells] = np.arange(len(cells))
+
+    node_list = node.tolist()
+    value_list = values.tolist()
+    steps = ((1, 1), (2, dim), (4, -1), (8, -dim))
+    neighbours = []
+    for cell in cells.tolist():
+        value = value_list[cell]
+        neighbours.append([node_list[cell + offset] for bit, offset in steps
+                           if value & bit and node_list[cell + offset] >= 0])
+    return cells, node, neighbours
+
+
+def bfs(neighbours, source):
+    '''
+    Returns the number of moves from node source to every node of the graph
+    as a list, with -1 for nodes that can not be reached.
+    '''
+    dist = [-1] * len(neighbours)
+    dist[source] = 0
+    frontier = [source]
+    distance = 0
+    while frontier:
+        distance += 1
+        reached = []
+        for current in frontier:
+            for neighbour in neighbours[current]:
+                if dist[neighbour] < 0:
+                    dist[neighbour] = distance
+                    reached.append(neighbour)
+        frontier = reached
+    return dist
+
+
+def hub_order(neighbours):
+    '''
+    Returns the nodes of the graph, most important hub first, for
+    hub_labels(). The first node is the centroid of a spanning tree of its
+    component, i.e. the node whose removal leaves no part of the tree with
+    more than half of its nodes. It is removed, and the same is done for
+    what is left of each component, level by level. In a perfect maze,
+    which is a tree, this is the centroid decomposition, and every cell
+    ends up with a label of a few hubs per doubling of the maze. Loops
+    keep components together for more levels and give longer labels.
+    '''
+    count = len(neighbours)
+    removed = bytearray(count)
+    key = [None] * count
+    level = 0
+    starts = list(range(count))
+    while starts:
+        seen = bytearray(count)
+        next_starts = []
+        for start in starts:
+            if removed[start] or seen[start]:
+                continue
+            # breadth first spanning tree of the component of start, with
+            # the position of the parent of every node in component
+            seen[start] = 1
+            component = [start]
+            parent = [-1]
+            for position, current in enumerate(component):
+                for neighbour in neighbours[current]:
+                    if not removed[neighbour] and not seen[neighbour]:
+                        seen[neighbour] = 1
+                        component.append(neighbour)
+                        parent.append(position)
+
+            size = len(component)
+            below = [1] * size
+            largest_child = [0] * size
+            for position in range(size - 1, 0, -1):
+                up = parent[position]
+                below[up] += below[position]
+                if below[position] > largest_child[up]:
+                    largest_child[up] = below[position]
+            centroid = component[min(
+                range(size),
+                key=lambda i: max(largest_child[i], size - below[i]))]
+
+            key[centroid] = (level, -size, centroid)
+            removed[centroid] = 1
+            next_starts.extend(neighbour for neighbour in neighbours[centroid]
+                               if not removed[neighbour])
+        starts = next_starts
+        level += 1
+    return sorted(range(count), key=key.__getitem__)
+
+
+def hub_labels(neighbours, order):
+    '''
+    Pruned landmark labeling: a breadth first search from every node, in
+    the order of hub_order(), adds the node as a hub with its distance to
+    the label of every node it reaches, unless the labels so far already
+    give that distance. Then any two connected nodes share a hub on a
+    shortest way between them, and their distance is the smallest sum of
+    their distances to a shared hub.
+
+    Returns the labels as two lists per node: the hubs, as ranks in order
+    and so ascending, and the distances to them.
+    '''
+    count = len(neighbours)
+    hubs = [[] for _ in range(count)]
+    dists = [[] for _ in range(count)]
+    # distance of the root of the current search to every hub of its label
+    root_dist = [-1] * count
+    visited = [-1] * count
+    for rank, root in enumerate(order):
+        for hub, dist in zip(hubs[root], dists[root]):
+            root_dist[hub] = dist
+        visited[root] = rank
+        frontier = [root]
+        distance = 0
+        while frontier:
+            reached = []
+            for current in frontier:
+                covered = False
+                for hub, dist in zip(hubs[current], dists[current]):
+                    if root_dist[hub] >= 0 and root_dist[hub] + dist <= distance:  # NOQA
+                        covered = True
+                        break
+                if covered:
+                    continue
+                hubs[current].append(rank)
+                dists[current].append(distance)
+                for neighbour in neighbours[current]:
+                    if visited[neighbour] != rank:
+                        visited[neighbour] = rank
+                        reached.append(neighbour)
+            frontier = reached
+            distance += 1
+        for hub in hubs[root]:
+            root_dist[hub] = -1
+    return hubs, dists
+
+
+class DistanceOracle(object):
+    def __init__(self, value_grid, method=None):
+        '''
+        Answers cell-to-cell distance queries over the cells known in
+        value_grid, e.g. a robot's valueGrid after the 1st run or the walls
+        of a whole maze. The distance of two cells is the number of
+        single-cell moves between them over known cells, or -1 if there is
+        no way between them.
+
+        method selects how the distances are stored, by default 'table' for
+        mazes with up to all_pairs_cells known cells and 'labels' above:
+        - 'table': a breadth first search from every cell fills a uint16
+            table of all pairs, and every query is a lookup.
+        - 'labels': hub labels (see hub_labels()), and every query finds
+            the shared hubs of two labels.
+
+        Batched queries go through distances(), which does one gather for
+        the table, and merges the labels of a batch of pairs with array
+        operations.
+        '''
+        self.value_grid = np.array(value_grid, dtype=np.uint8)
+        self.dim = self.value_grid.shape[0]
+        self.cells, self.node, self.neighbours = cell_graph(self.value_grid)
+        self.node_list = self.node.tolist()
+        count = len(self.cells)
+
+        if method is None:
+            method = 'table' if count <= all_pairs_cells else 'labels'
+        self.method = method
+
+        if method == 'table':
+            self.table = np.empty((count, count), dtype=np.uint16)
+            for source in range(count):
+                dist = np.array(bfs(self.neighbours, source))
+                dist[dist < 0] = unreachable
+                self.table[source] = dist
+        elif method == 'labels':
+            hubs, dists = hub_labels(self.neighbours,
+                                     hub_order(self.neighbours))
+            # labels as dictionaries for single queries, and as arrays
+            # indexed [node, i] for batches. Short labels are padded with
+            # the hub count, which no hub has, at the distance no_hub.
+            self.labels = [dict(zip(hub, dist))
+                           for hub, dist in zip(hubs, dists)]
+            width = max([len(hub) for hub in hubs] + [1])
+            self.label_hubs = np.full((count, width), count, dtype=np.int64)
+            self.label_dist = np.full((count, width), no_hub, dtype=np.int32)
+            for node, (hub, dist) in enumerate(zip(hubs, dists)):
+                self.label_hubs[node, :len(hub)] = hub
+                self.label_dist[node, :len(dist)] = dist
+        else:
+            raise ValueError('Unknown oracle method: {!r}'.format(method))
+
+    def nodes(self, x, y):
+        '''
+        Returns the nodes of cells (x, y), -1 for unknown cells. x and y may
+        be arrays.
+        '''
+        return self.node[np.asarray(x) * self.dim + np.asarray(y)]
+
+    def distance(self, a, b):
+        '''
+        Returns the number of moves between the cells a and b, given as
+        (x, y), or -1 if one can not be reached from the other.
+        '''
+        source = self.node_list[a[0] * self.dim + a[1]]
+        target = self.node_list[b[0] * self.dim + b[1]]
+        if source < 0 or target < 0:
+            return -1
+        if self.method == 'table':
+            distance = int(self.table[source, target])
+            return -1 if distance == unreachable else distance
+        return self.search(source, target)
+
+    def search(self, source, target):
+        '''
+        Returns the distance between two nodes from their hub labels, or -1
+        if they share no hub, which means that they are not connected.
+        '''
+        label, other = self.labels[source], self.labels[target]
+        if len(other) < len(label):
+            label, other = other, label
+        best = -1
+        for hub, dist in label.items():
+            other_dist = other.get(hub)
+            if other_dist is not None and (best < 0 or dist + other_dist < best):  # NOQA
+                best = dist + other_dist
+        return best
+
+    def distances(self, sources, targets):
+        '''
+        Batched distance(): sources and targets are arrays of (x, y) cells
+        of the same length, and the result is an int32 array of the distance
+        between each source and its target, -1 where there is no way.
+        '''
+        sources = np.asarray(sources, dtype=np.intp).reshape(-1, 2)
+        targets = np.asarray(targets, dtype=np.intp).reshape(-1, 2)
+        source = self.nodes(sources[:, 0], sources[:, 1])
+        target = self.nodes(targets[:, 0], targets[:, 1])
+        known = (source >= 0) & (target >= 0)
+        result = np.full(len(source), -1, dtype=np.int32)
+
+        if self.method == 'table':
+            found = self.table[source[known], target[known]].astype(np.int32)
+            found[found == unreachable] = -1
+            result[known] = found
+            return result
+
+        # For a batch of pairs, the label of each source is scattered into
+        # a row of a buffer indexed by hub, and the hubs of the label of its
+        # target are looked up in that row. Hubs missing from either label,
+        # and the padding, add up to no_hub or more.
+        index = np.flatnonzero(known)
+        count = len(self.cells)
+        batch = max(1, label_buffer // (count + 1))
+        buffer = np.full(batch * (count + 1), no_hub, dtype=np.int32)
+        for start in range(0, len(index), batch):
+            rows = index[start:start + batch]
+            offset = np.arange(len(rows), dtype=np.int64)[:, None] * (count + 1)  # NOQA
+            source_hubs = (self.label_hubs[source[rows]] + offset).ravel()
+            target_hubs = (self.label_hubs[target[rows]] + offset).ravel()
+            buffer[source_hubs] = self.label_dist[source[rows]].ravel()
+            sums = buffer[target_hubs] + self.label_dist[target[rows]].ravel()
+            buffer[source_hubs] = no_hub
+            best = sums.reshape(len(rows), -1).min(axis=1)
+            result[rows] = np.where(best < no_hub, best, -1)
+        return result
+
+
+if __name__ == '__main__':
+    '''
+    This script builds the distance oracle of a maze and times random
+    queries against it, e.g.
+
+        python oracle.py test_maze_01.txt --queries 1000000
+    '''
+    from maze import Maze
+
+    parser = argparse.ArgumentParser(
+        description='Cell-to-cell distance oracle of a maze.')
+    parser.add_argument('maze', help='maze text file')
+    parser.add_argument('--method', default=None,
+                        choices=['table', 'labels'],
+                        help='storage of the distances (default: by size)')
+    parser.add_argument('--queries', type=int, default=100000,
+                        help='number of random batched queries to time')
+    args = parser.parse_args()
+
+    testmaze = Maze(args.maze)
+    start = time.time()
+    oracle = DistanceOracle(testmaze.walls, args.method)
+    print("Built a {} oracle of {} cells in {:.2f}s.".format(
+        oracle.method, len(oracle.cells), time.time() - start))
+
+    rng = np.random.default_rng(0)
+    sources = rng.integers(testmaze.dim, size=(args.queries, 2))
+    targets = rng.integers(testmaze.dim, size=(args.queries, 2))
+    start = time.time()
+    result = oracle.distances(sources, targets)
+    seconds = time.time() - start
+    print("{} queries in {:.2f}s ({:.2f} us per query), mean distance {:.1f}."
+          .format(args.queries, seconds, seconds / args.queries * 1e6,
+                  result[result >= 0].mean()))
@@ -0,0 +1,81 @@
+from planning import PLANNER_VERSION
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import os
+
+
+class PlanCache(object):
+    def __init__(self, capacity=1024, directory=None):
+        '''
+        Cache of planning results keyed by a fingerprint of what the robot
+        knows about the maze. Robots that end the 1st run with the same
+        valueGrid get the same heuristic grid, policy and plan, so they can
+        share them instead of computing them again.
+
+        - capacity: number of entries kept in memory; the least recently
+            used entry is dropped when the cache is full.
+        - directory: if given, entries are also stored there as .npz files,
+            so they survive the process and can be shared between processes.
+
+        An entry is a dictionary of numpy arrays.
+        '''
+        self.capacity = capacity
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, value_grid, *options):
+        '''
+        Returns the fingerprint of a knowledge grid: a hash of its shape and
+        contents, the planner version and any options that change the
+        result, such as the planner name.
+        '''
+        grid = np.ascontiguousarray(value_grid, dtype=np.uint8)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((grid.shape, PLANNER_VERSION, options)).encode())
+        digest.update(grid.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        '''
+        Returns the entry stored under key, or None.
+        '''
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.directory is not None:
+            filename = os.path.join(self.directory, key + '.npz')
+            if os.path.exists(filename):
+                with np.load(filename) as data:
+                    entry = dict(data)
+                self.remember(key, entry)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        '''
+        Stores entry, a dictionary of numpy arrays, under key.
+        '''
+        self.remember(key, entry)
+        if self.directory is not None:
+            filename = os.path.join(self.directory, key + '.npz')
+            # write to a temporary file first, so that other processes never
+            # read a half written entry
+            temp_filename = '{}.{}.tmp.npz'.format(filename[:-4], os.getpid())
+            np.savez(temp_filename, **entry)
+            os.replace(temp_filename, filename)
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
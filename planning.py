@@ -0,0 +1,479 @@
+from maze import heading_deltas
+from collections import deque
+import numpy as np
+import heapq
+
+# Version of the planning functions below. Bump it whenever a change makes
+# them compute different results, so that cached plans are not reused.
+PLANNER_VERSION = 4
+
+
+def goal_room(maze_dim):
+    '''
+    Returns the list of the 4 central cells of the maze, the goal area.
+    '''
+    centre = [maze_dim // 2 - 1, maze_dim // 2]
+    return [(x, y) for x in centre for y in centre]
+
+
+def open_grid(value_grid):
+    '''
+    Returns a copy of value_grid as a numpy uint8 array in which the bits
+    for the openings through the outer edge of the maze are cleared, so
+    that moves out of the maze never have to be checked separately.
+    '''
+    grid = np.array(value_grid, dtype=np.uint8)
+    grid[:, -1] &= ~np.uint8(1)
+    grid[-1, :] &= ~np.uint8(2)
+    grid[:, 0] &= ~np.uint8(4)
+    grid[0, :] &= ~np.uint8(8)
+    return grid
+
+
+def flood_fill(value_grid, goal_cells, mode='queue'):
+    '''
+    Computes the number of single-cell moves from every cell to the nearest
+    goal cell. value_grid holds the known wall numbers of the cells, with 0
+    for a cell never seen; a move is taken when the cell it starts from is
+    open in that direction and the cell it ends in is known. Cells the goal
+    can not be reached from get -1. Returns an int32 array indexed [x, y].
+
+    mode selects the engine:
+    - 'queue': breadth first search with a deque over integer cell indices
+        (x * dim + y), visiting every cell at most once.
+    - 'wavefront': expands the whole frontier at once with numpy shifts,
+        one iteration per distance; faster on large open grids.
+    '''
+    grid = open_grid(value_grid)
+    if mode == 'queue':
+        return queue_flood_fill(grid, goal_cells)
+    elif mode == 'wavefront':
+        return wavefront_flood_fill(grid, goal_cells)
+    raise ValueError('Unknown flood fill mode: {!r}'.format(mode))
+
+
+def queue_flood_fill(grid, goal_cells, stop_cell=None):
+    '''
+    Breadth first flood fill of flood_fill(). grid must come from open_grid().
+
+    If stop_cell is given as (x, y), the search ends as soon as that cell is
+    reached. All cells closer to the goal than stop_cell have their distance
+    by then, which is all a robot in stop_cell needs to descend the field.
+    '''
+    dim = grid.shape[0]
+    values = grid.ravel().tolist()
+    dist = [-1] * (dim * dim)
+    settled = bytearray(dim * dim)
+
+    queue = deque()
+    for x, y in goal_cells:
+        cell = x * dim + y
+        if not settled[cell]:
+            settled[cell] = 1
+            dist[cell] = 0
+            queue.append(cell)
+
+    if stop_cell is not None:
+        stop = stop_cell[0] * dim + stop_cell[1]
+    else:
+        stop = -1
+
+    # bit of each direction and the change of cell index it makes
+    steps = ((1, 1), (2, dim), (4, -1), (8, -dim))
+    while queue:
+        cell = queue.popleft()
+        if cell == stop:
+            break
+        value = values[cell]
+        next_dist = dist[cell] + 1
+        for bit, offset in steps:
+            if value & bit:
+                neighbour = cell + offset
+                if values[neighbour] and not settled[neighbour]:
+                    settled[neighbour] = 1
+                    dist[neighbour] = next_dist
+                    queue.append(neighbour)
+
+    return np.array(dist, dtype=np.int32).reshape(dim, dim)
+
+
+def wavefront_flood_fill(grid, goal_cells):
+    '''
+    Vectorized flood fill of flood_fill(). grid must come from open_grid().
+    '''
+    dim = grid.shape[0]
+    dist = np.full((dim, dim), -1, dtype=np.int32)
+    known = grid > 0
+    frontier = np.zeros((dim, dim), dtype=bool)
+    for x, y in goal_cells:
+        frontier[x, y] = True
+    settled = frontier.copy()
+
+    distance = 0
+    while frontier.any():
+        dist[frontier] = distance
+        distance += 1
+        reached = np.zeros((dim, dim), dtype=bool)
+        # cells reached by moving up, right, down and left from the frontier
+        reached[:, 1:] |= (frontier & (grid & 1 > 0))[:, :-1]
+        reached[1:, :] |= (frontier & (grid & 2 > 0))[:-1, :]
+        reached[:, :-1] |= (frontier & (grid & 4 > 0))[:, 1:]
+        reached[:-1, :] |= (frontier & (grid & 8 > 0))[1:, :]
+        frontier = reached & known & ~settled
+        settled |= frontier
+
+    return dist
+
+
+class IncrementalFloodFill(object):
+    def __init__(self, maze_dim, goal_cells):
+        '''
+        Distance field to a set of goal cells that is kept up to date while
+        walls are discovered. Every wall not known yet is assumed to be
+        open, so the distances are a lower bound of the true distances.
+
+        - grid: wall numbers of the cells under this assumption, as a flat
+            list indexed by x * maze_dim + y.
+        - dist: number of single-cell moves from every cell to the nearest
+            goal cell, flat like grid, with -1 for cells that can not reach
+            a goal cell.
+        - wall_count: number of walls added so far, which tells users of grid
+            whether it changed.
+
+        Adding a wall only ever makes distances longer, so add_walls() only
+        repairs the cells whose shortest route ran through a new wall and
+        leaves the rest of the field alone.
+        '''
+        self.maze_dim = maze_dim
+        self.goal_cells = set(x * maze_dim + y for x, y in goal_cells)
+
+        grid = open_grid(np.full((maze_dim, maze_dim), 15, dtype=np.uint8))
+        self.grid = grid.ravel().tolist()
+        self.dist = queue_flood_fill(grid, goal_cells).ravel().tolist()
+        self.wall_count = 0
+
+        # bit of each direction, the change of cell index it makes and the
+        # bit of the opposite direction
+        self.steps = ((1, 1, 4), (2, maze_dim, 8), (4, -1, 1),
+                      (8, -maze_dim, 2))
+
+    def distance(self, x, y):
+        return self.dist[x * self.maze_dim + y]
+
+    def add_walls(self, walls):
+        '''
+        Closes every (x, y, heading) wall in walls on both of its sides and
+        repairs the distance field. Walls already known are skipped, so the
+        sensor readings of every step can be passed in as they are. Returns
+        the number of cells that had to be repaired.
+        '''
+        changed = []
+        for x, y, heading in walls:
+            bit, offset, opposite = self.steps[heading]
+            cell = x * self.maze_dim + y
+            if self.grid[cell] & bit:
+                self.grid[cell] &= ~bit
+                self.grid[cell + offset] &= ~opposite
+                changed.append(cell)
+                changed.append(cell + offset)
+                self.wall_count += 1
+
+        if not changed:
+            return 0
+        return self.repair(changed)
+
+    def repair(self, seeds):
+        '''
+        Repairs the distance field after openings next to the seed cells
+        were closed, in two phases:
+        1. Find the affected cells, in order of their old distance: a cell
+           is affected if no neighbour it is still open to, and which is not
+           affected itself, is one move closer to the goal.
+        2. Recompute the affected cells with a Dijkstra search seeded from
+           their unaffected neighbours.
+        '''
+        grid, dist, steps = self.grid, self.dist, self.steps
+
+        heap = [(dist[cell], cell) for cell in seeds if dist[cell] > 0]
+        heapq.heapify(heap)
+        checked = set()
+        affected = set()
+        while heap:
+            d, cell = heapq.heappop(heap)
+            if cell in checked or cell in self.goal_cells:
+                continue
+            checked.add(cell)
+            value = grid[cell]
+            supported = False
+            for bit, offset, _ in steps:
+                if value & bit:
+                    neighbour = cell + offset
+                    if dist[neighbour] == d - 1 and neighbour not in affected:
+                        supported = True
+                        break
+            if not supported:
+                affected.add(cell)
+                for bit, offset, _ in steps:
+                    if value & bit and dist[cell + offset] == d + 1:
+                        heapq.heappush(heap, (d + 1, cell + offset))
+
+        for cell in affected:
+            dist[cell] = -1
+        for cell in affected:
+            value = grid[cell]
+            best = -1
+            for bit, offset, _ in steps:
+                if value & bit:
+                    d = dist[cell + offset]
+                    if d >= 0 and (best < 0 or d < best):
+                        best = d
+            if best >= 0:
+                heap.append((best + 1, cell))
+        heapq.heapify(heap)
+
+        while heap:
+            d, cell = heapq.heappop(heap)
+            if dist[cell] >= 0:
+                continue
+            dist[cell] = d
+            value = grid[cell]
+            for bit, offset, _ in steps:
+                if value & bit:
+                    neighbour = cell + offset
+                    if neighbour in affected and dist[neighbour] < 0:
+                        heapq.heappush(heap, (d + 1, neighbour))
+
+        return len(affected)
+
+
+def step_distances(value_grid, goal_cells):
+    '''
+    Computes the smallest number of simulator steps from every (cell,
+    heading) state to a step that ends in a goal cell. A step is a rotation
+    of -90, 0 or +90 degrees followed by a movement of up to 3 cells forward
+    or backward, so a long straight corridor costs one step per 3 cells and
+    every turn costs a step. Moves only cross openings of value_grid between
+    known cells, as in flood_fill().
+
+    The search runs backwards from the goal states over the state graph
+    with a breadth first search, since every step costs the same. Returns
+    an int32 array indexed [x, y, heading], with -1 for states the goal can
+    not be reached from.
+    '''
+    grid = open_grid(value_grid)
+    dim = grid.shape[0]
+    values = grid.ravel().tolist()
+    dist = [-1] * (4 * dim * dim)
+
+    queue = deque()
+    for x, y in goal_cells:
+        for heading in range(4):
+            state = (x * dim + y) * 4 + heading
+            if dist[state] < 0:
+                dist[state] = 0
+                queue.append(state)
+
+    offsets = (1, dim, -1, -dim)
+    while queue:
+        state = queue.popleft()
+        next_dist = dist[state] + 1
+        cell, heading = divmod(state, 4)
+        offset = offsets[heading]
+        bit = 1 << heading
+        opposite = 1 << ((heading + 2) % 4)
+
+        # cells from which a step along this heading ends in cell: cell
+        # itself (rotation only), cells behind it (forward movement) and
+        # cells ahead of it (backward movement)
+        origins = [cell]
+        origin = cell
+        for _ in range(3):
+            if not (values[origin] & opposite and
+                    values[origin - offset] & bit):
+                break
+            origin -= offset
+            origins.append(origin)
+        origin = cell
+        for _ in range(3):
+            if not (values[origin] & bit and
+                    values[origin + offset] & opposite):
+                break
+            origin += offset
+            origins.append(origin)
+
+        for origin in origins:
+            for previous in ((heading + 3) % 4, heading, (heading + 1) % 4):
+                if origin == cell and previous == heading:
+                    continue
+                prev_state = origin * 4 + previous
+                if dist[prev_state] < 0:
+                    dist[prev_state] = next_dist
+                    queue.append(prev_state)
+
+    return np.array(dist, dtype=np.int32).reshape(dim, dim, 4)
+
+
+def plan_steps(value_grid, goal_cells, start=(0, 0), heading=0,
+               distances=None):
+    '''
+    Returns the shortest list of (rotation, movement) steps that takes a
+    robot in cell start with the given integer heading to a goal cell, or
+    None if the goal can not be reached over the known cells. distances can
+    be passed in if step_distances() was already computed for the goal.
+    Among equally short plans, longer forward movements are preferred.
+    '''
+    if distances is None:
+        distances = step_distances(value_grid, goal_cells)
+    grid = open_grid(value_grid)
+    dim = grid.shape[0]
+
+    x, y = start
+    if distances[x, y, heading] < 0:
+        return None
+
+    plan = []
+    while distances[x, y, heading] > 0:
+        rotation, movement, x, y, heading = next_step(grid, distances, x, y,
+                                                      heading)
+        plan.append((rotation, movement))
+
+    return plan
+
+
+def next_step(grid, distances, x, y, heading):
+    '''
+    Returns the first step of a shortest plan from cell (x, y) with the
+    given integer heading as (rotation, movement, new_x, new_y, new_heading),
+    or None in a goal cell or a state the goal can not be reached from.
+    grid must come from open_grid() and distances from step_distances().
+    '''
+    if distances[x, y, heading] <= 0:
+        return None
+    target = distances[x, y, heading] - 1
+    for rotation, new_heading in ((0, heading),
+                                  (-90, (heading + 3) % 4),
+                                  (90, (heading + 1) % 4)):
+        step = next_state(grid, distances, x, y, new_heading, target)
+        if step is not None:
+            movement, new_x, new_y = step
+            return rotation, movement, new_x, new_y, new_heading
+    return None
+
+
+def next_state(grid, distances, x, y, heading, target):
+    '''
+    Helper of next_step(): looks for a movement along heading from (x, y)
+    that ends in a state at the target distance, trying 3, 2, 1 cells
+    forward, no movement and 1, 2, 3 cells backward. Returns (movement,
+    new_x, new_y) or None.
+    '''
+    dx, dy = heading_deltas[heading]
+    bit = 1 << heading
+    opposite = 1 << ((heading + 2) % 4)
+
+    # cells reachable forward and backward, in order of distance
+    ahead = []
+    cx, cy = x, y
+    while len(ahead) < 3 and grid[cx, cy] & bit:
+        cx, cy = cx + dx, cy + dy
+        ahead.append((cx, cy))
+    behind = []
+    cx, cy = x, y
+    while len(behind) < 3 and grid[cx, cy] & opposite:
+        cx, cy = cx - dx, cy - dy
+        behind.append((cx, cy))
+
+    candidates = [(k + 1, cell) for k, cell in enumerate(ahead)][::-1]
+    candidates.append((0, (x, y)))
+    candidates += [(-k - 1, cell) for k, cell in enumerate(behind)]
+    for movement, (cx, cy) in candidates:
+        if distances[cx, cy, heading] == target:
+            return movement, cx, cy
+    return None
+
+
+class GoalPlanner(object):
+    def __init__(self, value_grid):
+        '''
+        Answers distance and action queries against any number of goals in
+        one maze. value_grid holds the known wall numbers of the cells, as
+        for flood_fill(); the walls of a whole maze (Maze.walls) work too.
+
+        A goal is a named set of cells, added with add_goal(). The distance
+        fields of a goal are computed once, with a single search from all
+        its cells, and kept in goal_sets:
+        - cells: the goal cells, as a list of (x, y).
+        - moves: single-cell moves from every cell to the nearest goal cell,
+            as returned by flood_fill().
+        - steps: simulator steps from every (cell, heading) state to the
+            goal, as returned by step_distances().
+
+        After that, every query about the goal is a table lookup, or a few
+        of them for next_action() and plan().
+        '''
+        self.value_grid = np.array(value_grid, dtype=np.uint8)
+        self.grid = open_grid(self.value_grid)
+        self.goal_sets = {}
+
+    def add_goal(self, name, goal_cells):
+        '''
+        Registers the cells goal_cells as the goal called name, replacing
+        any goal of that name, and computes its distance fields.
+        '''
+        goal_cells = [(int(x), int(y)) for x, y in goal_cells]
+        if not goal_cells:
+            raise Exception('A goal needs at least one cell!')
+        self.goal_sets[name] = {
+            'cells': goal_cells,
+            'moves': flood_fill(self.value_grid, goal_cells),
+            'steps': step_distances(self.value_grid, goal_cells)}
+
+    def moves(self, name, x, y):
+        '''
+        Returns the number of single-cell moves from cell (x, y) to the goal
+        name, or -1 if it can not be reached. x and y may also be arrays of
+        cells, which get an array of distances.
+        '''
+        return self.goal_sets[name]['moves'][x, y]
+
+    def steps(self, name, x, y, heading):
+        '''
+        Returns the number of simulator steps from cell (x, y) with the
+        given integer heading to the goal name, or -1 if it can not be
+        reached. As with moves(), the arguments may be arrays.
+        '''
+        return self.goal_sets[name]['steps'][x, y, heading]
+
+    def next_action(self, name, x, y, heading):
+        '''
+        Returns the (rotation, movement) that starts a shortest plan from
+        cell (x, y) with the given integer heading to the goal name, or None
+        in a goal cell or where the goal can not be reached.
+        '''
+        step = next_step(self.grid, self.goal_sets[name]['steps'], x, y,
+                         heading)
+        if step is None:
+            return None
+        return step[:2]
+
+    def plan(self, name, start=(0, 0), heading=0):
+        '''
+        Returns the shortest list of (rotation, movement) steps from cell
+        start with the given integer heading to the goal name, or None if it
+        can not be reached.
+        '''
+        return plan_steps(self.value_grid, None, start, heading,
+                          self.goal_sets[name]['steps'])
+
+    def closest_goal(self, x, y, heading):
+        '''
+        Returns (name, steps) of the registered goal with the fewest steps
+        from cell (x, y) with the given integer heading, or None if no goal
+        can be reached.
+        '''
+        best = None
+        for name, goal in self.goal_sets.items():
+            steps = int(goal['steps'][x, y, heading])
+            if steps >= 0 and (best is None or steps < best[1]):
+                best = (name, steps)
+        return best
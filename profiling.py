@@ -0,0 +1,182 @@
+import numpy as np
+import argparse
+import time
+
+
+class Phase(object):
+    '''
+    Context manager timing one call of a named phase, see Profiler.phase().
+    '''
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        # [name, start time, time spent in nested phases]
+        self.profiler.stack.append([self.name, time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        profiler = self.profiler
+        name, start, children = profiler.stack.pop()
+        duration = end - start
+        path = tuple(frame[0] for frame in profiler.stack) + (name,)
+        if path not in profiler.durations:
+            profiler.durations[path] = []
+            profiler.self_times[path] = 0.0
+        profiler.durations[path].append(duration)
+        profiler.self_times[path] += duration - children
+        if profiler.stack:
+            profiler.stack[-1][2] += duration
+        return False
+
+
+class Profiler(object):
+    def __init__(self):
+        '''
+        Records the time spent in named phases of the robot and the
+        simulator. Phases nest: a phase started inside another one is
+        recorded under the path of all enclosing phases, e.g.
+        ('run', 'next_move', 'finishExploration', 'calculateHeuGrid').
+
+        - durations: duration in seconds of every call, per path.
+        - self_times: total time per path not spent in nested phases.
+
+        Pass a profiler to Robot and Simulator as their profiler argument,
+        and they have their main methods timed with instrument(). Other
+        code can time a block with
+
+            with profiler.phase('name'):
+                ...
+
+        Nothing is timed without a profiler, so profiling costs nothing
+        when it is not used.
+        '''
+        self.durations = {}
+        self.self_times = {}
+        self.stack = []
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def wrap(self, name, function):
+        '''
+        Returns function timed as the phase name.
+        '''
+        def timed(*args, **kwargs):
+            with Phase(self, name):
+                return function(*args, **kwargs)
+        return timed
+
+    def instrument(self, obj, names):
+        '''
+        Replaces the methods names of the object obj, for this object only,
+        by timed versions; the phases are named after the methods. Calls of
+        the methods from within the object's other methods are timed too.
+        '''
+        for name in names:
+            setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+    def merge(self, other):
+        '''
+        Adds the timings recorded by another profiler to this one.
+        '''
+        for path, durations in other.durations.items():
+            if path not in self.durations:
+                self.durations[path] = []
+                self.self_times[path] = 0.0
+            self.durations[path].extend(durations)
+            self.self_times[path] += other.self_times[path]
+
+    def stats(self):
+        '''
+        Returns the call count and the total, mean, median, 90th and 99th
+        percentile and maximum duration in seconds of every phase path, as
+        a dictionary keyed by the path joined with '/'.
+        '''
+        stats = {}
+        for path, durations in self.durations.items():
+            durations = np.array(durations)
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            stats['/'.join(path)] = {'count': len(durations),
+                                     'total': durations.sum(),
+                                     'self': self.self_times[path],
+                                     'mean': durations.mean(),
+                                     'p50': p50, 'p90': p90, 'p99': p99,
+                                     'max': durations.max()}
+        return stats
+
+    def report(self):
+        '''
+        Returns the statistics of every phase as a text table, phases with
+        the most total time first. Times are in milliseconds, except the
+        percentiles, which are in microseconds.
+        '''
+        stats = self.stats()
+        lines = ['{:<60} {:>8} {:>10} {:>10} {:>8} {:>8} {:>8}'.format(
+            'phase', 'calls', 'total ms', 'self ms', 'p50 us', 'p90 us',
+            'p99 us')]
+        for path in sorted(stats, key=lambda path: -stats[path]['total']):
+            s = stats[path]
+            lines.append('{:<60} {:>8} {:>10.1f} {:>10.1f} {:>8.1f} {:>8.1f} {:>8.1f}'.format(  # NOQA
+                path, s['count'], s['total'] * 1e3, s['self'] * 1e3,
+                s['p50'] * 1e6, s['p90'] * 1e6, s['p99'] * 1e6))
+        return '\n'.join(lines)
+
+    def write_collapsed(self, filename):
+        '''
+        Writes the self time of every phase path in microseconds in the
+        collapsed stack format read by flamegraph.pl, speedscope and similar
+        tools: one 'outer;inner;phase count' line per path.
+        '''
+        with open(filename, 'w') as f_out:
+            for path in sorted(self.self_times):
+                micros = int(round(self.self_times[path] * 1e6))
+                f_out.write('{} {}\n'.format(';'.join(path), micros))
+
+
+if __name__ == '__main__':
+    '''
+    This script profiles the robot on a maze over a number of seeds and
+    prints the time spent in every phase, e.g.
+
+        python profiling.py test_maze_01.txt --seeds 20 --flamegraph out.txt
+    '''
+    from maze import Maze
+    from robot import Robot
+    from simulator import Simulator, time_budget
+
+    parser = argparse.ArgumentParser(
+        description='Per-phase timing of robot.py and the simulator.')
+    parser.add_argument('maze', help='maze text file')
+    parser.add_argument('--seeds', type=int, default=10,
+                        help='number of seeds to run, counted from 0')
+    parser.add_argument('--explore', default='random',
+                        choices=['random', 'flood', 'frontier'],
+                        help='exploration strategy of the robot in run 1')
+    parser.add_argument('--planner', default='policy',
+                        choices=['policy', 'steps', 'corridor'],
+                        help='how the robot plans its way in run 2')
+    parser.add_argument('--flamegraph', default=None,
+                        help='file to write collapsed stacks to')
+    args = parser.parse_args()
+
+    testmaze = Maze(args.maze)
+    profiler = Profiler()
+    max_time = time_budget(testmaze.dim)
+    simulator = Simulator(max_time, profiler=profiler)
+    for seed in range(args.seeds):
+        testrobot = Robot(testmaze.dim, seed=seed, explore=args.explore,
+                          planner=args.planner, profiler=profiler,
+                          max_time=max_time)
+        try:
+            simulator.run(testmaze, testrobot)
+        except Exception as e:
+            print("Seed {} failed: {}: {}".format(seed, type(e).__name__, e))
+
+    print(profiler.report())
+    if args.flamegraph is not None:
+        profiler.write_collapsed(args.flamegraph)
@@ -1,19 +1,139 @@
+from maze import UP, RIGHT, DOWN, LEFT, heading_index, heading_deltas
+from planning import flood_fill, goal_room, queue_flood_fill, open_grid
+from planning import IncrementalFloodFill, plan_steps
+from corridor import corridor_plan
 import numpy as np
+import hashlib
 import random
 
+
+def robot_rng(seed):
+    '''
+    Returns the random generator of a robot run with seed: a random.Random
+    seeded from a numpy SeedSequence of seed, so that the streams of
+    neighbouring seeds, such as those of the episodes of a tournament, are
+    independent. seed may also be a tuple of integers, e.g. (maze, seed).
+    '''
+    state = np.random.SeedSequence(seed).generate_state(4)
+    return random.Random(int.from_bytes(state.tobytes(), 'little'))
+
 class Robot(object):
-    def __init__(self, maze_dim):
+    # Version of the robot's own end-of-run planning: fixMissingCellValue(),
+    # calculatePolicyGrid() and the rest of finishExploration(). It is part
+    # of every plan cache key, next to planning.PLANNER_VERSION; bump it
+    # whenever a change to these methods makes them compute different grids
+    # or plans, so that cached plans are not reused.
+    plan_version = 2
+
+    # Methods timed by a profiler, see profiling.Profiler.instrument()
+    profiled_phases = ['next_move', 'updateCellValue', 'updateFloodFields',
+                       'updateKnownSides', 'calculateRouteBounds',
+                       'calculateFrontierDist', 'calculateAllowedActions',
+                       'calculatePreferedActions', 'calculateFloodAction',
+                       'followPlan', 'followPolicy', 'checkKnowledge',
+                       'checkKnowledgeMove', 'followKnowledge',
+                       'finishExploration', 'fixMissingCellValue',
+                       'calculateHeuGrid', 'calculatePolicyGrid',
+                       'calculateCorridorPlan', 'calculateArrows']
+
+    def __init__(self, maze_dim, sink=None, flood_mode='queue',
+                 explore='random', planner='policy', cache=None,
+                 profiler=None, max_time=1000, goal_cells=None, seed=None,
+                 rng=None, knowledge=None):
         '''
         Use the initialization function to set up attributes that your robot
         will use to learn and navigate the maze. Some initial attributes are
         provided based on common information, including the size of the maze
         the robot is placed in.
+
+        The robot is silent unless an event sink (see events.py) is given,
+        in which case it emits an event for every step it takes and for the
+        grids it computes at the end of the 1st run.
+
+        flood_mode selects the flood fill engine used for the heuristic
+        grid, 'queue' or 'wavefront' (see planning.flood_fill).
+
+        explore selects how the robot explores in the 1st run:
+        - 'random': move to a random unvisited cell in sight, or to a random
+            cell if all of them are visited.
+        - 'flood': follow a distance field to the goal area that assumes
+            unknown walls are open and is repaired as walls are seen. Once
+            the goal is found, visit the cells that could still lie on a
+            shortest route from the start, and end the run when none is left.
+        - 'frontier': explore like 'flood', but also keep a pessimistic
+            distance from the start to the goal over the openings seen so
+            far, where unknown walls count as walls. The run ends as soon as
+            the optimistic and the pessimistic distance agree, since then
+            the shortest route is proven, and cells whose four sides the
+            sensors have seen count as explored without a visit.
+
+        planner selects how the robot moves in the 2nd run:
+        - 'policy': follow the arrows of policyGrid, moving up to 3 cells
+            when consecutive arrows agree.
+        - 'steps': follow a plan with the fewest simulator steps, which
+            accounts for turns and 3-cell moves (see planning.plan_steps).
+            The robot falls back to the policy if no plan is found.
+        - 'corridor': follow the arrows of a policy computed on the maze
+            with its corridors collapsed into single edges (see
+            corridor.CorridorGraph), preferring fewer turns among routes of
+            the same length.
+
+        cache is an optional plancache.PlanCache. Robots sharing a cache
+        reuse the grids and plan computed at the end of the 1st run
+        whenever they end it with the same knowledge of the maze.
+
+        profiler is an optional profiling.Profiler, which is given the time
+        spent in next_move() and in each of the steps listed in
+        profiled_phases. Without it, the robot runs untouched.
+
+        max_time is the number of time steps the robot is given for both
+        runs. The robot ends the 1st run after 90% of it, if it has found
+        the goal by then.
+
+        goal_cells is the list of (x, y) cells the robot has to reach, the
+        central 2x2 goal area by default. The robot plans to the nearest of
+        them, so any set of cells works; the simulator must be given the same
+        cells.
+
+        The random choices of the robot come from rng, a random.Random, or
+        from robot_rng(seed) if a seed is given instead, so that a robot
+        with the same seed in the same maze always takes the same way, no
+        matter what else runs in the process. Without either, the robot uses
+        the module-level random generator, as it always has.
+
+        knowledge is an optional knowledge.KnowledgeSnapshot of the same
+        maze, saved by an earlier robot at the end of its 1st run (see
+        knowledge.save_knowledge). The robot then starts out with its grids
+        and plan, and spends its 1st run driving the planned route to the
+        goal instead of exploring, checking every sensor reading against
+        the walls it expects. If a reading does not match, the maze is not
+        the one the snapshot was taken in, so the robot forgets the
+        snapshot and explores as usual. Without goal_cells, the robot takes
+        the goal cells of the snapshot.
         '''
+        self.sink = sink
+        if profiler is not None:
+            profiler.instrument(self, self.profiled_phases)
+        self.flood_mode = flood_mode
+        self.explore = explore
+        self.planner = planner
+        self.cache = cache
+        if rng is None and seed is not None:
+            rng = robot_rng(seed)
+        self.rng = random if rng is None else rng
 
         self.location = [0, 0]
         self.heading = 'u'
         self.maze_dim = maze_dim
 
+        # The goal cells as a list of (x, y) and as a set for lookups
+        if goal_cells is None and knowledge is not None:
+            goal_cells = knowledge.goal_cells
+        if goal_cells is None:
+            goal_cells = goal_room(maze_dim)
+        self.goalCells = [(int(x), int(y)) for x, y in goal_cells]
+        self.goalSet = set(self.goalCells)
+
         self.dir_sensors = {'u': ['l', 'u', 'r'],
                             'r': ['u', 'r', 'd'],
                             'd': ['r', 'd', 'l'],
@@ -41,42 +161,50 @@ class Robot(object):
                             'down': 'u',
                             'left': 'r'}
 
-        self.dir_arrow = {'u': '^',
-                          'r': '>',
-                          'd': 'v',
-                          'l': '<',
-                          '-': '-'}
+        # Arrows and names of the policies stored in policyGrid, indexed by
+        # the policy value; the last entry is for cells without policy (-1)
+        self.dir_arrow = np.array(['^', '>', 'v', '<', '-'])
+        self.policy_names = 'urdl-'
 
         self.findGoal = False
 
         self.visits = 1
 
+        # All the grids below are numpy arrays indexed [x, y]. Heuristic
+        # values need more than 16 bits only on very large mazes.
+        grid_shape = (self.maze_dim, self.maze_dim)
+        if self.maze_dim * self.maze_dim < 2**15:
+            heu_dtype = np.int16
+        else:
+            heu_dtype = np.int32
+
         # This 2D array is used to identify if a cell is visited
         # The value 0 means unvisited and 1 means visited, initially everycell is unvisited  # NOQA
-        self.visitedGrid = [[0 for row in range(self.maze_dim)] for col in range(self.maze_dim)]  # NOQA
-        self.visitedGrid[0][0] = 1
+        self.visitedGrid = np.zeros(grid_shape, dtype=np.uint8)
+        self.visitedGrid[0, 0] = 1
 
         # This 2D array is used to record the permissibility of each cell
         # For example, if the value for a cell is 1, that means the cell is only open on the top,  # NOQA
         # and close on the other 3 sides. Initially, value of every cell is -1 to indicate unknown  # NOQA
-        self.valueGrid = [[0 for row in range(self.maze_dim)] for col in range(self.maze_dim)]  # NOQA
-        self.valueGrid[0][0] = 1
+        self.valueGrid = np.zeros(grid_shape, dtype=np.uint8)
+        self.valueGrid[0, 0] = 1
 
         # This 2D array is used to record the heuristic for each cell
         # The heuristic is a value for shorest movement from this cell to goal
         # Initially, every cell has a heuristic value of -1 to indicate unkonw
-        self.heuGrid = [[-1 for row in range(self.maze_dim)] for col in range(self.maze_dim)]  # NOQA
+        self.heuGrid = np.full(grid_shape, -1, dtype=heu_dtype)
 
         # This 2D array is used to record the policy for each cell
-        # The policy of each cell is a char: 'u', 'r', 'd', 'l',
-        # and can be interpreted as an arrow for the robot in the cell
-        # to move closer to the goal area. Initially they are set to '-'
-        self.policyGrid = [['-' for row in range(self.maze_dim)] for col in range(self.maze_dim)]
+        # The policy of each cell is an integer heading: 0 (up), 1 (right),
+        # 2 (down) or 3 (left), and can be interpreted as an arrow for the
+        # robot in the cell to move closer to the goal area. Initially they
+        # are set to -1, meaning no policy
+        self.policyGrid = np.full(grid_shape, -1, dtype=np.int8)
 
         # This 2D array is used to store the arrow of policy for each cell,
         # based on the policyGrid, so that the policy can be more easily
         # understood. Initially each cell in the arrowGrid is set to '-'
-        self.arrowGrid = [['-' for row in range(self.maze_dim)] for col in range(self.maze_dim)]
+        self.arrowGrid = np.full(grid_shape, '-')
 
         # This dictionary will be referenced in the updateCellValue() function,
         # If means different numeric values (accounting for permissibility)
@@ -84,9 +212,223 @@ class Robot(object):
         self.dir_value = {'u': 1, 'r': 2, 'd': 4, 'l': 8}
 
         self.step = 1
+        self.finishStep = max_time * 9 // 10
 
         self.run_2 = False
 
+        # The list of (rotation, movement) steps of the 2nd run, if the
+        # 'steps' planner found one
+        self.actionPlan = None
+
+        # Distance fields of the 'flood' exploration, to the goal area and
+        # to the start cell, and the distances to the cells that are left to
+        # explore once the goal is found (flat lists indexed x * dim + y)
+        if self.explore in ('flood', 'frontier'):
+            self.goalField = IncrementalFloodFill(self.maze_dim, self.goalCells)
+            self.startField = IncrementalFloodFill(self.maze_dim, [(0, 0)])
+            self.frontierDist = None
+            self.frontierKey = None
+            # cells that need no more exploring: the visited cells for
+            # 'flood', and the cells with four known sides for 'frontier'
+            self.exploredGrid = self.visitedGrid
+
+        # The 'frontier' exploration also records what the sensors have
+        # proven about every side of every cell: openGrid holds the sides
+        # known to be open and knownGrid the sides known to be open or
+        # closed, both as 4-bit numbers like valueGrid. The outer edge of
+        # the maze is known from the start. routeBounds is the optimistic
+        # and pessimistic number of moves from the start to the goal.
+        if self.explore == 'frontier':
+            self.openGrid = np.zeros(grid_shape, dtype=np.uint8)
+            self.knownGrid = np.zeros(grid_shape, dtype=np.uint8)
+            self.knownGrid[:, -1] |= 1
+            self.knownGrid[-1, :] |= 2
+            self.knownGrid[:, 0] |= 4
+            self.knownGrid[0, :] |= 8
+            self.exploredGrid = np.zeros(grid_shape, dtype=np.uint8)
+            self.openCount = 0
+            self.openKey = -1
+            self.routeBounds = (0, -1)
+
+        # With a knowledge snapshot, the 1st run follows its plan to the
+        # goal. knowledgePlan keeps a copy of the plan of the 2nd run, which
+        # is used up as the robot follows it, to restart it from and to save
+        # it with the robot's knowledge
+        self.warmStart = False
+        self.knowledgePlan = None
+        self.checkedGrid = None
+        if knowledge is not None:
+            self.loadKnowledge(knowledge)
+
+    def loadKnowledge(self, knowledge):
+        '''
+        Copies the grids and plan of a knowledge snapshot into the robot,
+        which then warm-starts (see __init__). The snapshot must be of a maze
+        of the same size, for the same goal cells and planner, and taken
+        after the robot had finished exploring.
+        '''
+        if knowledge.dim != self.maze_dim:
+            raise Exception('Knowledge of a {0}x{0} maze can not be used in a {1}x{1} maze!'.format(knowledge.dim, self.maze_dim))  # NOQA
+        if sorted(knowledge.goal_cells) != sorted(self.goalCells):
+            raise Exception('Knowledge was planned for other goal cells!')
+        if not knowledge.explored:
+            raise Exception('Knowledge has no plan for the 2nd run!')
+        if knowledge.metadata['planner'] != self.planner:
+            raise Exception("Knowledge was planned by the '{}' planner, not '{}'!".format(knowledge.metadata['planner'], self.planner))  # NOQA
+
+        for name in ('valueGrid', 'visitedGrid', 'heuGrid', 'policyGrid'):
+            getattr(self, name)[:] = knowledge.arrays[name]
+        if 'actionPlan' in knowledge.arrays:
+            self.knowledgePlan = [tuple(step) for step in knowledge.arrays['actionPlan'].tolist()]  # NOQA
+            self.actionPlan = list(self.knowledgePlan)
+        self.visits = int(self.visitedGrid.sum())
+        self.calculateArrows()
+        # sides of every cell the sensors have shown to be open during the
+        # warm start, as 4-bit numbers like valueGrid
+        self.checkedGrid = np.zeros_like(self.valueGrid)
+        self.warmStart = True
+
+    def forgetKnowledge(self, sensors):
+        '''
+        Drops the knowledge of a warm start, after a sensor reading showed
+        that the maze is not the one it was taken in. The robot keeps its
+        location and the steps it took, and explores from there on.
+
+        The robot's cell is rebuilt from the sensors like updateCellValue()
+        does, but the side behind the robot is only kept open if checkedGrid
+        holds it: after a backward move or a rotation the robot did not
+        enter the cell from behind.
+        '''
+        x, y = self.location
+        checked = int(self.checkedGrid[x, y])
+        self.valueGrid[:] = 0
+        self.valueGrid[0, 0] = 1
+        self.visitedGrid[:] = 0
+        self.visitedGrid[0, 0] = 1
+        self.heuGrid[:] = -1
+        self.policyGrid[:] = -1
+        self.arrowGrid = np.full(self.valueGrid.shape, '-')
+        self.visits = 1
+        self.actionPlan = None
+        self.knowledgePlan = None
+        self.checkedGrid = None
+        self.warmStart = False
+
+        if not self.visitedGrid[x, y]:
+            self.updateCellValue(self.location, self.heading, sensors)
+            behind = self.dir_value[self.dir_reverse[self.heading]]
+            if not checked & behind:
+                self.valueGrid[x, y] -= behind
+            self.visitedGrid[x, y] = 1
+            self.visits += 1
+
+    def checkKnowledge(self, location, heading, sensors):
+        '''
+        Checks the sensor readings of a warm start against valueGrid. Along
+        each sensor, every opening the knowledge holds must be there, and a
+        sensor must see exactly up to the wall where the knowledge ends at
+        a wall of a visited cell. Returns False if a reading contradicts the
+        knowledge.
+
+        The sides the sensors see open are recorded in checkedGrid, from
+        both of the cells they join, see checkKnowledgeMove().
+        '''
+        x, y = location
+        for direction, distance in zip(self.dir_sensors[heading], sensors):
+            dx, dy = self.dir_move[direction]
+            bit = self.dir_value[direction]
+            cx, cy = x, y
+            count = 0
+            # count the cells the knowledge says the sensor sees past
+            while self.valueGrid[cx, cy] & bit:
+                cx, cy = cx + dx, cy + dy
+                count += 1
+            if distance < count:
+                return False
+            if distance > count and self.visitedGrid[cx, cy]:
+                return False
+            for i in range(distance):
+                self.checkedGrid[x + dx * i, y + dy * i] |= bit
+                self.checkedGrid[x + dx * (i + 1), y + dy * (i + 1)] |= self.dir_value[self.dir_reverse[direction]]  # NOQA
+        return True
+
+    def checkKnowledgeMove(self):
+        '''
+        Returns whether the sensors have shown every side that the next step
+        of a warm start moves through to be open. The sensors never see
+        behind the robot, so a backward move of a plan can lead through
+        sides that were never checked.
+        '''
+        x, y = self.location
+        heading = heading_index[self.heading]
+        if self.actionPlan:
+            rotation, movement = self.actionPlan[0]
+        else:
+            policy = self.policyGrid[x, y]
+            if policy < 0:
+                return False
+            rotation = self.calculateRotation(
+                self.heading, [self.policy_names[policy], 1])
+            # the policy moves up to 3 cells while the arrows agree, see
+            # followPolicy()
+            dx, dy = heading_deltas[policy]
+            movement = 1
+            while (movement < 3 and
+                   0 <= x + dx * movement < self.maze_dim and
+                   0 <= y + dy * movement < self.maze_dim and
+                   self.policyGrid[x + dx * movement, y + dy * movement] == policy):  # NOQA
+                movement += 1
+
+        if rotation == -90:
+            heading = (heading + 3) % 4
+        elif rotation == 90:
+            heading = (heading + 1) % 4
+        if movement < 0:
+            heading = (heading + 2) % 4
+        dx, dy = heading_deltas[heading]
+        for i in range(abs(movement)):
+            if not self.checkedGrid[x + dx * i, y + dy * i] & (1 << heading):
+                return False
+        return True
+
+    def followKnowledge(self, sensors):
+        '''
+        This function is used in the 1st run of a warm start. It follows the
+        plan of the knowledge snapshot towards the goal, and once there,
+        resets the robot for the 2nd run, which follows the same plan again.
+
+        If the next step would move through a side the sensors have not
+        shown to be open, the robot forgets the knowledge instead and
+        returns None, and next_move() explores from here.
+        '''
+        if tuple(self.location) in self.goalSet:
+            self.findGoal = True
+            self.actionPlan = None
+            if self.knowledgePlan is not None:
+                self.actionPlan = list(self.knowledgePlan)
+
+            if self.sink is not None:
+                self.sink.emit('plan', visitedGrid=self.visitedGrid,
+                               valueGrid=self.valueGrid,
+                               heuGrid=self.heuGrid,
+                               arrowGrid=self.arrowGrid)
+
+            self.location = [0, 0]
+            self.heading = 'u'
+            self.run_2 = True
+            return 'Reset', 'Reset'
+
+        if not self.checkKnowledgeMove():
+            self.forgetKnowledge(sensors)
+            return None
+
+        if self.actionPlan:
+            rotation, movement = self.followPlan()
+        else:
+            rotation, movement = self.followPolicy()
+        self.step += 1
+        return rotation, movement
+
     def updateCellValue(self, location, heading, sensors):
         '''
         This function is used in the first (exploratory) run.
@@ -122,7 +464,7 @@ class Robot(object):
 
         # Finally update this cellValue to valueGrid
         x, y = location
-        self.valueGrid[x][y] = cellValue
+        self.valueGrid[x, y] = cellValue
 
     def fixMissingCellValue(self):
         '''
@@ -130,66 +472,42 @@ class Robot(object):
         The function will modify the self.valueGrid, in particular for each
         cell our robot never visited in the 1st run, it tries to calculate the
         value for that cell, if all the adjacent cell of that cell is visited.
+
+        Each side of such a cell is open exactly when its neighbour is open
+        towards it, and the outer edge of the maze counts as a wall. The four
+        sides of all cells are read from shifted views of the whole grid at
+        once. A cell filled this way can not be the neighbour another cell is
+        filled from, since that cell would have to be known first, so one
+        pass over the grid is enough.
         '''
-        for x in range(self.maze_dim):
-            for y in range(self.maze_dim):
-
-                if self.valueGrid[x][y] == 0:
-                    # 0 is initial value for every cell in self.valueGrid,
-                    # so if the cell value is still 0 now,
-                    # it means this cell is never unvisited in the 1st run
-
-                    if y+1 == self.maze_dim:  # if this cell is exactly on the top boundary of maze
-                        cellValue_top = 0  # obviously, this cell has wall on the top side
-                    elif self.valueGrid[x][y+1] > 0:  # if there is a visited cell on the top side of this cell
-                        cellValue_top = (self.valueGrid[x][y+1] & 4 != 0) * 1
-                    else:
-                        # unfortunately, the cell on the top side of this cell is also unvisited
-                        # no need to calculate value for this cell
-                        break
-
-                    if x+1 == self.maze_dim:  # if this cell is exactly on the right boundary of maze
-                        cellValue_right = 0  # obviously, this cell has wall on the right side
-                    elif self.valueGrid[x+1][y] > 0:  # if there is a visited cell on the right side of this cell
-                        cellValue_right = (self.valueGrid[x+1][y] & 8 != 0) * 2
-                    else:
-                        # unfortunately, the cell on the right side is also unvisited
-                        break
-
-                    if y-1 == -1:  # if this cell is exactly on the bottom boundary of maze
-                        cellValue_bottom = 0  # obviously, this cell has wall on the bottom side
-                    elif self.valueGrid[x][y-1] > 0:  # if there is a visited cell on the bottom side of this cell
-                        cellValue_bottom = (self.valueGrid[x][y-1] & 1 != 0) * 4
-                    else:
-                        # unfortunately, the cell on the bottom side is also unvisited
-                        break
-
-                    if x-1 == -1:  # if this cell is exactly on the left boundary of maze
-                        cellValue_left = 0  # obviously, this cell has wall on the left side
-                    elif self.valueGrid[x-1][y] > 0:  # if there is a visited cell on the left side of this cell
-                        cellValue_left = (self.valueGrid[x-1][y] & 2 != 0) * 8
-                    else:
-                        # unfortunately, the cell on the left side is also unvisited
-                        break
-
-                    # if we reach this sentence, we have got all valid values
-                    # for top, right, bottom and left side for this cell
-                    cellValue = cellValue_top + cellValue_right + cellValue_bottom + cellValue_left
-
-                    # assign this value to this unvisited cell
-                    self.valueGrid[x][y] = cellValue
+        grid = self.valueGrid
+        dim = self.maze_dim
+
+        # For each side of every cell, whether the side is known (the cell
+        # on that side is visited, or it is the outer edge of the maze), and
+        # the bit of the side if the cell on that side is open towards it
+        known = np.ones((4, dim, dim), dtype=bool)
+        side_bits = np.zeros((4, dim, dim), dtype=np.uint8)
+
+        known[0, :, :-1] = grid[:, 1:] > 0  # top side
+        side_bits[0, :, :-1] = (grid[:, 1:] & 4 != 0) * 1
+        known[1, :-1, :] = grid[1:, :] > 0  # right side
+        side_bits[1, :-1, :] = (grid[1:, :] & 8 != 0) * 2
+        known[2, :, 1:] = grid[:, :-1] > 0  # bottom side
+        side_bits[2, :, 1:] = (grid[:, :-1] & 1 != 0) * 4
+        known[3, 1:, :] = grid[:-1, :] > 0  # left side
+        side_bits[3, 1:, :] = (grid[:-1, :] & 2 != 0) * 8
+
+        # 0 is initial value for every cell in self.valueGrid, so a cell
+        # whose value is still 0 now was never visited in the 1st run
+        missing = (grid == 0) & known.all(axis=0)
+        grid[missing] = side_bits.sum(axis=0, dtype=np.uint8)[missing]
 
     def printGrid(self, grid):
-
-        tempGrid = [[-10 for row in range(self.maze_dim)] for col in range(self.maze_dim)]
-
-        for x in range(self.maze_dim):
-            for y in range(self.maze_dim):
-                new_x = (self.maze_dim - 1) - y
-                new_y = x
-                tempGrid[new_x][new_y] = grid[x][y]
-
-        for row in tempGrid:
+        '''
+        Prints a grid so that the top row of the maze is printed first.
+        '''
+        for row in np.rot90(grid).tolist():
             print(row)
 
         print("")
@@ -199,9 +517,7 @@ class Robot(object):
         This function will modify self.arrowGrid based on the self.policyGrid,
         so that the policy is more easily visualizable
         '''
-        for x in range(self.maze_dim):
-            for y in range(self.maze_dim):
-                self.arrowGrid[x][y] = self.dir_arrow[self.policyGrid[x][y]]
+        self.arrowGrid = self.dir_arrow[self.policyGrid]
 
     def calculateAllowedActions(self, location, heading, sensors):
         '''
@@ -255,7 +571,7 @@ class Robot(object):
             # calculate the new coordinate based on this action
             new_x = x + move * delta[0]
             new_y = y + move * delta[1]
-            if not self.visitedGrid[new_x][new_y]:  # if cell on the new_coordinate hasn't been visited  # NOQA
+            if not self.visitedGrid[new_x, new_y]:  # if cell on the new_coordinate hasn't been visited  # NOQA
                 prefered_actions.append(action)
 
         return prefered_actions
@@ -322,56 +638,14 @@ class Robot(object):
         for the maze. The heuristic grid will be later referened using dynamic
         programming to find a global policy for this maze.
 
-        This function is only called once, when it is the last step for the 1st
-        run. This function will calculate the heuristic value for each cell
-        and modify the robot.heuGrid variable.
-        '''
-        # A list used to keep track of the active cells
-        current_active_cells = []
-
-        # We initiate the heuristic calculation by assigning 0 to the central
-        # 4 cells in the maze, and push them in the list
-        for x in range(self.maze_dim/2 - 1, self.maze_dim/2 + 1):
-            for y in range(self.maze_dim/2 - 1, self.maze_dim/2 + 1):
-                self.heuGrid[x][y] = 0
-                current_active_cells.append([(x, y), 0])
-
-        while current_active_cells:  # while the list is not empty
-            active_cell = current_active_cells.pop(0)
-            x, y = active_cell[0]
-            temp_heuristic = active_cell[1]
-
-            if self.valueGrid[x][y] & 1:  # the active_cell is open on the top
-                if y+1 <= self.maze_dim -1 and self.valueGrid[x][y+1] > 0:
-                    # make sure the adjacent cell exists and does have open on the bottom
-                    if self.heuGrid[x][y+1] == -1 or self.heuGrid[x][y+1] > temp_heuristic + 1:
-                        # check if need to update the heuristic for the adjacent cell on the top
-                        self.heuGrid[x][y+1] = temp_heuristic + 1
-                        current_active_cells.append([(x, y+1), temp_heuristic + 1])
-
-            if self.valueGrid[x][y] & 2:  # the active_cell is open on the right
-                if x+1 <= self.maze_dim -1 and self.valueGrid[x+1][y] > 0:
-                    # make sure the adjacent cell exists and does have open on the left
-                    if self.heuGrid[x+1][y] == -1 or self.heuGrid[x+1][y] > temp_heuristic + 1:
-                        # check if need to update the heuristic for the adjacent cell on the right
-                        self.heuGrid[x+1][y] = temp_heuristic + 1
-                        current_active_cells.append([(x+1, y), temp_heuristic + 1])
-
-            if self.valueGrid[x][y] & 4:  # the active_cell is open on the bottom
-                if y-1 >= 0 and self.valueGrid[x][y-1] > 0:
-                    # make sure the adjacent cell exists and does have open on the left
-                    if self.heuGrid[x][y-1] == -1 or self.heuGrid[x][y-1] > temp_heuristic + 1:
-                        # check if need to update the heuristic for the adjacent cell on the bottom
-                        self.heuGrid[x][y-1] = temp_heuristic + 1
-                        current_active_cells.append([(x, y-1), temp_heuristic + 1])
-
-            if self.valueGrid[x][y] & 8:  # the active_cell is open on the left
-                if x-1>=0 and self.valueGrid[x-1][y] > 0:
-                    # make sure the adjacent cell exists and does have open on the right
-                    if self.heuGrid[x-1][y] == -1 or self.heuGrid[x-1][y] > temp_heuristic + 1:
-                        # check if need to update the heuristic for the adjacent cell on the left
-                        self.heuGrid[x-1][y] = temp_heuristic + 1
-                        current_active_cells.append([(x-1, y), temp_heuristic + 1])
+        The heuristic value of each cell is its number of moves to the goal
+        area, found by a flood fill from the goal cells over the cells
+        known in self.valueGrid (see planning.flood_fill). The fill runs in
+        time linear in the number of cells, so it is cheap enough to call on
+        every step. The function modifies the robot.heuGrid variable.
+        '''
+        self.heuGrid[:] = flood_fill(self.valueGrid, self.goalCells,
+                                     self.flood_mode)
 
     def calculatePolicyGrid(self):
         '''
@@ -380,53 +654,377 @@ class Robot(object):
 
         The function will actually modify the self.policyGrid, so that
         it finally contains correct policy for the robot to follow.
+
+        The policy of a cell outside the goal area is the direction of the
+        open neighbour with the smallest known heuristic. The heuristics of
+        the four neighbours of all cells are stacked from shifted views of
+        heuGrid, and ties are broken at random with random keys drawn from
+        a generator seeded from a hash of valueGrid. Robots with the same
+        knowledge get the same policy, so a policy taken from a plan cache is
+        the one the robot would have computed itself.
+        '''
+        dim = self.maze_dim
+        heu = self.heuGrid.astype(np.int64)
+        no_move = np.iinfo(np.int64).max
+
+        # adjacent_heuristics[heading, x, y] is the heuristic of the neighbour
+        # of cell (x, y) in that direction, if the cell is open towards it
+        # and its heuristic is known, for example [16, 14, no_move, no_move]
+        adjacent_heuristics = np.full((4, dim, dim), no_move, dtype=np.int64)
+        adjacent_heuristics[UP, :, :-1] = heu[:, 1:]
+        adjacent_heuristics[RIGHT, :-1, :] = heu[1:, :]
+        adjacent_heuristics[DOWN, :, 1:] = heu[:, :-1]
+        adjacent_heuristics[LEFT, 1:, :] = heu[:-1, :]
+        for heading in (UP, RIGHT, DOWN, LEFT):
+            closed = (self.valueGrid & (1 << heading)) == 0
+            adjacent_heuristics[heading][closed] = no_move
+        adjacent_heuristics[adjacent_heuristics < 0] = no_move
+
+        # the allowed directions with the smallest heuristic, one of them
+        # picked at random
+        min_heuristic = adjacent_heuristics.min(axis=0)
+        ties = (adjacent_heuristics == min_heuristic) & (min_heuristic < no_move)  # NOQA
+        digest = hashlib.blake2b(self.valueGrid.tobytes(), digest_size=8)
+        rng = np.random.default_rng(int(digest.hexdigest(), 16))
+        keys = rng.random((4, dim, dim))
+        keys[~ties] = 2
+        choice = keys.argmin(axis=0)
+
+        # No need to calculate the policy if the cell is already in goal area
+        update = ties.any(axis=0)
+        for x, y in self.goalCells:
+            update[x, y] = False
+        self.policyGrid[update] = choice[update]
+
+    def calculateCorridorPlan(self):
+        '''
+        This function is used by the 'corridor' planner instead of
+        calculateHeuGrid() and calculatePolicyGrid(). It plans on the graph
+        of junctions and corridors of the known cells and expands the result
+        into the robot.heuGrid and robot.policyGrid variables. The graph is
+        only built once for the same known walls, see
+        corridor.corridor_graph().
+        '''
+        distances, policy = corridor_plan(self.valueGrid, self.goalCells)
+        self.heuGrid[:] = distances
+        self.policyGrid[:] = policy
+
+    def finishExploration(self):
+        '''
+        This function is called at the last step of the 1st run. It computes
+        the policy for the 2nd run from everything the robot has learned and
+        resets the robot to the start. With a plan cache, the results are
+        taken from the cache when this knowledge was planned for before.
+
+        With the 'frontier' exploration, the cells the robot has seen but
+        never visited first get the sides the sensors proved open, so that
+        the planners can use the proven route.
+        '''
+        if self.explore == 'frontier':
+            seen = (self.visitedGrid == 0) & (self.valueGrid == 0)
+            self.valueGrid[seen] = self.openGrid[seen]
+
+        if self.cache is not None:
+            key = self.cache.key(self.valueGrid, self.plan_version,
+                                 self.planner, sorted(self.goalCells))
+            entry = self.cache.get(key)
+        else:
+            entry = None
+
+        if entry is not None:
+            self.valueGrid[:] = entry['valueGrid']
+            self.heuGrid[:] = entry['heuGrid']
+            self.policyGrid[:] = entry['policyGrid']
+            if 'actionPlan' in entry:
+                self.actionPlan = [tuple(step) for step in entry['actionPlan'].tolist()]  # NOQA
+        else:
+            self.fixMissingCellValue()
+            if self.planner == 'corridor':
+                self.calculateCorridorPlan()
+            else:
+                self.calculateHeuGrid()
+                self.calculatePolicyGrid()
+            if self.planner == 'steps':
+                self.actionPlan = plan_steps(self.valueGrid, self.goalCells)
+
+            if self.cache is not None:
+                entry = {'valueGrid': self.valueGrid,
+                         'heuGrid': self.heuGrid,
+                         'policyGrid': self.policyGrid}
+                if self.actionPlan is not None:
+                    entry['actionPlan'] = np.array(self.actionPlan, dtype=np.int16).reshape(-1, 2)  # NOQA
+                self.cache.put(key, {name: grid.copy() for name, grid in entry.items()})  # NOQA
+
+        self.calculateArrows()
+        if self.actionPlan is not None:
+            self.knowledgePlan = list(self.actionPlan)
+
+        if self.sink is not None:
+            self.sink.emit('plan', visitedGrid=self.visitedGrid,
+                           valueGrid=self.valueGrid,
+                           heuGrid=self.heuGrid,
+                           arrowGrid=self.arrowGrid)
+
+        self.location = [0, 0]
+        self.heading = 'u'
+        self.run_2 = True
+        return 'Reset', 'Reset'
+
+    def updateFloodFields(self, location, heading, sensors):
+        '''
+        This function is used by the 'flood' exploration. Each sensor
+        reading tells that there is a wall at the far end of the open cells
+        in its direction; the function adds these walls to the distance
+        fields, which repair themselves where the walls block a shortest
+        route.
+        '''
+        x, y = location
+        walls = []
+        for direction, distance in zip(self.dir_sensors[heading], sensors):
+            h = heading_index[direction]
+            dx, dy = heading_deltas[h]
+            walls.append((x + dx * distance, y + dy * distance, h))
+
+        self.goalField.add_walls(walls)
+        self.startField.add_walls(walls)
+
+        if self.explore == 'frontier':
+            self.updateKnownSides(location, heading, sensors)
+
+    def updateKnownSides(self, location, heading, sensors):
+        '''
+        This function is used by the 'frontier' exploration. Each sensor
+        reading proves that the cells in its direction are open up to the
+        reading's distance and closed after it. The function records these
+        sides in self.openGrid and self.knownGrid, on both cells of every
+        side, and marks the cells with four known sides as explored.
+        '''
+        x, y = location
+        dim = self.maze_dim
+        for direction, distance in zip(self.dir_sensors[heading], sensors):
+            h = heading_index[direction]
+            bit, back = 1 << h, 1 << ((h + 2) % 4)
+            dx, dy = heading_deltas[h]
+            cx, cy = x, y
+            for _ in range(distance):
+                if not self.openGrid[cx, cy] & bit:
+                    self.openGrid[cx, cy] |= bit
+                    self.openGrid[cx + dx, cy + dy] |= back
+                    self.openCount += 1
+                self.knownGrid[cx, cy] |= bit
+                self.knownGrid[cx + dx, cy + dy] |= back
+                self.exploredGrid[cx, cy] = self.knownGrid[cx, cy] == 15
+                cx, cy = cx + dx, cy + dy
+            self.knownGrid[cx, cy] |= bit
+            if 0 <= cx + dx < dim and 0 <= cy + dy < dim:
+                self.knownGrid[cx + dx, cy + dy] |= back
+                self.exploredGrid[cx + dx, cy + dy] = self.knownGrid[cx + dx, cy + dy] == 15  # NOQA
+            self.exploredGrid[cx, cy] = self.knownGrid[cx, cy] == 15
+
+    def calculateRouteBounds(self):
+        '''
+        This function is used by the 'frontier' exploration once the goal is
+        found. The optimistic number of moves from the start to the goal,
+        with unknown walls open, is a lower bound of the shortest route; the
+        pessimistic one, over the openings in self.openGrid only, is an
+        upper bound, since that route is known to exist. The function stores
+        both in self.routeBounds and returns True when they agree, which
+        proves that the known route is a shortest one.
+        '''
+        lower = self.goalField.distance(0, 0)
+        if self.routeBounds[0] == lower and self.openCount == self.openKey:
+            return self.routeBounds[1] == lower
+        self.openKey = self.openCount
+
+        # the pessimistic search stops once it reaches the start
+        upper = int(queue_flood_fill(open_grid(self.openGrid),
+                                     self.goalCells, (0, 0))[0, 0])
+        self.routeBounds = (lower, upper)
+        return upper == lower
+
+    def calculateFrontierDist(self):
+        '''
+        This function is used by the 'flood' exploration once the goal is
+        found. Assuming unknown walls are open, a cell could lie on a
+        shortest route if its distance to the start plus its distance to the
+        goal equals the distance from the start to the goal. The function
+        finds the unvisited cells of that kind and stores the distance to
+        the nearest of them in self.frontierDist. The distances are only
+        filled in up to the robot's own distance, which is all that
+        calculateFloodAction() looks at.
+
+        It returns False when there is no such cell left, which means the
+        shortest route is known.
+        '''
+        goal_dist = np.array(self.goalField.dist)
+        start_dist = np.array(self.startField.dist)
+        on_route = ((goal_dist >= 0) & (start_dist >= 0) &
+                    (goal_dist + start_dist == goal_dist[0]))
+        frontier = np.flatnonzero(on_route & (self.exploredGrid.ravel() == 0))
+        if len(frontier) == 0:
+            return False
+
+        # The distances are still valid while neither the walls nor the
+        # cells to explore change, since the robot only ever gets closer
+        key = (self.goalField.wall_count, frontier.tobytes())
+        if key == self.frontierKey:
+            return True
+        self.frontierKey = key
+
+        cells = [divmod(cell, self.maze_dim) for cell in frontier]
+        grid = np.array(self.goalField.grid, dtype=np.uint8)
+        grid = grid.reshape(self.maze_dim, self.maze_dim)
+        self.frontierDist = queue_flood_fill(
+            grid, cells, self.location).ravel().tolist()
+        return True
+
+    def calculateFloodAction(self, allowed_actions):
         '''
-        for x in range(self.maze_dim):
-            for y in range(self.maze_dim):
-                cell_value = self.valueGrid[x][y]
-
-                # No need to calculate the policy if the cell is already in goal area
-                if x not in range(self.maze_dim/2 - 1, self.maze_dim/2 + 1) or y not in range(self.maze_dim/2 - 1, self.maze_dim/2 + 1):
-                    # allowed_dirs is used to store the allowed move on this cell, for exmaple ['u','r']
-                    allowed_dirs = []
-
-                    # adajacent_heuristics is used to store the heuristic values for the allowed_dirs, for example [16, 14]
-                    adjacent_heuristics = []
-
-
-                    if cell_value & 1:  # cell is open on the top
-                        if y+1 <= self.maze_dim - 1:
-                            if self.heuGrid[x][y+1] >= 0:
-                                allowed_dirs.append('u')
-                                adjacent_heuristics.append(self.heuGrid[x][y+1])
-
-                    if cell_value & 2:  # cell is open on the right
-                        if x+1 <= self.maze_dim - 1:
-                            if self.heuGrid[x+1][y] >= 0:
-                                allowed_dirs.append('r')
-                                adjacent_heuristics.append(self.heuGrid[x+1][y])
-
-                    if cell_value & 4:  # cell is open on the bottom
-                        if y-1 >= 0:
-                            if self.heuGrid[x][y-1] >=0:
-                                allowed_dirs.append('d')
-                                adjacent_heuristics.append(self.heuGrid[x][y-1])
-
-                    if cell_value & 8:  # cell is open on the left
-                        if x-1 >= 0:
-                            if self.heuGrid[x-1][y] >=0:
-                                allowed_dirs.append('l')
-                                adjacent_heuristics.append(self.heuGrid[x-1][y])
-
-                    if len(adjacent_heuristics) == 0:
-                        # print("x,y", x,y, "cellValue", cell_value)
-                        pass
-                    else:
-                        min_heuristic = min(adjacent_heuristics)
-                        indices = [i for i, val in enumerate(adjacent_heuristics) if val == min_heuristic]
-                        index = random.choice(indices)
-                        self.policyGrid[x][y] = allowed_dirs[index]
+        This function is used by the 'flood' exploration to pick the next
+        action among the allowed_actions: the one that gets closest to the
+        target of the distance field, i.e. to the goal before the goal is
+        found and to the nearest cell left to explore after. Ties go to
+        unvisited cells and then to actions without rotation.
 
+        A move continues for up to 3 cells as long as every cell on the way
+        keeps getting closer, but it never skips over an unvisited cell, so
+        the sensors see every cell the robot explores.
+
+        Returns None if no allowed action gets closer to the target.
+        '''
+        if self.findGoal:
+            field = self.frontierDist
+        else:
+            field = self.goalField.dist
+
+        dim = self.maze_dim
+        x, y = self.location
+        current = field[x * dim + y]
+
+        best_key = None
+        chosen_action = None
+        for direction, move in allowed_actions:
+            if move != 1:
+                continue
+            dx, dy = self.dir_move[direction]
+            distance = field[(x + dx) * dim + y + dy]
+            if distance < 0 or distance >= current:
+                continue
+            key = (distance, self.exploredGrid[x + dx, y + dy],
+                   direction != self.heading)
+            if best_key is None or key < best_key:
+                best_key = key
+                chosen_action = (direction, move)
+
+        if chosen_action is None:
+            return None
+
+        # extend the move along the same direction
+        direction, move = chosen_action
+        dx, dy = self.dir_move[direction]
+        while (direction, move + 1) in allowed_actions:
+            if not self.exploredGrid[x + dx * move, y + dy * move]:
+                break
+            new_x = x + dx * (move + 1)
+            new_y = y + dy * (move + 1)
+            if field[new_x * dim + new_y] != current - move - 1:
+                break
+            move += 1
+
+        return (direction, move)
+
+    def followPlan(self):
+        '''
+        This function is used in the 2nd run by the 'steps' planner. It
+        takes the next step of self.actionPlan and updates the robot's
+        heading and location accordingly.
+        '''
+        location = tuple(self.location)
+        rotation, movement = self.actionPlan.pop(0)
+        if rotation == -90:
+            self.heading = self.dir_sensors[self.heading][0]
+        elif rotation == 90:
+            self.heading = self.dir_sensors[self.heading][2]
+
+        delta = self.dir_move[self.heading]
+        self.location[0] += delta[0] * movement
+        self.location[1] += delta[1] * movement
+
+        if self.sink is not None:
+            self.sink.emit('follow', location=location,
+                           policy=self.heading, movement=movement)
+
+        return rotation, movement
+
+    def followPolicy(self):
+        '''
+        This function is used in the 2nd run by the 'policy' and 'corridor'
+        planners. It follows the arrow of policyGrid in the robot's cell,
+        moving up to 3 cells when consecutive arrows agree, and updates the
+        robot's heading and location accordingly.
+        '''
+        x, y = self.location
+
+        policy = self.policyGrid[x, y]
+
+        if policy == UP:  # if policy for this cell is up
+            if self.policyGrid[x, y+1] == UP:  # if policy for the cell upside is also up
+                if self.policyGrid[x, y+2] == UP:  # if policy for the cell even upside is also up
+                    movement = 3
+                else:
+                    movement = 2
+            else:
+                movement = 1
+
+            rotation = self.calculateRotation(self.heading, ['u', 1])
+            self.location[1] += movement
+            self.heading = 'u'
+
+        elif policy == RIGHT:  # if policy for this cell is right
+            if self.policyGrid[x+1, y] == RIGHT:  # if the policy for the cell right side is also right
+                if self.policyGrid[x+2, y] == RIGHT:  # if the policy for the cell even right side is also right
+                    movement = 3
+                else:
+                    movement = 2
+            else:
+                movement = 1
+
+            rotation = self.calculateRotation(self.heading, ['r', 1])
+            self.location[0] += movement
+            self.heading = 'r'
+
+        elif policy == DOWN:  # if policy for this cell is down
+            if self.policyGrid[x, y-1] == DOWN:  # if the policy for the cell down side is also down
+                if self.policyGrid[x, y-2] == DOWN:  # if the policy for the cell even down side is also down
+                    movement = 3
+                else:
+                    movement = 2
+            else:
+                movement = 1
+
+            rotation = self.calculateRotation(self.heading, ['d', 1])
+            self.location[1] -= movement
+            self.heading = 'd'
+
+        elif policy == LEFT:  # if policy for this cell is left
+            if self.policyGrid[x-1, y] == LEFT:  # if the policy for the cell left side is also left
+                if self.policyGrid[x-2, y] == LEFT:  # if the policy for the cell even left side is also left
+                    movement = 3
+                else:
+                    movement = 2
+            else:
+                movement = 1
+
+            rotation = self.calculateRotation(self.heading, ['l', 1])
+            self.location[0] -= movement
+            self.heading = 'l'
+
+        if self.sink is not None:
+            self.sink.emit('follow', location=(x, y),
+                           policy=self.policy_names[policy],
+                           movement=movement)
+
+        return rotation, movement
 
     def next_move(self, sensors):
         '''
@@ -453,148 +1051,89 @@ class Robot(object):
         x, y = self.location
 
         # If it is the 2nd run, follow instruction from policyGrid to guide robot to move
-        if self.run_2 == True:
-
-            policy = self.policyGrid[x][y]
-
-            if policy == 'u':  # if policy for this cell is up
-                if self.policyGrid[x][y+1] == 'u':  # if policy for the cell upside is also up
-                    if self.policyGrid[x][y+2] == 'u':  # if policy for the cell even upside is also up
-                        movement = 3
-                    else:
-                        movement = 2
-                else:
-                    movement = 1
-
-                rotation = self.calculateRotation(self.heading, ['u', 1])
-                self.location[1] += movement
-                self.heading = 'u'
-
-            elif policy == 'r':  # if policy for this cell is right
-                if self.policyGrid[x+1][y] == 'r':  # if the policy for the cell right side is also right
-                    if self.policyGrid[x+2][y] == 'r':  # if the policy for the cell even right side is also right
-                        movement = 3
-                    else:
-                        movement = 2
-                else:
-                    movement = 1
-
-                rotation = self.calculateRotation(self.heading, ['r', 1])
-                self.location[0] += movement
-                self.heading = 'r'
-
-            elif policy == 'd':  # if policy for this cell is down
-                if self.policyGrid[x][y-1] == 'd':  # if the policy for the cell down side is also down
-                    if self.policyGrid[x][y-2] == 'd':  # if the policy for the cell even down side is also down
-                        movement = 3
-                    else:
-                        movement = 2
-                else:
-                    movement = 1
-
-                rotation = self.calculateRotation(self.heading, ['d', 1])
-                self.location[1] -= movement
-                self.heading = 'd'
-
-            elif policy == 'l':  # if policy for this cell is left
-                if self.policyGrid[x-1][y] == 'l':  # if the policy for the cell left side is also left
-                    if self.policyGrid[x-2][y] == 'l':  # if the policy for the cell even left side is also left
-                        movement = 3
-                    else:
-                        movement = 2
-                else:
-                    movement = 1
-
-                rotation = self.calculateRotation(self.heading, ['l', 1])
-                self.location[0] -= movement
-                self.heading = 'l'
-
-            print(x,y,policy,movement)
-
-            return rotation, movement
+        if self.run_2 == True and self.actionPlan:
+            return self.followPlan()
 
+        if self.run_2 == True:
+            return self.followPolicy()
+
+        # If the robot knows the maze from a snapshot, drive to the goal,
+        # unless the sensors show that the maze is not the same
+        if self.warmStart and not self.checkKnowledge(self.location,
+                                                      self.heading, sensors):
+            self.forgetKnowledge(sensors)
+        if self.warmStart:
+            action = self.followKnowledge(sensors)
+            if action is not None:
+                return action
 
         # If it is the 1st run for the robot
         if self.run_2 == False:
             # Check if the robot already entered the goal
-            goal_bounds = [self.maze_dim/2 - 1, self.maze_dim/2]
-            if x in goal_bounds and y in goal_bounds:
+            if (x, y) in self.goalSet:
                 self.findGoal = True
-            # Now check if robot has explored all the cells, or it has spend 900 steps in run 1 and visited goal
-            if (self.visits >= self.maze_dim * self.maze_dim) or (self.step == 900 and self.findGoal):
-                print("visitedGrid:")
-                self.printGrid(self.visitedGrid)
-                print("")
-                
-                print("valueGrid:")
-                self.fixMissingCellValue()
-                self.printGrid(self.valueGrid)
-                print("")
-                
-                print("heuGrid:")
-                self.calculateHeuGrid()
-                self.printGrid(self.heuGrid)
-                print("")
-                
-                print("policyGrid:")
-                self.calculatePolicyGrid()
-                self.calculateArrows()
-                self.printGrid(self.arrowGrid)
-                print("")
-
-                self.location = [0, 0]
-                self.heading = 'u'
-                self.run_2 = True
-                return 'Reset', 'Reset'
-
-        print("Step:", self.step)
-        print(x, y)
-        # print("sensors", sensors)
-        print("find goal yet?", self.findGoal)
+            # Now check if robot has explored all the cells, or it has spend 90% of its time (900 of 1000 steps) in run 1 and visited goal  # NOQA
+            if (self.visits >= self.maze_dim * self.maze_dim) or (self.step == self.finishStep and self.findGoal):  # NOQA
+                return self.finishExploration()
 
         # If our robot hasn't visited this cell before
-        if not self.visitedGrid[x][y]:
+        if not self.visitedGrid[x, y]:
             # Update the value for this cell, depeding on location, robot's heading and sensors  # NOQA
             self.updateCellValue(self.location, self.heading, sensors)  # NOQA
 
+            # and update the visit state for this cell
+            self.visitedGrid[x, y] = 1
+            self.visits += 1
+
+        if self.explore in ('flood', 'frontier'):
+            # Record the walls in sight in the distance fields
+            self.updateFloodFields(self.location, self.heading, sensors)
+
+            # With 'frontier', stop once the shortest route is proven
+            if (self.findGoal and self.explore == 'frontier' and
+                    self.calculateRouteBounds()):
+                return self.finishExploration()
+
+            # Once the goal is found, stop as soon as no cell that could
+            # shorten the route is left to explore
+            if self.findGoal and not self.calculateFrontierDist():
+                return self.finishExploration()
+
         # Now let's calculate allowed actions for this robot,
         # depending on location, headings and sensors
         allowed_actions = self.calculateAllowedActions(self.location, self.heading, sensors)  # NOQA
-        print("allow actions:", allowed_actions)
 
         # Now let's calculated the robot's prefered actions from the
         # allowed_actions. An action is prefered by the robot, if it will send
         # the robot to a cell it has not visited before
         prefered_actions = self.calculatePreferedActions(self.location, allowed_actions)  # NOQA
-        print("prefered actions:", prefered_actions)
+
+        if self.explore in ('flood', 'frontier'):
+            # follow the distance field, if none of the allowed actions
+            # gets closer the way to go is behind the robot
+            chosen_action = self.calculateFloodAction(allowed_actions)
 
         # if robot does have several prefered actions available
-        if prefered_actions:
-            chosen_action = random.choice(prefered_actions)  # pick up a random prefered action  # NOQA
-            rotation = self.calculateRotation(self.heading, chosen_action)  # NOQA
-            movement = chosen_action[1]
+        elif prefered_actions:
+            chosen_action = self.rng.choice(prefered_actions)  # pick up a random prefered action  # NOQA
 
         # if the robot has allowed actions, but all of them are not prefered
         elif allowed_actions:
-            chosen_action = random.choice(allowed_actions)  # pick up a random allowed action  # NOQA
-            rotation = self.calculateRotation(self.heading, chosen_action)  # NOQA
-            movement = chosen_action[1]
+            chosen_action = self.rng.choice(allowed_actions)  # pick up a random allowed action  # NOQA
 
         else:  # that means our robot doesn't even have allowed actions!
             # the only reason for this is that our robot gets stuck at a dead end  # NOQA
+            chosen_action = None
 
+        if chosen_action:
+            rotation = self.calculateRotation(self.heading, chosen_action)  # NOQA
+            movement = chosen_action[1]
+
+        else:
             # We tell the robot to turn 90 degrees clockwise without movement
             rotation = 90
             movement = 0
 
-        print("rotation", rotation, "movement", movement)
-        print("")
-
-        # Finally update the visit state for this cell, if it's first time visit  # NOQA
-        if not self.visitedGrid[x][y]:
-            self.visitedGrid[x][y] = 1
-            self.visits += 1
-
         if movement:
             # If the robot does need to move for the next step
             # We have to update the robot position manually here,
@@ -604,9 +1143,14 @@ class Robot(object):
         else:  # movement of 0 means robot only turn 90 degree clockwise
             self.turnClockWise()
 
-        self.step += 1
+        if self.sink is not None:
+            self.sink.emit('explore', step=self.step, location=(x, y),
+                           find_goal=self.findGoal,
+                           allowed_actions=allowed_actions,
+                           prefered_actions=prefered_actions,
+                           rotation=rotation, movement=movement,
+                           visits=self.visits)
 
-        print("total number of cells visited", self.visits)
-        print("")
+        self.step += 1
 
         return rotation, movement
@@ -0,0 +1,796 @@
+from maze import Maze, heading_deltas
+from simulator import time_budget, sensor_headings, rotate_ccw, rotate_cw
+from simulator import reverse_heading
+from planning import goal_room
+from mazefile import load_mazes
+from tester import max_time, train_score_mult
+from tournament import list_mazes
+import numpy as np
+import argparse
+import asyncio
+import struct
+import time
+import os
+
+# The server hosts any number of two-run trials ("sessions") at once and
+# talks to robot controllers over a TCP or Unix domain socket. Every message
+# in either direction is a frame: its length as a little endian uint32,
+# followed by that many bytes, the first of which is the message type. All
+# fields are little endian; a connection may run many sessions at once.
+#
+# From the controller:
+# - INFO (1): asks for the number of mazes the server holds.
+# - OPEN (2): tag (uint32), maze index (uint32), time steps (uint32, 0 for
+#     simulator.time_budget() of the maze). Starts a session.
+# - ACTION (3): session (uint32), rotation (int16), movement (int8), flags
+#     (uint8, 1 for a reset). The action of the robot for the last sensors.
+# - STATS (4): session (uint32). Asks for the counters of a session.
+# - CLOSE (5): session (uint32). Drops a session, finished or not.
+#
+# From the server:
+# - INFO (129): number of mazes (uint32).
+# - OPENED (130): tag (uint32) of the OPEN, session (uint32), maze
+#     dimension (uint16), time steps (uint32). Followed by the first SENSE.
+# - SENSE (131): session (uint32), time step (uint32), run (uint8) and the
+#     left, front and right sensor distances (uint16 each).
+# - DONE (132): session (uint32), completed (uint8), runtimes of both runs
+#     (uint32 each), time steps used, wall hits and invalid actions (uint32
+#     each) and score (float64, NaN if not completed).
+# - STATS (133): session (uint32), actions (uint32), seconds since the
+#     session was opened, and the mean and maximum latency in seconds from
+#     sending sensors to receiving the action (float64 each).
+# - ERROR (255): what failed (uint8: 0 for the connection, 1 for the OPEN
+#     with the tag, 2 for the session), the tag or session (uint32, 0 for
+#     the connection), then the error message as UTF-8. Tags and sessions
+#     are numbered separately, so the first field tells them apart.
+#     Errors of the connection are fatal and the server closes it.
+INFO, OPEN, ACTION, STATS, CLOSE = 1, 2, 3, 4, 5
+INFO_REPLY, OPENED, SENSE, DONE, STATS_REPLY, ERROR = 129, 130, 131, 132, 133, 255  # NOQA
+
+frame_header = struct.Struct('<I')
+message_type = struct.Struct('<B')
+info_message = struct.Struct('<BI')
+open_message = struct.Struct('<BIII')
+action_message = struct.Struct('<BIhbB')
+session_message = struct.Struct('<BI')
+opened_message = struct.Struct('<BIIHI')
+sense_message = struct.Struct('<BIIBHHH')
+done_message = struct.Struct('<BIBIIIIId')
+stats_message = struct.Struct('<BIIddd')
+error_message = struct.Struct('<BBI')
+
+# what an ERROR refers to
+ERROR_CONNECTION, ERROR_TAG, ERROR_SESSION = 0, 1, 2
+
+# largest frame the server accepts
+max_frame = 1 << 16
+
+# flag of an ACTION that asks for a reset
+reset_flag = 1
+
+# sensor headings of every integer heading, for batched lookups
+sensor_table = np.array(sensor_headings)
+
+
+def frame(payload):
+    '''
+    Returns payload with its length prefix.
+    '''
+    return frame_header.pack(len(payload)) + payload
+
+
+class Episode(object):
+    def __init__(self, maze, max_time, goal_cells=None):
+        '''
+        One two-run trial of a maze, driven one action at a time. It follows
+        the rules of simulator.Simulator.run(): a reset is accepted in the
+        1st run once the goal was entered, the 2nd run ends in the goal, and
+        the trial ends when max_time time steps are used up.
+
+        The episode starts at the 1st time step; sensing is left to the
+        caller, which reads the sensors of the robot's pose (x, y, heading)
+        before every act().
+        '''
+        self.maze = maze
+        self.max_time = max_time
+        self.distances = maze.distance_lists
+        if self.distances is None:
+            self.distances = maze.distances
+        if goal_cells is None:
+            goal_cells = goal_room(maze.dim)
+        self.goal_set = set((int(x), int(y)) for x, y in goal_cells)
+
+        self.run = 0
+        self.x, self.y, self.heading = 0, 0, 0
+        self.hit_goal = False
+        self.runtimes = []
+        self.wall_hits = 0
+        self.invalid_actions = 0
+        self.total_time = 0
+        self.done = False
+        self.advance()
+
+    def advance(self):
+        '''
+        Moves on to the next time step, ending the trial if there is none.
+        '''
+        self.total_time += 1
+        if self.total_time > self.max_time:
+            self.done = True
+
+    def act(self, rotation, movement, reset=False):
+        '''
+        Performs the robot's action for the current time step.
+        '''
+        if reset:
+            if self.run == 0 and self.hit_goal:
+                self.runtimes.append(self.total_time)
+                self.run = 1
+                self.x, self.y, self.heading = 0, 0, 0
+                self.hit_goal = False
+            else:
+                self.invalid_actions += 1
+            self.advance()
+            return
+
+        # perform rotation
+        if rotation == -90:
+            self.heading = rotate_ccw[self.heading]
+        elif rotation == 90:
+            self.heading = rotate_cw[self.heading]
+        elif rotation != 0:
+            self.invalid_actions += 1
+
+        # perform movement
+        if abs(movement) > 3:
+            self.invalid_actions += 1
+        movement = max(min(int(movement), 3), -3)
+        if movement > 0:
+            move_heading = self.heading
+        else:
+            move_heading = reverse_heading[self.heading]
+        dx, dy = heading_deltas[move_heading]
+        x, y = self.x, self.y
+        for _ in range(abs(movement)):
+            if not self.distances[x][y][move_heading]:
+                self.wall_hits += 1
+                break
+            x += dx
+            y += dy
+        self.x, self.y = x, y
+
+        # check for goal entered
+        if (x, y) in self.goal_set:
+            self.hit_goal = True
+            if self.run != 0:
+                self.runtimes.append(self.total_time - sum(self.runtimes))
+                self.done = True
+                return
+        self.advance()
+
+    @property
+    def completed(self):
+        return len(self.runtimes) == 2
+
+    @property
+    def steps(self):
+        return min(self.total_time, self.max_time)
+
+    @property
+    def score(self):
+        if not self.completed:
+            return None
+        return self.runtimes[1] + train_score_mult * self.runtimes[0]
+
+
+class Session(object):
+    '''
+    A trial hosted by the server for one controller connection, with its
+    counters:
+    - actions: number of actions received.
+    - opened: time.perf_counter() when the session was opened.
+    - latency_total, latency_max: sum and maximum of the seconds from
+        sending the sensors to receiving the action.
+    '''
+    def __init__(self, session_id, episode, writer):
+        self.session_id = session_id
+        self.episode = episode
+        self.writer = writer
+        self.closed = False
+        self.actions = 0
+        self.opened = time.perf_counter()
+        self.sent = self.opened
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def stats(self):
+        '''
+        Returns (actions, seconds open, mean latency, maximum latency).
+        '''
+        elapsed = time.perf_counter() - self.opened
+        mean = self.latency_total / self.actions if self.actions else 0.0
+        return self.actions, elapsed, mean, self.latency_max
+
+
+class SimServer(object):
+    def __init__(self, mazes, max_time=None, goal_cells=None):
+        '''
+        Simulation server for the mazes of the list mazes, (filename, index)
+        pairs as returned by tournament.list_mazes(). Controllers open
+        sessions by maze index; mazes are loaded on first use and kept.
+        max_time fixes the time steps of every trial that does not ask for
+        its own, by default they follow the maze size. goal_cells applies
+        to every maze, the central 2x2 room by default.
+
+        Sensors are not read per action: sessions that acted are collected
+        until the event loop has handled all the data it has read, and then
+        the sensors of all of them are gathered with one array lookup per
+        maze. Under load, one batch covers many sessions.
+
+        Server-wide counters: sessions (opened), finished, actions, batches
+        and batched (the sessions sensed in all batches).
+        '''
+        self.mazes = mazes
+        self.max_time = max_time
+        self.goal_cells = goal_cells
+        self.loaded = {}
+        self.archives = {}
+        self.sessions = {}
+        self.next_id = 1
+        self.pending = []
+        self.flush_scheduled = False
+
+        self.opened_sessions = 0
+        self.finished = 0
+        self.actions = 0
+        self.batches = 0
+        self.batched = 0
+
+    def maze(self, index):
+        '''
+        Returns the Maze of index in self.mazes.
+        '''
+        if index not in self.loaded:
+            filename, archive_index = self.mazes[index]
+            if archive_index is None:
+                self.loaded[index] = Maze(filename)
+            else:
+                if filename not in self.archives:
+                    self.archives[filename] = load_mazes(filename)
+                self.loaded[index] = self.archives[filename].maze(archive_index)  # NOQA
+        return self.loaded[index]
+
+    def open(self, maze_index, trial_time, writer):
+        '''
+        Starts a session in the maze maze_index with trial_time time steps,
+        or the server's default if 0, and returns it.
+        '''
+        if not 0 <= maze_index < len(self.mazes):
+            raise Exception('No maze with index {}!'.format(maze_index))
+        maze = self.maze(maze_index)
+        if not trial_time:
+            trial_time = self.max_time
+        if not trial_time:
+            trial_time = time_budget(maze.dim, max_time)
+        session = Session(self.next_id, Episode(maze, trial_time,
+                                                self.goal_cells), writer)
+        self.sessions[session.session_id] = session
+        self.next_id += 1
+        self.opened_sessions += 1
+        return session
+
+    def schedule(self, session):
+        '''
+        Queues the session to be sent its sensors, or its result if the
+        trial is over.
+        '''
+        if session.episode.done:
+            self.finished += 1
+            episode = session.episode
+            runtimes = episode.runtimes + [0] * (2 - len(episode.runtimes))
+            score = episode.score
+            session.writer.write(frame(done_message.pack(
+                DONE, session.session_id, episode.completed, runtimes[0],
+                runtimes[1], episode.steps, episode.wall_hits,
+                episode.invalid_actions,
+                float('nan') if score is None else score)))
+            return
+        self.pending.append(session)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        '''
+        Sends the sensors of all queued sessions, gathered per maze.
+        '''
+        self.flush_scheduled = False
+        pending = [session for session in self.pending if not session.closed]
+        self.pending = []
+        if not pending:
+            return
+
+        groups = {}
+        for session in pending:
+            groups.setdefault(id(session.episode.maze), []).append(session)
+
+        now = time.perf_counter()
+        for sessions in groups.values():
+            episodes = [session.episode for session in sessions]
+            x = np.array([episode.x for episode in episodes])
+            y = np.array([episode.y for episode in episodes])
+            heading = np.array([episode.heading for episode in episodes])
+            sensors = episodes[0].maze.distances[x[:, None], y[:, None],
+                                                 sensor_table[heading]]
+            for session, (left, front, right) in zip(sessions,
+                                                     sensors.tolist()):
+                episode = session.episode
+                session.writer.write(frame(sense_message.pack(
+                    SENSE, session.session_id, episode.total_time,
+                    episode.run, left, front, right)))
+                session.sent = now
+
+        self.batches += 1
+        self.batched += len(pending)
+
+    def error(self, writer, what, key, message):
+        writer.write(frame(error_message.pack(ERROR, what, key) +
+                           message.encode('utf-8')))
+
+    def owned_session(self, session_id, writer):
+        '''
+        Returns the session session_id of the connection of writer, or None.
+        '''
+        session = self.sessions.get(session_id)
+        if session is None or session.writer is not writer:
+            return None
+        return session
+
+    def handle(self, payload, writer):
+        '''
+        Handles one message from a controller.
+        '''
+        kind = payload[0]
+        if kind == ACTION:
+            _, session_id, rotation, movement, flags = action_message.unpack(payload)  # NOQA
+            session = self.owned_session(session_id, writer)
+            if session is None or session.episode.done:
+                self.error(writer, ERROR_SESSION, session_id, 'No running session {}!'.format(session_id))  # NOQA
+                return
+            latency = time.perf_counter() - session.sent
+            session.latency_total += latency
+            if latency > session.latency_max:
+                session.latency_max = latency
+            session.actions += 1
+            self.actions += 1
+            session.episode.act(rotation, movement, flags & reset_flag)
+            self.schedule(session)
+
+        elif kind == OPEN:
+            _, tag, maze_index, trial_time = open_message.unpack(payload)
+            try:
+                session = self.open(maze_index, trial_time, writer)
+            except Exception as e:
+                self.error(writer, ERROR_TAG, tag, str(e))
+                return
+            writer.write(frame(opened_message.pack(
+                OPENED, tag, session.session_id, session.episode.maze.dim,
+                session.episode.max_time)))
+            self.schedule(session)
+
+        elif kind == STATS:
+            _, session_id = session_message.unpack(payload)
+            session = self.owned_session(session_id, writer)
+            if session is None:
+                self.error(writer, ERROR_SESSION, session_id, 'No session {}!'.format(session_id))  # NOQA
+                return
+            writer.write(frame(stats_message.pack(STATS_REPLY, session_id,
+                                                  *session.stats())))
+
+        elif kind == CLOSE:
+            _, session_id = session_message.unpack(payload)
+            session = self.owned_session(session_id, writer)
+            if session is not None:
+                session.closed = True
+                del self.sessions[session_id]
+
+        elif kind == INFO:
+            writer.write(frame(info_message.pack(INFO_REPLY,
+                                                 len(self.mazes))))
+
+        else:
+            raise Exception('Unknown message type {}!'.format(kind))
+
+    async def serve_connection(self, reader, writer):
+        '''
+        Reads and handles the frames of one controller connection until it
+        is closed, then drops its sessions.
+        '''
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(frame_header.size)
+                except asyncio.IncompleteReadError:
+                    break
+                length, = frame_header.unpack(header)
+                if not 0 < length <= max_frame:
+                    break
+                payload = await reader.readexactly(length)
+                try:
+                    self.handle(payload, writer)
+                except struct.error:
+                    break
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.error(writer, ERROR_CONNECTION, 0, str(e))
+        finally:
+            for session_id, session in list(self.sessions.items()):
+                if session.writer is writer:
+                    session.closed = True
+                    del self.sessions[session_id]
+            writer.close()
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        '''
+        Starts listening on the Unix domain socket path, or on host and port
+        if no path is given, and returns the asyncio server.
+        '''
+        if path is not None:
+            if os.path.exists(path):
+                os.remove(path)
+            return await asyncio.start_unix_server(self.serve_connection,
+                                                   path)
+        return await asyncio.start_server(self.serve_connection, host, port)
+
+    def report(self):
+        '''
+        Returns a line with the server-wide counters.
+        '''
+        mean_batch = self.batched / self.batches if self.batches else 0.0
+        return ("{} sessions ({} running, {} finished), {} actions, "
+                "{:.1f} sessions per sensor batch".format(
+                    self.opened_sessions, len(self.sessions), self.finished,
+                    self.actions, mean_batch))
+
+
+class ClientSession(object):
+    '''
+    A session of a SimClient: session_id, dim and max_time of the trial,
+    and a queue of the SENSE and DONE messages the server sent for it.
+    '''
+    def __init__(self, client, session_id, dim, max_time):
+        self.client = client
+        self.session_id = session_id
+        self.dim = dim
+        self.max_time = max_time
+        self.messages = asyncio.Queue()
+
+    async def receive(self):
+        '''
+        Returns the next message of the session: ('sense', time, run,
+        sensors) or ('done', result), where result is a dictionary of the
+        DONE fields. Raises the error that ended the connection, if any.
+        '''
+        if self.messages.empty() and self.client.error is not None:
+            raise self.client.error
+        message = await self.messages.get()
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    def act(self, rotation, movement):
+        '''
+        Sends the robot's action, ('Reset', 'Reset') for a reset.
+        '''
+        if (rotation, movement) == ('Reset', 'Reset'):
+            payload = action_message.pack(ACTION, self.session_id, 0, 0,
+                                          reset_flag)
+        else:
+            payload = action_message.pack(ACTION, self.session_id,
+                                          rotation, movement, 0)
+        self.client.send(payload)
+
+    async def stats(self):
+        '''
+        Returns the server's counters of the session as a dictionary.
+        '''
+        return await self.client.request(self.session_id, session_message.pack(STATS, self.session_id))  # NOQA
+
+    def close(self):
+        self.client.sessions.pop(self.session_id, None)
+        self.client.send(session_message.pack(CLOSE, self.session_id))
+
+
+class SimClient(object):
+    def __init__(self):
+        '''
+        Client side of the protocol above for controllers written in Python.
+        connect() to a server, open() sessions and drive them through
+        their ClientSession; many sessions can share one connection.
+        '''
+        self.reader = None
+        self.writer = None
+        self.sessions = {}
+        self.requests = {}
+        self.next_tag = 1
+        self.reader_task = None
+        # the error that ended the connection, see fail()
+        self.error = None
+
+    async def connect(self, path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)  # NOQA
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)  # NOQA
+        self.reader_task = asyncio.ensure_future(self.read_messages())
+
+    def send(self, payload):
+        self.writer.write(frame(payload))
+
+    async def request(self, key, payload):
+        '''
+        Sends payload and returns the reply for key, a tag or session.
+        '''
+        if self.error is not None:
+            raise self.error
+        future = asyncio.get_running_loop().create_future()
+        self.requests[key] = future
+        self.send(payload)
+        await self.writer.drain()
+        return await future
+
+    async def maze_count(self):
+        '''
+        Returns the number of mazes of the server.
+        '''
+        return await self.request(0, message_type.pack(INFO))
+
+    async def open(self, maze_index, max_time=0):
+        '''
+        Opens a session in the maze maze_index and returns its
+        ClientSession.
+        '''
+        tag = self.next_tag
+        self.next_tag += 1
+        return await self.request(('open', tag), open_message.pack(
+            OPEN, tag, maze_index, max_time))
+
+    def fail(self, error):
+        '''
+        Ends the connection's requests and sessions with error: every
+        pending request raises it, and so does every session once it has
+        received the messages that came before.
+        '''
+        self.error = error
+        for future in self.requests.values():
+            if not future.done():
+                future.set_exception(error)
+        self.requests = {}
+        for session in self.sessions.values():
+            session.messages.put_nowait(error)
+
+    def resolve(self, key, result=None, error=None):
+        '''
+        Completes the pending request for key with result, or with error.
+        Replies to requests that were given up on are dropped.
+        '''
+        future = self.requests.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def deliver(self, session_id, message):
+        '''
+        Queues message for its session. Messages for sessions the client
+        has already closed are dropped.
+        '''
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.messages.put_nowait(message)
+
+    async def read_messages(self):
+        '''
+        Routes the messages of the server to their sessions and requests.
+        If the connection closes or the server sends something the client
+        can not handle, the error goes to every waiting request and session
+        (see fail()).
+        '''
+        try:
+            while True:
+                header = await self.reader.readexactly(frame_header.size)
+                length, = frame_header.unpack(header)
+                payload = await self.reader.readexactly(length)
+                kind = payload[0]
+                if kind == SENSE:
+                    _, session_id, step, run, left, front, right = sense_message.unpack(payload)  # NOQA
+                    self.deliver(session_id,
+                                 ('sense', step, run, [left, front, right]))
+                elif kind == DONE:
+                    fields = done_message.unpack(payload)
+                    result = {'completed': bool(fields[2]),
+                              'runtimes': list(fields[3:5]),
+                              'steps': fields[5], 'wall_hits': fields[6],
+                              'invalid_actions': fields[7],
+                              'score': fields[8]}
+                    self.deliver(fields[1], ('done', result))
+                elif kind == OPENED:
+                    _, tag, session_id, dim, trial_time = opened_message.unpack(payload)  # NOQA
+                    session = ClientSession(self, session_id, dim, trial_time)
+                    self.sessions[session_id] = session
+                    self.resolve(('open', tag), session)
+                elif kind == STATS_REPLY:
+                    _, session_id, actions, elapsed, mean, maximum = stats_message.unpack(payload)  # NOQA
+                    self.resolve(session_id,
+                                 {'actions': actions, 'elapsed': elapsed,
+                                  'latency_mean': mean,
+                                  'latency_max': maximum})
+                elif kind == INFO_REPLY:
+                    self.resolve(0, info_message.unpack(payload)[1])
+                elif kind == ERROR:
+                    _, what, key = error_message.unpack(payload[:error_message.size])  # NOQA
+                    error = Exception(payload[error_message.size:].decode('utf-8'))  # NOQA
+                    if what == ERROR_TAG:
+                        self.resolve(('open', key), error=error)
+                    elif what == ERROR_SESSION and key in self.requests:
+                        self.resolve(key, error=error)
+                    elif what == ERROR_SESSION:
+                        self.deliver(key, error)
+                    else:
+                        raise error
+                else:
+                    raise Exception('Unknown message type {}!'.format(kind))
+        except asyncio.IncompleteReadError:
+            self.fail(ConnectionError('Connection closed by the server!'))
+        except asyncio.CancelledError:
+            self.fail(ConnectionError('Connection closed!'))
+            raise
+        except Exception as e:
+            self.fail(e)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.reader_task.cancel()
+
+
+async def drive_robot(client, maze_index, make_robot, max_time=0):
+    '''
+    Controller that runs a robot through a session: opens a session in the
+    maze maze_index, creates the robot with make_robot(dim, max_time) and
+    passes it every sensor reading until the trial is over. Returns the
+    DONE result with the server's counters added as 'stats' and the
+    round-trip seconds of every action as seen by the controller as
+    'round_trips'. If the robot fails, the session is closed and the error
+    raised.
+    '''
+    session = await client.open(maze_index, max_time)
+    try:
+        robot = make_robot(session.dim, session.max_time)
+        round_trips = []
+        sent = None
+        while True:
+            message = await session.receive()
+            if sent is not None:
+                round_trips.append(time.perf_counter() - sent)
+            if message[0] == 'done':
+                break
+            rotation, movement = robot.next_move(message[3])
+            session.act(rotation, movement)
+            sent = time.perf_counter()
+        result = message[1]
+        result['stats'] = await session.stats()
+        result['round_trips'] = round_trips
+    finally:
+        session.close()
+    return result
+
+
+async def serve(args):
+    server = SimServer(list_mazes(args.mazes, args.pattern), args.max_time)
+    listener = await server.start(args.unix, args.host, args.port)
+    for sock in listener.sockets:
+        print("Serving {} mazes on {}.".format(len(server.mazes),
+                                               sock.getsockname()))
+    async with listener:
+        while True:
+            await asyncio.sleep(args.report)
+            print(server.report())
+
+
+async def bench(args):
+    from robot import Robot
+
+    clients = []
+    for _ in range(args.connections):
+        client = SimClient()
+        await client.connect(args.unix, args.host, args.port)
+        clients.append(client)
+    count = await clients[0].maze_count()
+
+    # keep args.sessions trials running, spread over the connections; the
+    # robot of every trial is seeded with its number
+    results = []
+    jobs = iter(range(args.episodes))
+
+    async def worker(client):
+        for job in jobs:
+            def make_robot(dim, trial_time):
+                return Robot(dim, explore=args.explore, planner=args.planner,
+                             max_time=trial_time, seed=job)
+            results.append(await drive_robot(client, job % count,
+                                             make_robot))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(clients[i % len(clients)])
+                           for i in range(args.sessions)])
+    seconds = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+
+    steps = sum(result['stats']['actions'] for result in results)
+    round_trips = np.concatenate([result['round_trips'] for result in results])
+    latencies = np.array([result['stats']['latency_mean'] for result in results])  # NOQA
+    scores = [result['score'] for result in results if result['completed']]
+    print("{} episodes, {} steps in {:.2f}s: {:.1f} episodes/s, {:.0f} "
+          "steps/s.".format(len(results), steps, seconds,
+                            len(results) / seconds, steps / seconds))
+    print("{} completed, mean score {:.2f}.".format(
+        len(scores), np.mean(scores) if scores else float('nan')))
+    print("Round trip per step (ms): p50 {:.3f}, p90 {:.3f}, p99 {:.3f}; "
+          "server-side mean latency per session (ms): {:.3f}.".format(
+              *(np.percentile(round_trips, [50, 90, 99]) * 1000),
+              latencies.mean() * 1000))
+
+
+if __name__ == '__main__':
+    '''
+    This script runs the simulation server, or drives robot.py controllers
+    against a running server to measure it under concurrent load, e.g.
+
+        python simserver.py serve mazes/ --unix /tmp/maze.sock
+        python simserver.py bench --unix /tmp/maze.sock --sessions 64
+    '''
+    parser = argparse.ArgumentParser(
+        description='Simulation server for many concurrent robot trials.')
+    parser.add_argument('--unix', default=None,
+                        help='Unix domain socket path (default: TCP)')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP host')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='run the server')
+    serve_parser.add_argument('mazes', help='directory of maze files, maze '
+                              'text file or maze archive')
+    serve_parser.add_argument('--pattern', default='*.txt',
+                              help='glob pattern of maze files in a directory')  # NOQA
+    serve_parser.add_argument('--max-time', type=int, default=None,
+                              help='time steps allowed per trial (default: '
+                              'scaled with the maze size)')
+    serve_parser.add_argument('--report', type=float, default=10.0,
+                              help='seconds between counter reports')
+
+    bench_parser = commands.add_parser(
+        'bench', help='drive robot.py controllers against a server')
+    bench_parser.add_argument('--episodes', type=int, default=200,
+                              help='number of trials to run')
+    bench_parser.add_argument('--sessions', type=int, default=32,
+                              help='number of trials running at once')
+    bench_parser.add_argument('--connections', type=int, default=1,
+                              help='number of connections to spread them over')  # NOQA
+    bench_parser.add_argument('--explore', default='flood',
+                              choices=['random', 'flood', 'frontier'],
+                              help='exploration strategy of the robots')
+    bench_parser.add_argument('--planner', default='policy',
+                              choices=['policy', 'steps', 'corridor'],
+                              help='how the robots plan their way in run 2')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args) if args.command == 'serve' else bench(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,204 @@
+from maze import heading_deltas
+from planning import goal_room
+
+# For each integer heading, the headings of the left, front and right
+# sensors, and the headings after a -90 and a +90 degree rotation.
+sensor_headings = [[(h + 3) % 4, h, (h + 1) % 4] for h in range(4)]
+rotate_ccw = [(h + 3) % 4 for h in range(4)]
+rotate_cw = [(h + 1) % 4 for h in range(4)]
+reverse_heading = [(h + 2) % 4 for h in range(4)]
+
+
+def time_budget(maze_dim, base_time=1000):
+    '''
+    Returns the number of time steps allowed for both runs in a maze of
+    dimension maze_dim: base_time up to the 16x16 competition mazes, and
+    base_time per 256 cells for larger mazes, so that the robot has the same
+    time per cell to explore.
+    '''
+    return max(base_time, base_time * maze_dim * maze_dim // 256)
+
+
+class SimulationResult(object):
+    '''
+    Outcome of one two-run trial of a robot in a maze.
+    - runtimes: number of time steps taken by each completed run.
+    - score: runtime of the 2nd run plus the weighted runtime of the 1st run,
+        or None if the robot did not complete both runs.
+    - steps: total number of time steps used over both runs.
+    - wall_hits: number of moves that were stopped by a wall.
+    - invalid_actions: number of rejected resets, invalid rotations and
+        movements longer than three squares.
+    '''
+    def __init__(self):
+        self.runtimes = []
+        self.score = None
+        self.steps = 0
+        self.wall_hits = 0
+        self.invalid_actions = 0
+
+    @property
+    def completed(self):
+        return len(self.runtimes) == 2
+
+    def __repr__(self):
+        return ('SimulationResult(runtimes={}, score={}, steps={}, '
+                'wall_hits={})'.format(self.runtimes, self.score, self.steps,
+                                       self.wall_hits))
+
+
+class Simulator(object):
+    def __init__(self, max_time=1000, train_score_mult=1/30., sink=None,
+                 profiler=None):
+        '''
+        The simulator runs the same two-run trial as tester.py, but in a
+        function that can be called repeatedly in one process. Headings are
+        held as integers (see maze.py) and all movement and sensing uses
+        the precomputed tables above instead of dictionary lookups.
+
+        If an event sink (see events.py) is given, the simulator emits an
+        event for every run start, rejected action, wall collision, reset and
+        goal, and a 'step' event with the sensors, action and resulting pose
+        of every time step (see tracefile.py); otherwise it is silent.
+
+        If a profiling.Profiler is given, it is given the time spent in
+        run() and sense(); the robot's phases nest inside run().
+        '''
+        self.max_time = max_time
+        self.train_score_mult = train_score_mult
+        self.sink = sink
+        if profiler is not None:
+            profiler.instrument(self, ['run', 'sense'])
+
+    def sense(self, distances, x, y, heading):
+        '''
+        Returns the three sensor distances (left, front, right) of a robot
+        in cell (x, y) with the given integer heading. distances is the
+        maze's distance table as nested lists, or as an array for large
+        mazes.
+        '''
+        cell = distances[x][y]
+        if not isinstance(cell, list):
+            cell = cell.tolist()
+        left, front, right = sensor_headings[heading]
+        return [cell[left], cell[front], cell[right]]
+
+    def run(self, maze, robot, goal_cells=None):
+        '''
+        Runs the robot through both runs of the maze and returns a
+        SimulationResult. The robot object is only driven through its
+        next_move() method. A run reaches the goal when the robot enters one
+        of the (x, y) cells of goal_cells, the central 2x2 room by default.
+        '''
+        sink = self.sink
+        result = SimulationResult()
+        runtimes = result.runtimes
+        distances = maze.distance_lists
+        if distances is None:
+            distances = maze.distances
+        if goal_cells is None:
+            goal_cells = goal_room(maze.dim)
+        goal_set = set((int(x), int(y)) for x, y in goal_cells)
+
+        total_time = 0
+        for run in range(2):
+            if sink is not None:
+                sink.emit('run_start', run=run)
+
+            # Set the robot in the start position, heading up.
+            x, y, heading = 0, 0, 0
+
+            run_active = True
+            hit_goal = False
+            while run_active:
+                # check for end of time
+                total_time += 1
+                if total_time > self.max_time:
+                    if sink is not None:
+                        sink.emit('timeout', time=total_time)
+                    break
+
+                # provide robot with sensor information, get actions
+                sensors = self.sense(distances, x, y, heading)
+                rotation, movement = robot.next_move(sensors)
+
+                # check for a reset
+                if (rotation, movement) == ('Reset', 'Reset'):
+                    if run == 0 and hit_goal:
+                        runtimes.append(total_time)
+                        if sink is not None:
+                            sink.emit('step', time=total_time, run=run,
+                                      sensors=sensors, rotation=0,
+                                      movement=0, location=(0, 0), heading=0,
+                                      reset=True, invalid=False,
+                                      wall_hit=False, goal=False)
+                            sink.emit('reset', time=total_time)
+                        break
+                    result.invalid_actions += 1
+                    if sink is not None:
+                        sink.emit('step', time=total_time, run=run,
+                                  sensors=sensors, rotation=0, movement=0,
+                                  location=(x, y), heading=heading,
+                                  reset=True, invalid=True, wall_hit=False,
+                                  goal=False)
+                        sink.emit('invalid_reset', time=total_time, run=run)
+                    continue
+                invalid_actions = result.invalid_actions
+                wall_hits = result.wall_hits
+                requested = movement
+
+                # perform rotation
+                if rotation == -90:
+                    heading = rotate_ccw[heading]
+                elif rotation == 90:
+                    heading = rotate_cw[heading]
+                elif rotation != 0:
+                    result.invalid_actions += 1
+                    if sink is not None:
+                        sink.emit('invalid_rotation', time=total_time,
+                                  rotation=rotation)
+
+                # perform movement
+                if abs(movement) > 3:
+                    result.invalid_actions += 1
+                    if sink is not None:
+                        sink.emit('movement_limited', time=total_time,
+                                  movement=movement)
+                movement = max(min(int(movement), 3), -3)
+                if movement > 0:
+                    move_heading = heading
+                else:
+                    move_heading = reverse_heading[heading]
+                dx, dy = heading_deltas[move_heading]
+                for _ in range(abs(movement)):
+                    if not distances[x][y][move_heading]:
+                        result.wall_hits += 1
+                        if sink is not None:
+                            sink.emit('wall_hit', time=total_time,
+                                      location=(x, y), heading=move_heading)
+                        break
+                    x += dx
+                    y += dy
+
+                # check for goal entered
+                if sink is not None:
+                    sink.emit('step', time=total_time, run=run,
+                              sensors=sensors, rotation=rotation,
+                              movement=requested, location=(x, y),
+                              heading=heading, reset=False,
+                              invalid=result.invalid_actions > invalid_actions,
+                              wall_hit=result.wall_hits > wall_hits,
+                              goal=(x, y) in goal_set)
+                if (x, y) in goal_set:
+                    hit_goal = True
+                    if run != 0:
+                        runtimes.append(total_time - sum(runtimes))
+                        if sink is not None:
+                            sink.emit('goal', time=total_time, run=run)
+                        break
+
+        result.steps = min(total_time, self.max_time)
+        if result.completed:
+            result.score = (runtimes[1] +
+                            self.train_score_mult * runtimes[0])
+        return result
@@ -0,0 +1,286 @@
+from maze import Maze
+from robot import Robot
+from simulator import Simulator, time_budget
+from plancache import PlanCache
+from mazefile import load_mazes, is_archive
+from tester import max_time, train_score_mult
+from tracefile import TraceWriter
+from knowledge import save_knowledge, load_knowledge
+import multiprocessing
+import argparse
+import glob
+import time
+import csv
+import os
+
+# columns of the results file, one row per (maze, seed) job
+result_fields = ['maze', 'seed', 'run_1', 'run_2', 'score', 'steps',
+                 'wall_hits', 'wall_time', 'error']
+
+# maze archives opened by this worker process, keyed by filename, and the
+# last maze it loaded; jobs come maze by maze, so one maze is enough
+archives = {}
+last_maze = (None, None)
+
+simulator = Simulator(max_time, train_score_mult)
+
+# plan cache shared by the robots of this worker process
+plan_cache = None
+
+# time steps allowed per trial, or None to scale them with the maze size
+time_limit = None
+
+# directory to record a trace of every trial in, or None
+trace_dir = None
+
+# directory of the knowledge snapshots of the mazes, or None
+knowledge_dir = None
+
+# seed of the robots that save knowledge snapshots
+knowledge_seed = None
+
+# suffix of the snapshots saved during a tournament, which are only moved
+# in place once it is over
+pending_suffix = '.new'
+
+
+def init_worker(cache_dir, max_time=None, traces=None, knowledge=None,
+                knowledge_saver=None):
+    '''
+    Initializer for the pool workers. Every worker keeps its own in-memory
+    plan cache; with cache_dir the caches also share entries on disk.
+    max_time fixes the time steps of every trial; by default they follow
+    the maze size (see simulator.time_budget). With traces, every trial is
+    recorded to a trace file in that directory (see tracefile.py). With
+    knowledge, robots warm-start from the knowledge snapshot of their maze
+    in that directory, and the robot with the seed knowledge_saver saves
+    a new one if there is none or it did not match (see knowledge.py).
+    '''
+    global plan_cache, time_limit, trace_dir, knowledge_dir, knowledge_seed
+    plan_cache = PlanCache(directory=cache_dir)
+    time_limit = max_time
+    trace_dir = traces
+    knowledge_dir = knowledge
+    knowledge_seed = knowledge_saver
+
+
+def run_job(job):
+    '''
+    Runs a single (maze, seed, robot_options) job, where maze is a
+    (filename, index) pair as returned by list_mazes() and robot_options are
+    extra keyword arguments for the Robot, and returns its row for the results
+    file. Failures are recorded in the 'error' column instead of being
+    raised, so one bad robot run does not stop the whole tournament.
+    '''
+    global last_maze
+    (filename, index), seed, robot_options = job
+    row = dict.fromkeys(result_fields, '')
+    row['maze'] = os.path.basename(filename)
+    if index is not None:
+        row['maze'] += '#{}'.format(index)
+    row['seed'] = seed
+
+    start = time.time()
+    try:
+        if last_maze[0] != (filename, index):
+            if index is None:
+                last_maze = ((filename, index), Maze(filename))
+            else:
+                if filename not in archives:
+                    archives[filename] = load_mazes(filename)
+                last_maze = ((filename, index), archives[filename].maze(index))
+        testmaze = last_maze[1]
+
+        simulator.max_time = time_limit
+        if time_limit is None:
+            simulator.max_time = time_budget(testmaze.dim, max_time)
+
+        # A robot warm-starts from what a robot with the same exploration
+        # and planner learned about the maze in an earlier tournament, if a
+        # snapshot was saved
+        knowledge = None
+        if knowledge_dir is not None:
+            knowledge_file = os.path.join(knowledge_dir, '{}_{}_{}.kb'.format(
+                row['maze'].replace('#', '_'),
+                robot_options.get('explore', 'random'),
+                robot_options.get('planner', 'policy')))
+            if os.path.exists(knowledge_file):
+                knowledge = knowledge_file
+
+        # A trace keeps a copy of the snapshot, and the robot starts from
+        # that copy, so that the trace replays even after the snapshot in
+        # knowledge_dir is replaced
+        if trace_dir is not None:
+            simulator.sink = TraceWriter(
+                os.path.join(trace_dir, '{}_{}.trace'.format(
+                    row['maze'].replace('#', '_'), seed)),
+                testmaze.dim, simulator.max_time, seed, knowledge)
+            if knowledge is not None:
+                knowledge = simulator.sink.knowledge_file
+        try:
+            if knowledge is not None:
+                knowledge = load_knowledge(knowledge)
+
+            # Every robot has its own random stream, split off by its seed,
+            # so a (maze, seed) job takes the same way in any worker and
+            # order
+            testrobot = Robot(testmaze.dim, cache=plan_cache,
+                              max_time=simulator.max_time, seed=seed,
+                              knowledge=knowledge, **robot_options)
+            result = simulator.run(testmaze, testrobot)
+        finally:
+            if simulator.sink is not None:
+                simulator.sink.close()
+                simulator.sink = None
+
+        # Save what the robot learned, unless it came from a snapshot
+        # that still holds; a robot that found the snapshot did not match
+        # the maze replaces it. Only one seed saves, and robots only read
+        # the snapshots of earlier tournaments, so every (maze, seed) job
+        # gets the same knowledge in any worker and order
+        if (knowledge_dir is not None and seed == knowledge_seed and
+                testrobot.run_2 and not testrobot.warmStart):
+            save_knowledge(knowledge_file + pending_suffix, testrobot,
+                           maze=row['maze'])
+
+        row['steps'] = result.steps
+        row['wall_hits'] = result.wall_hits
+        if len(result.runtimes) > 0:
+            row['run_1'] = result.runtimes[0]
+        if result.completed:
+            row['run_2'] = result.runtimes[1]
+            row['score'] = result.score
+        else:
+            row['error'] = 'Allotted time exceeded.'
+    except Exception as e:
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+    row['wall_time'] = time.time() - start
+
+    return row
+
+
+def parse_seeds(text):
+    '''
+    Parses a seed range given as 'start:stop' (stop excluded) or as a
+    single number of seeds, counted from 0.
+    '''
+    if ':' in text:
+        start, stop = text.split(':')
+        return range(int(start), int(stop))
+    return range(int(text))
+
+
+def list_mazes(path, pattern='*.txt'):
+    '''
+    Lists the mazes of path as (filename, index) pairs. path may be a maze
+    text file, a maze archive (see mazefile.py), whose mazes get their index
+    in the archive, or a directory, whose files matching pattern are listed
+    in order. The index of a text file is None.
+    '''
+    if os.path.isdir(path):
+        mazes = []
+        for filename in sorted(glob.glob(os.path.join(path, pattern))):
+            mazes += list_mazes(filename)
+        return mazes
+    if is_archive(path):
+        return [(path, index) for index in range(len(load_mazes(path)))]
+    return [(path, None)]
+
+
+def run_tournament(mazes, seeds, output, processes=None, chunksize=16,
+                   robot_options={}, cache_dir=None, max_time=None,
+                   trace_dir=None, knowledge_dir=None):
+    '''
+    Runs every maze in mazes, a list of (filename, index) pairs from
+    list_mazes(), once for every seed in seeds, spread over a pool of worker
+    processes, and writes one row per job to the csv file output.
+    robot_options are passed to every Robot as keyword arguments, and plans
+    are cached on disk in cache_dir if given. max_time overrides the time
+    steps of every trial, and every trial is recorded to a trace file in
+    trace_dir if given. With knowledge_dir, robots warm-start from a
+    knowledge snapshot of their maze in that directory. The robot of the
+    first seed saves a snapshot of a maze that has none, or whose snapshot
+    it found not to match, and the new snapshots are moved in place when
+    the tournament is over, for the next one to start from. Returns the
+    number of failed jobs.
+    '''
+    jobs = [(maze, seed, robot_options) for maze in mazes for seed in seeds]
+    failures = 0
+
+    for directory in (trace_dir, knowledge_dir):
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+    pool = multiprocessing.Pool(processes, init_worker,
+                                (cache_dir, max_time, trace_dir,
+                                 knowledge_dir, seeds[0] if seeds else None))
+    try:
+        with open(output, 'w') as f_out:
+            writer = csv.DictWriter(f_out, fieldnames=result_fields)
+            writer.writeheader()
+            for row in pool.imap_unordered(run_job, jobs, chunksize):
+                writer.writerow(row)
+                if row['error']:
+                    failures += 1
+        pool.close()
+
+        if knowledge_dir is not None:
+            pattern = '*.kb' + pending_suffix
+            for filename in glob.glob(os.path.join(knowledge_dir, pattern)):
+                os.replace(filename, filename[:-len(pending_suffix)])
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return failures
+
+
+if __name__ == '__main__':
+    '''
+    This script runs the robot on every maze of a directory for a range of
+    random seeds, e.g.
+
+        python tournament.py mazes/ --seeds 0:1000 --output results.csv
+    '''
+    parser = argparse.ArgumentParser(
+        description='Batch evaluation of robot.py over mazes and seeds.')
+    parser.add_argument('mazes', help='directory of maze files, maze text '
+                        'file or maze archive')
+    parser.add_argument('--pattern', default='*.txt',
+                        help='glob pattern of maze files in a directory')
+    parser.add_argument('--seeds', default='100',
+                        help="number of seeds, or a 'start:stop' range")
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('--output', default='results.csv',
+                        help='csv file to write per-run results to')
+    parser.add_argument('--explore', default='random',
+                        choices=['random', 'flood', 'frontier'],
+                        help='exploration strategy of the robot in run 1')
+    parser.add_argument('--planner', default='policy',
+                        choices=['policy', 'steps', 'corridor'],
+                        help='how the robot plans its way in run 2')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory to share cached plans in')
+    parser.add_argument('--max-time', type=int, default=None,
+                        help='time steps allowed per trial (default: 1000, '
+                        'scaled up with the area of mazes over 16x16)')
+    parser.add_argument('--trace-dir', default=None,
+                        help='directory to record a trace of every trial in')
+    parser.add_argument('--knowledge-dir', default=None,
+                        help='directory of maze knowledge snapshots to '
+                        'warm-start robots from and save to')
+    args = parser.parse_args()
+
+    mazes = list_mazes(args.mazes, args.pattern)
+    seeds = parse_seeds(args.seeds)
+
+    start = time.time()
+    failures = run_tournament(mazes, seeds, args.output, args.processes,
+                              robot_options={'explore': args.explore,
+                                             'planner': args.planner},
+                              cache_dir=args.cache_dir,
+                              max_time=args.max_time,
+                              trace_dir=args.trace_dir,
+                              knowledge_dir=args.knowledge_dir)
+    print("{} jobs finished in {:.1f}s, {} failed.".format(
+        len(mazes) * len(seeds), time.time() - start, failures))
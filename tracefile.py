@@ -0,0 +1,313 @@
+from robot import Robot
+from knowledge import load_knowledge
+import numpy as np
+import argparse
+import shutil
+import struct
+import glob
+import os
+
+# A trace file records one two-run trial, one fixed-width record per time
+# step, so that any step can be found by its index:
+# - a 32 byte header: the magic bytes below, the format version (uint16),
+#   the maze dimension (uint16), the time limit of the trial (uint32), the
+#   number of records (uint32), the random seed of the robot (int64, -1 if
+#   unknown), the header flags below (uint8) and 7 unused bytes, all little
+#   endian.
+# - a record per time step, see record_dtype.
+#
+# A robot warm-started from a knowledge snapshot (see knowledge.py) can only
+# be replayed with that snapshot, which is stored next to the trace as
+# knowledge_filename(trace filename).
+#
+# The pose of the robot is delta-encoded: a record holds the change of
+# position and heading of its step, and the pose after any step is the sum
+# of the changes up to it. The reset between the runs records the jump
+# back to the start, so the sum needs no special cases.
+trace_magic = b'MZTR'
+trace_version = 1
+header_format = '<4sHHIIqB7x'
+header_size = struct.calcsize(header_format)
+
+record_dtype = np.dtype([
+    ('sensors', '<u2', 3),  # left, front and right sensor distances
+    ('rotation', '<i2'),    # rotation returned by the robot, in degrees
+    ('movement', 'i1'),     # movement returned by the robot
+    ('turn', 'i1'),         # change of heading, in quarter turns clockwise
+    ('dx', '<i2'),          # change of position
+    ('dy', '<i2'),
+    ('flags', 'u1'),        # the flag bits below
+])
+
+FLAG_RUN_2 = 1      # the step belongs to the 2nd run
+FLAG_RESET = 2      # the robot asked for a reset
+FLAG_INVALID = 4    # the action was invalid or limited
+FLAG_WALL_HIT = 8   # the movement was stopped by a wall
+FLAG_GOAL = 16      # the step ended in the goal
+
+HEADER_KNOWLEDGE = 1    # the robot warm-started from the stored snapshot
+
+# records buffered by TraceWriter before they are written out
+write_buffer = 4096
+
+
+def knowledge_filename(filename):
+    '''
+    Returns the filename of the knowledge snapshot stored with a trace.
+    '''
+    return filename + '.kb'
+
+
+class TraceWriter(object):
+    def __init__(self, filename, maze_dim, max_time=1000, seed=-1,
+                 knowledge=None):
+        '''
+        Event sink (see events.py) that records the 'step' events of a
+        Simulator to a trace file; the other events are ignored. seed is
+        the seed the Robot was created with, which replay() needs to repeat
+        the robot's random choices.
+
+        knowledge is the filename of the knowledge snapshot the Robot is
+        warm-started from, if any. It is copied to knowledge_file, and the
+        robot should be given the snapshot loaded from that copy, so that
+        the trace keeps the snapshot the robot really used.
+        Call close() when the trial is done.
+        '''
+        self.filename = filename
+        self.maze_dim = maze_dim
+        self.max_time = max_time
+        self.seed = seed
+        self.flags = 0
+        self.knowledge_file = None
+        if knowledge is not None:
+            self.knowledge_file = knowledge_filename(filename)
+            shutil.copyfile(knowledge, self.knowledge_file)
+            self.flags |= HEADER_KNOWLEDGE
+        self.count = 0
+        self.records = []
+        self.pose = (0, 0, 0)
+        self.f_out = open(filename, 'wb')
+        self.write_header()
+
+    def write_header(self):
+        self.f_out.seek(0)
+        self.f_out.write(struct.pack(header_format, trace_magic,
+                                     trace_version, self.maze_dim,
+                                     self.max_time, self.count, self.seed,
+                                     self.flags))
+
+    def emit(self, event, **fields):
+        if event == 'run_start':
+            self.pose = (0, 0, 0)
+        elif event == 'step':
+            self.record(**fields)
+
+    def record(self, time, run, sensors, rotation, movement, location,
+               heading, reset, invalid, wall_hit, goal):
+        x, y, h = self.pose
+        flags = ((FLAG_RUN_2 if run else 0) | (FLAG_RESET if reset else 0) |
+                 (FLAG_INVALID if invalid else 0) |
+                 (FLAG_WALL_HIT if wall_hit else 0) |
+                 (FLAG_GOAL if goal else 0))
+        # rotations the robot can not return, such as 45, are stored as 0
+        if not isinstance(rotation, int) or not -2**15 <= rotation < 2**15:
+            rotation = 0
+        movement = max(min(int(movement), 127), -128)
+        self.records.append((sensors, rotation, movement, (heading - h) % 4,
+                             location[0] - x, location[1] - y, flags))
+        self.pose = (location[0], location[1], heading)
+        if len(self.records) >= write_buffer:
+            self.flush()
+
+    def flush(self):
+        if self.records:
+            np.array(self.records, dtype=record_dtype).tofile(self.f_out)
+            self.count += len(self.records)
+            self.records = []
+
+    def close(self):
+        '''
+        Writes the buffered records and the final record count.
+        '''
+        self.flush()
+        self.write_header()
+        self.f_out.close()
+
+
+class TraceReader(object):
+    def __init__(self, filename):
+        '''
+        Read access to a trace file written by TraceWriter. The records are
+        memory-mapped, so opening a trace reads only its header, and every
+        column or range of steps read later only touches those bytes.
+        - maze_dim, max_time, seed: as given to the TraceWriter.
+        - knowledge_file: the knowledge snapshot stored with the trace, or
+            None if the robot did not warm-start.
+        - records: structured array of record_dtype, one record per step.
+        '''
+        with open(filename, 'rb') as f_in:
+            header = f_in.read(header_size)
+        if len(header) < header_size:
+            raise Exception('Not a trace file: {}'.format(filename))
+        (magic, version, self.maze_dim, self.max_time, count,
+         self.seed, flags) = struct.unpack(header_format, header)
+        if magic != trace_magic:
+            raise Exception('Not a trace file: {}'.format(filename))
+        if version != trace_version:
+            raise Exception('Unsupported trace version {}'.format(version))
+        self.knowledge_file = None
+        if flags & HEADER_KNOWLEDGE:
+            self.knowledge_file = knowledge_filename(filename)
+
+        if count > 0:
+            self.records = np.memmap(filename, dtype=record_dtype, mode='r',
+                                     offset=header_size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=record_dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def poses(self, start=0, stop=None):
+        '''
+        Returns the (x, y, heading) of the robot after each of the steps
+        start to stop as three arrays, decoded from the deltas of all steps
+        up to stop.
+        '''
+        records = self.records[:stop]
+        x = np.cumsum(records['dx'], dtype=np.int64)[start:]
+        y = np.cumsum(records['dy'], dtype=np.int64)[start:]
+        heading = np.cumsum(records['turn'], dtype=np.int64)[start:] % 4
+        return x, y, heading
+
+    def seek(self, step):
+        '''
+        Returns the state of the trial before the step with index step
+        (time step + 1) as a dictionary: the robot's location and heading,
+        the run it is in, and the sensors and action of that step.
+        '''
+        if not 0 <= step < len(self):
+            raise IndexError('Step {} is not in the trace!'.format(step))
+        if step:
+            x, y, heading = (int(value[-1]) for value in self.poses(step - 1, step))  # NOQA
+        else:
+            x, y, heading = 0, 0, 0
+        record = self.records[step]
+        return {'time': step + 1,
+                'run': int(record['flags'] & FLAG_RUN_2 > 0),
+                'location': (x, y), 'heading': heading,
+                'sensors': record['sensors'].tolist(),
+                'action': self.action(record)}
+
+    def action(self, record):
+        '''
+        Returns the (rotation, movement) of a record as the robot returned it.
+        '''
+        if record['flags'] & FLAG_RESET:
+            return ('Reset', 'Reset')
+        return (int(record['rotation']), int(record['movement']))
+
+    def robot(self, **options):
+        '''
+        Returns a new Robot for the trial, with the trace's seed, time limit
+        and knowledge snapshot; options are further Robot keyword arguments,
+        such as the explore and planner the trial was run with.
+        '''
+        if self.seed >= 0:
+            options.setdefault('seed', self.seed)
+        if self.knowledge_file is not None and 'knowledge' not in options:
+            if not os.path.exists(self.knowledge_file):
+                raise Exception('Knowledge snapshot of the trace is missing: {}'.format(self.knowledge_file))  # NOQA
+            options['knowledge'] = load_knowledge(self.knowledge_file)
+        return Robot(self.maze_dim, max_time=self.max_time, **options)
+
+    def replay(self, robot, stop=None, check=True):
+        '''
+        Feeds the recorded sensors of the steps up to stop to robot, a new
+        Robot for the same maze created with the same seed and options, e.g.
+        by robot(), and returns it in the state it had then. With check,
+        every action it takes is compared with the recorded one.
+        '''
+        records = self.records[:stop]
+        sensors = records['sensors'].tolist()
+        for step in range(len(records)):
+            action = robot.next_move(sensors[step])
+            if check and tuple(action) != self.action(records[step]):
+                raise Exception('Replay diverged from the trace at step {}!'.format(step))  # NOQA
+        return robot
+
+    def summary(self):
+        '''
+        Returns the statistics of the trial as a dictionary: the number of
+        steps, wall hits, invalid actions and resets, and the runtimes of
+        the runs, -1 for runs not completed.
+        '''
+        flags = np.asarray(self.records['flags'])
+        run_2 = (flags & FLAG_RUN_2) > 0
+        run_1_steps = int(len(flags) - run_2.sum())
+        reached = ((flags & FLAG_GOAL) > 0) & run_2
+        return {'steps': len(flags),
+                'wall_hits': int(((flags & FLAG_WALL_HIT) > 0).sum()),
+                'invalid_actions': int(((flags & FLAG_INVALID) > 0).sum()),
+                'resets': int(((flags & FLAG_RESET) > 0).sum()),
+                'run_1': run_1_steps if run_2.any() else -1,
+                'run_2': int(run_2.sum()) if reached.any() else -1}
+
+
+def aggregate(filenames):
+    '''
+    Reads the summary() of every trace of filenames, opening one trace at a
+    time, and returns a dictionary of arrays with one entry per trace, plus
+    the list of filenames.
+    '''
+    columns = {}
+    for filename in filenames:
+        for name, value in TraceReader(filename).summary().items():
+            columns.setdefault(name, []).append(value)
+    columns = dict((name, np.array(values)) for name, values in columns.items())  # NOQA
+    columns['filenames'] = list(filenames)
+    return columns
+
+
+if __name__ == '__main__':
+    '''
+    This script inspects trace files written by tester.py or tournament.py,
+    e.g.
+
+        python tracefile.py show run.trace --step 120
+        python tracefile.py summary traces/
+    '''
+    parser = argparse.ArgumentParser(
+        description='Inspection of recorded trials.')
+    parser.add_argument('command', choices=['show', 'summary'])
+    parser.add_argument('traces', help='trace file, or directory of traces')
+    parser.add_argument('--step', type=int, default=0,
+                        help='first step to show')
+    parser.add_argument('--count', type=int, default=20,
+                        help='number of steps to show')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.traces):
+        filenames = sorted(glob.glob(os.path.join(args.traces, '*.trace')))
+    else:
+        filenames = [args.traces]
+
+    if args.command == 'show':
+        trace = TraceReader(filenames[0])
+        print("{}x{} maze, {} steps, seed {}".format(
+            trace.maze_dim, trace.maze_dim, len(trace), trace.seed))
+        for step in range(args.step, min(args.step + args.count, len(trace))):
+            state = trace.seek(step)
+            print("time {time:5d} run {run} at {location} heading "
+                  "{heading}: sensors {sensors} -> {action}".format(**state))
+    else:
+        stats = aggregate(filenames)
+        completed = stats['run_2'] >= 0
+        print("{} traces, {} completed".format(len(filenames),
+                                                completed.sum()))
+        for name in ('steps', 'wall_hits', 'invalid_actions', 'run_1',
+                     'run_2'):
+            values = stats[name][stats[name] >= 0]
+            if len(values):
+                print("{:<16} mean {:8.1f}  min {:6d}  max {:6d}".format(
+                    name, values.mean(), values.min(), values.max()))